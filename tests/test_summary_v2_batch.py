@@ -0,0 +1,51 @@
+import pytest
+from webcall.app.infrastructure.config import get_settings
+from webcall.app.infrastructure.services.summary_v2.orchestrator import SummaryOrchestrator
+
+
+class DummyBatchProvider:
+    def __init__(self):
+        self.batch_calls = 0
+        self.single_calls = 0
+
+    async def generate_summary(self, messages, system_prompt=None):  # type: ignore
+        self.single_calls += 1
+        return " | ".join(messages)
+
+    async def generate_batch_summary(self, shared_lines, targets):  # type: ignore
+        self.batch_calls += 1
+        out = {}
+        for t in targets:
+            out[t.tag] = " | ".join(shared_lines[i - 1] for i in t.line_ids)
+        return out
+
+
+@pytest.mark.asyncio
+async def test_room_summaries_single_batch_call(monkeypatch):
+    orch = SummaryOrchestrator()
+    settings = get_settings()
+    monkeypatch.setattr(settings, 'AI_SUMMARY_ENABLED', True, raising=False)
+    monkeypatch.setattr(settings, 'AI_SUMMARY_MIN_CHARS', 10, raising=False)
+    monkeypatch.setattr(settings, 'AI_SUMMARY_VOICE_SCOPE', 'self', raising=False)
+    orch._settings_cache = settings
+    room_id = "test-room-batch"
+    await orch.start_user_window(room_id, "u1", user_name="Alice")
+    orch.add_chat(room_id, "u1", "Alice", "Обсуждаем план релиза на следующую неделю")
+    await orch.start_user_window(room_id, "u2", user_name="Bob")
+    orch.add_chat(room_id, "u2", "Bob", "Нужно ещё проверить миграции базы данных")
+    orch.add_voice_transcript(room_id, "Голосом Боб рассказал про деплой и откат.", user_id="u2")
+
+    provider = DummyBatchProvider()
+    res = await orch.build_room_summaries(room_id=room_id, ai_provider=provider, db_session=None)
+
+    assert provider.batch_calls == 1
+    assert provider.single_calls == 0
+    assert set(res.keys()) == {"u1", "u2"}
+    # Первое окно открыто до сообщения Боба — но чат общий для всех активных окон
+    assert "релиза" in res["u1"].summary_text
+    assert "миграции" in res["u1"].summary_text
+    assert "релиза" not in res["u2"].summary_text
+    # Голос Боба (scope=self) попадает только в его окно
+    assert "деплой" in res["u2"].summary_text and res["u2"].used_voice
+    assert "деплой" not in res["u1"].summary_text and not res["u1"].used_voice
+    assert orch.get_counters()['batch_users_served'] == 2
@@ -0,0 +1,50 @@
+from webcall.app.infrastructure.services.summary_v2.dedupe import dedupe_segments, NearDuplicateIndex, DUPLICATE, SUPERSEDES, NEW
+from webcall.app.infrastructure.services.summary_v2.orchestrator import SummaryOrchestrator
+from webcall.app.infrastructure.services.summary_v2.user_agent import UserAgentSession
+
+A = "Сегодня обсуждаем перенос релиза на следующую неделю из-за миграций базы данных"
+A_NEAR = "сегодня обсуждаем перенос релиза на следующую неделю, из-за миграций базы данных."
+A_EXT = A + " и заодно договоримся кто отвечает за откат"
+B = "Вторая тема встречи касается найма двух backend разработчиков в команду платформы"
+
+
+def test_index_verdicts():
+    idx = NearDuplicateIndex(0.8)
+    v, _pos, sh = idx.check(A)
+    assert v == NEW
+    idx.add(sh)
+    assert idx.check(A_NEAR)[0] == DUPLICATE
+    assert idx.check(A_EXT)[:2] == (SUPERSEDES, 0)
+    assert idx.check(B)[0] == NEW
+
+
+def test_session_drops_near_duplicates_and_counts_bytes():
+    sess = UserAgentSession(room_id="r", user_id="u")
+    sess.add_voice_transcript(A)
+    sess.add_voice_transcript(B)
+    sess.add_voice_transcript(A_NEAR)
+    assert [v.text for v in sess._voice_segments] == [A, B]
+    assert sess.dedupe_dropped == 1
+    assert sess.dedupe_dropped_bytes == len(A_NEAR.encode('utf-8'))
+    # Расширение ранее принятого (не последнего) сегмента заменяет его на месте
+    sess.add_voice_transcript(A_EXT)
+    assert [v.text for v in sess._voice_segments] == [A_EXT, B]
+
+
+def test_cross_speaker_shared_index():
+    idx = NearDuplicateIndex(0.8)
+    first, dropped1 = dedupe_segments([A, B], index=idx)
+    second, dropped2 = dedupe_segments([A_NEAR, "Совсем другая реплика второго участника про бюджет проекта на квартал"], index=idx)
+    assert first == [A, B] and dropped1 == 0
+    assert len(second) == 1 and dropped2 == len(A_NEAR.encode('utf-8'))
+
+
+def test_orchestrator_broadcast_dedupe_counters():
+    orch = SummaryOrchestrator()
+    orch.add_voice_transcript("room-dd", A)
+    orch.add_voice_transcript("room-dd", A_NEAR)
+    orch.add_voice_transcript("room-dd", B)
+    assert [v.text for v in orch._room_broadcast_voice["room-dd"]] == [A, B]
+    counters = orch.get_counters()
+    assert counters['voice_dedupe_dropped'] == 1
+    assert counters['voice_broadcast_dedupe_dropped_bytes'] == len(A_NEAR.encode('utf-8'))
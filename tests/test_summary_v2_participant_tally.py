@@ -0,0 +1,55 @@
+import asyncio
+
+from webcall.app.infrastructure.config import get_settings
+from webcall.app.infrastructure.services.summary_v2.models import ChatMessage
+from webcall.app.infrastructure.services.summary_v2.strategies import ParticipantTally, _build_participant_breakdown
+from webcall.app.infrastructure.services.summary_v2.user_agent import UserAgentSession
+
+
+def _msgs(room: str, n: int):
+    out = []
+    for i in range(n):
+        who = ("u1", "Alice") if i % 3 else ("u2", "Bob")
+        out.append(ChatMessage(room_id=room, author_id=who[0], author_name=who[1], content=f"msg {i}", ts=1000 + i))
+    out.append(ChatMessage(room_id=room, author_id="u3", author_name="Carol", content="(asr failed http 400)", ts=5000))
+    return out
+
+
+def _as_tuples(parts):
+    return [(p.participant_id, p.participant_name, p.message_count, p.sample_messages) for p in parts]
+
+
+def test_tally_matches_full_pass():
+    msgs = _msgs("r1", 23)
+    tally = ParticipantTally()
+    for m in msgs:
+        tally.add(m)
+    snap = tally.snapshot()
+    assert _as_tuples(snap) == _as_tuples(_build_participant_breakdown(msgs))
+    assert [p.participant_name for p in snap] == ["Alice", "Bob"]  # технические сообщения не считаются
+    assert len(snap[0].sample_messages) == 5 and snap[0].sample_messages[-1] == "msg 22"
+
+
+def test_extended_does_not_mutate_base():
+    msgs = _msgs("r1", 4)
+    tally = ParticipantTally()
+    for m in msgs:
+        tally.add(m)
+    before = _as_tuples(tally.snapshot())
+    voice = [ChatMessage(room_id="r1", author_id=None, author_name="voice", content="hello there", ts=9000)]
+    ext = tally.extended(voice)
+    assert _as_tuples(tally.snapshot()) == before
+    assert _as_tuples(ext.snapshot()) == _as_tuples(_build_participant_breakdown(msgs + voice))
+
+
+def test_session_keeps_tally_on_add_chat(monkeypatch):
+    monkeypatch.setattr(get_settings(), 'AI_SUMMARY_PARTICIPANT_BREAKDOWN', True, raising=False)
+    sess = UserAgentSession(room_id="r1", user_id="u1", start_ts=0)
+    msgs = _msgs("r1", 10)
+    for m in msgs:
+        sess.add_chat(m)
+    sess.add_chat(ChatMessage(room_id="other", author_id="u9", author_name="X", content="skip", ts=2000))
+    assert _as_tuples(sess._tally.snapshot()) == _as_tuples(_build_participant_breakdown(msgs))
+    res = asyncio.run(sess.build_summary(ai_provider=None, system_prompt=None))
+    assert res.participants is not None
+    assert {p.participant_name for p in res.participants} == {"Alice", "Bob"}
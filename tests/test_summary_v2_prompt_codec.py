@@ -0,0 +1,33 @@
+from webcall.app.infrastructure.services.summary_v2.models import ChatMessage
+from webcall.app.infrastructure.services.summary_v2.prompt_codec import encode_compact
+
+
+def _msg(name, text, ts):
+    return ChatMessage(room_id="r", author_id=None, author_name=name, content=text, ts=ts)
+
+
+def test_compact_aliases_buckets_and_merge():
+    base = 1758649999999
+    msgs = [
+        _msg("Очень Длинное Имя Участника", "Привет, начинаем обсуждение релиза", base),
+        _msg("Очень Длинное Имя Участника", "Сначала миграции", base + 10_000),
+        _msg("Второй Участник Встречи", "Согласен, миграции первыми", base + 20_000),
+        _msg("Очень Длинное Имя Участника", "Потом деплой", base + 5 * 60_000),
+    ]
+    cp = encode_compact(msgs)
+    assert cp.legend == "Участники: A=Очень Длинное Имя Участника; B=Второй Участник Встречи"
+    assert cp.lines == [
+        "[+0m] A: Привет, начинаем обсуждение релиза / Сначала миграции",
+        "B: Согласен, миграции первыми",
+        "[+5m] A: Потом деплой",
+    ]
+    assert str(base) not in "\n".join(cp.as_messages())
+    assert cp.saved_tokens > 0 and cp.compact_tokens < cp.plain_tokens
+
+
+def test_compact_without_merge_keeps_line_positions():
+    msgs = [_msg("Анна", f"реплика {i}", 1000 + i) for i in range(3)]
+    cp = encode_compact(msgs, merge=False)
+    assert len(cp.lines) == len(msgs)
+    assert cp.lines[0] == "[+0m] A: реплика 0"
+    assert cp.lines[1] == "A: реплика 1"
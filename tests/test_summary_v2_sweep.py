@@ -0,0 +1,41 @@
+import pytest
+from webcall.app.infrastructure.services.summary_v2.orchestrator import SummaryOrchestrator
+
+
+@pytest.mark.asyncio
+async def test_sweep_evicts_ended_sessions_and_stale_broadcast():
+    orch = SummaryOrchestrator()
+    await orch.start_user_window("room-a", "u1")
+    await orch.start_user_window("room-b", "u2")
+    orch.add_chat("room-a", "u1", "Alice", "сообщение в комнате A")
+    orch.add_voice_transcript("room-b", "[meta captureTs=1] общий голос комнаты B про планы")
+    orch.end_user_window("room-a", "u1")
+    sess_a = orch._sessions[("room-a", "u1")]
+
+    # До TTL ничего не удаляется
+    now = sess_a.end_ts + 1000
+    assert orch.sweep(now_ms=now) == {'sessions': 0, 'broadcast_rooms': 0, 'room_logs': 0}
+
+    ttl_ms = 1800 * 1000
+    later = sess_a.end_ts + ttl_ms + 1
+    orch._room_broadcast_touched["room-b"] = later - ttl_ms - 1
+    res = orch.sweep(now_ms=later)
+    assert res['sessions'] == 1 and res['broadcast_rooms'] == 1 and res['room_logs'] == 1
+    assert ("room-a", "u1") not in orch._sessions
+    assert "room-a" not in orch._room_sessions
+    assert "room-b" not in orch._room_broadcast_voice
+    # Активная сессия другой комнаты жива
+    assert ("room-b", "u2") in orch._sessions
+    stats = orch.memory_stats()
+    assert stats['sessions_active'] == 1 and stats['sessions_ended'] == 0
+    assert orch.get_counters()['sweep_sessions_evicted'] == 1
+
+
+@pytest.mark.asyncio
+async def test_sweeper_task_lifecycle():
+    orch = SummaryOrchestrator()
+    orch.start_sweeper()
+    task = orch._sweeper_task
+    assert task is not None and not task.done()
+    await orch.shutdown()
+    assert task.cancelled() or task.done()
@@ -0,0 +1,32 @@
+import pytest
+from webcall.app.infrastructure.services.summary_v2.models import VoiceSegment
+from webcall.app.infrastructure.services.summary_v2.user_agent import UserAgentSession
+from webcall.app.infrastructure.services.voice_transcript import VoiceTranscriptCollector
+
+
+def test_parse_meta_and_sentences_once():
+    seg = VoiceSegment.parse("[meta captureTs=1758649999999 session=abc clientTs=1] Привет всем.  Начинаем   созвон! Вопросы?")
+    assert seg.capture_ts == 1758649999999
+    assert seg.session == "abc"
+    assert seg.has_meta and not seg.technical
+    assert seg.text.startswith("Привет")
+    assert seg.sentences == ("Привет всем.", "Начинаем созвон!", "Вопросы?")
+
+
+def test_placeholder_and_plain():
+    seg = VoiceSegment.parse("[meta captureTs=5] (asr failed http 400)")
+    assert seg.technical and seg.is_placeholder and seg.sentences == ()
+    plain = VoiceSegment.parse("без меты")
+    assert plain.capture_ts is None and not plain.has_meta
+
+
+@pytest.mark.asyncio
+async def test_store_transcript_keeps_parsed_segment():
+    coll = VoiceTranscriptCollector()
+    vt = await coll.store_transcript("room:u1", "[meta captureTs=42] Первая фраза. Вторая фраза.")
+    assert vt.text.startswith("[meta ")
+    assert vt.segment is not None and vt.segment.capture_ts == 42
+    sess = UserAgentSession(room_id="room", user_id="u1")
+    sess.add_voice_transcript(vt.segment)
+    assert sess._voice_segments[0] is vt.segment
+    assert [m.content for m in sess._voice_messages()] == ["Первая фраза.", "Вторая фраза."]
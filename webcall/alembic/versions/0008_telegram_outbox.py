@@ -0,0 +1,47 @@
+"""telegram outbox table
+
+Revision ID: 0008_telegram_outbox
+Revises: 0007_user_ai_system_prompt
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008_telegram_outbox'
+down_revision = '0007_user_ai_system_prompt'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'telegram_outbox',
+        sa.Column('id', sa.dialects.postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('user_id', sa.dialects.postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('chat_id', sa.String(length=64), nullable=True),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('reason', sa.String(length=200), nullable=False),
+        sa.Column('dedupe_key', sa.String(length=300), nullable=False),
+        sa.Column('dedupe_bucket', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('locked_until', sa.DateTime(timezone=False), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=False), nullable=False),
+    )
+    op.create_index('ix_telegram_outbox_user_id', 'telegram_outbox', ['user_id'])
+    # Корзина времени (created_at // dedupe TTL): одновременные enqueue одного и того же текста
+    # упираются в уникальный индекс; он же обслуживает поиск по dedupe_key
+    op.create_index('uq_telegram_outbox_dedupe', 'telegram_outbox', ['dedupe_key', 'dedupe_bucket'], unique=True)
+    # Выборка воркерами: status='pending' AND next_attempt_at <= now ORDER BY next_attempt_at
+    op.create_index('ix_telegram_outbox_status_next', 'telegram_outbox', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    op.drop_index('ix_telegram_outbox_status_next', table_name='telegram_outbox')
+    op.drop_index('uq_telegram_outbox_dedupe', table_name='telegram_outbox')
+    op.drop_index('ix_telegram_outbox_user_id', table_name='telegram_outbox')
+    op.drop_table('telegram_outbox')
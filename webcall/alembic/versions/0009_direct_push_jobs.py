@@ -0,0 +1,33 @@
+"""direct push jobs table
+
+Revision ID: 0009_direct_push_jobs
+Revises: 0008_telegram_outbox
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009_direct_push_jobs'
+down_revision = '0008_telegram_outbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'direct_push_jobs',
+        sa.Column('recipient_id', sa.dialects.postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('sender_id', sa.dialects.postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('message_sent_at', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('due_at', sa.DateTime(timezone=False), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=False), nullable=False),
+    )
+    # Выборка воркером: due_at <= now ORDER BY due_at
+    op.create_index('ix_direct_push_jobs_due_at', 'direct_push_jobs', ['due_at'])
+
+
+def downgrade():
+    op.drop_index('ix_direct_push_jobs_due_at', table_name='direct_push_jobs')
+    op.drop_table('direct_push_jobs')
@@ -0,0 +1,34 @@
+"""direct pair stats table
+
+Revision ID: 0010_direct_pair_stats
+Revises: 0009_direct_push_jobs
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0010_direct_pair_stats'
+down_revision = '0009_direct_push_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'direct_pair_stats',
+        sa.Column('user_a_id', sa.dialects.postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('user_b_id', sa.dialects.postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_message_at', sa.DateTime(timezone=False), nullable=True),
+    )
+    # Заполнение по существующей истории
+    op.execute(
+        "INSERT INTO direct_pair_stats (user_a_id, user_b_id, message_count, last_message_at) "
+        "SELECT user_a_id, user_b_id, count(*), max(sent_at) FROM direct_messages GROUP BY user_a_id, user_b_id"
+    )
+
+
+def downgrade():
+    op.drop_table('direct_pair_stats')
@@ -0,0 +1,38 @@
+"""direct unread counters table
+
+Revision ID: 0011_direct_unread_counters
+Revises: 0010_direct_pair_stats
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0011_direct_unread_counters'
+down_revision = '0010_direct_pair_stats'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'direct_unread_counters',
+        sa.Column('owner_id', sa.dialects.postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('other_id', sa.dialects.postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('unread', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # Заполнение: сообщения собеседника позже last_read_at владельца (или все, если не читал)
+    op.execute(
+        "INSERT INTO direct_unread_counters (owner_id, other_id, unread) "
+        "SELECT r.owner_id, r.sender_id, count(*) FROM ("
+        "  SELECT CASE WHEN dm.sender_id = dm.user_a_id THEN dm.user_b_id ELSE dm.user_a_id END AS owner_id,"
+        "         dm.sender_id, dm.sent_at FROM direct_messages dm"
+        ") r LEFT JOIN direct_read_states rs ON rs.owner_id = r.owner_id AND rs.other_id = r.sender_id "
+        "WHERE rs.last_read_at IS NULL OR r.sent_at > rs.last_read_at "
+        "GROUP BY r.owner_id, r.sender_id"
+    )
+
+
+def downgrade():
+    op.drop_table('direct_unread_counters')
@@ -0,0 +1,21 @@
+"""direct messages keyset index
+
+Revision ID: 0012_direct_msgs_keyset
+Revises: 0011_direct_unread_counters
+Create Date: 2026-10-19 00:00:00.000000
+"""
+from alembic import op
+
+revision = '0012_direct_msgs_keyset'
+down_revision = '0011_direct_unread_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # История пары: WHERE user_a_id=? AND user_b_id=? AND (sent_at, id) < / > cursor ORDER BY sent_at, id
+    op.create_index('ix_direct_messages_pair_sent_id', 'direct_messages', ['user_a_id', 'user_b_id', 'sent_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_direct_messages_pair_sent_id', table_name='direct_messages')
@@ -11,6 +11,7 @@ except Exception:  # pragma: no cover - prometheus optional until dependency ins
     def generate_latest():  # type: ignore
         return b""
     CONTENT_TYPE_LATEST = "text/plain"
+import contextlib
 from contextlib import asynccontextmanager
 
 from fastapi import Depends, FastAPI
@@ -81,13 +82,58 @@ async def lifespan(app: FastAPI):
         dispatcher.start()
     except Exception as e:
         logging.getLogger("app.startup").warning("Failed to start telegram dispatcher: %s", e)
+    # Фоновая TTL очистка памяти summary v2 (завершённые сессии, broadcast голос)
+    try:
+        from ..infrastructure.services.summary_v2.orchestrator import get_summary_orchestrator
+        get_summary_orchestrator().start_sweeper()
+    except Exception as e:
+        logging.getLogger("app.startup").warning("Failed to start summary sweeper: %s", e)
+    # Очистка просроченных голосовых чанков / транскриптов по куче сроков
+    try:
+        from ..infrastructure.services.voice_transcript import get_voice_collector
+        get_voice_collector().start_purger()
+    except Exception as e:
+        logging.getLogger("app.startup").warning("Failed to start voice purger: %s", e)
+    # Отложенные push о непрочитанных личных сообщениях (таблица direct_push_jobs)
+    try:
+        from ..infrastructure.services.direct_push_jobs import get_direct_push_scheduler
+        get_direct_push_scheduler().start()
+    except Exception as e:
+        logging.getLogger("app.startup").warning("Failed to start direct push scheduler: %s", e)
+    # Pub/Sub инвалидация кэша дружбы между воркерами (backend=redis)
+    try:
+        from ..infrastructure.services.friendship_cache import get_friendship_cache
+        get_friendship_cache().start()
+    except Exception as e:
+        logging.getLogger("app.startup").warning("Failed to start friendship cache listener: %s", e)
     try:
         yield
     finally:
-        with contextlib.suppress(Exception):  # type: ignore[name-defined]
+        with contextlib.suppress(Exception):
             from ..infrastructure.services.telegram_dispatcher import get_dispatcher as _gd
             d = _gd()
             await d.shutdown()
+        with contextlib.suppress(Exception):
+            from ..infrastructure.services.summary_v2.orchestrator import get_summary_orchestrator as _gso
+            await _gso().shutdown()
+        with contextlib.suppress(Exception):
+            from ..infrastructure.services.voice_transcript import get_voice_collector as _gvc
+            await _gvc().shutdown()
+        with contextlib.suppress(Exception):
+            from ..infrastructure.services.asr import get_asr_pool
+            await get_asr_pool().shutdown()
+        with contextlib.suppress(Exception):
+            from ..infrastructure.services.telegram import close_client as _tg_close
+            await _tg_close()
+        with contextlib.suppress(Exception):
+            from ..infrastructure.services.direct_push_jobs import get_direct_push_scheduler as _gdps
+            await _gdps().shutdown()
+        with contextlib.suppress(Exception):
+            from ..infrastructure.services.friendship_cache import get_friendship_cache as _gfc
+            await _gfc().shutdown()
+        with contextlib.suppress(Exception):
+            from ..infrastructure.services.webpush import shutdown_push_delivery
+            shutdown_push_delivery()
 
 
 def create_app() -> FastAPI:
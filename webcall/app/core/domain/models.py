@@ -129,6 +129,16 @@ class Friendship:
         return Friendship(id=uuid4(), user_a_id=ua, user_b_id=ub, requested_by=requested_by, status=status, created_at=now, updated_at=now)
 
 
+@dataclass(slots=True)
+class FriendListItem:
+    """Строка списка друзей / заявок: дружба + профиль второй стороны + непрочитанные от неё."""
+    friendship: Friendship
+    other_id: UUID
+    username: str | None
+    email: str | None
+    unread: int = 0
+
+
 @dataclass(slots=True)
 class PushSubscription:
     id: UUID
@@ -5,7 +5,7 @@ from typing import Iterable, Optional
 from datetime import datetime
 from uuid import UUID
 
-from ..domain.models import Message, Participant, Room, User, Friendship, FriendStatus, PushSubscription, DirectMessage
+from ..domain.models import Message, Participant, Room, User, Friendship, FriendStatus, FriendListItem, PushSubscription, DirectMessage
 
 
 class UserRepository(ABC):
@@ -127,6 +127,12 @@ class FriendshipRepository(ABC):
         """List incoming pending requests for user."""
         raise NotImplementedError
 
+    @abstractmethod
+    async def list_overview(self, user_id: UUID, *, requests: bool = False, with_unread: bool = True) -> list[FriendListItem]:
+        """Друзья (или входящие заявки при requests=True) вместе с профилем второй стороны и числом
+        непрочитанных от неё — одним запросом вместо запросов на каждого друга."""
+        raise NotImplementedError
+
     @abstractmethod
     async def add(self, f: Friendship) -> None:
         raise NotImplementedError
@@ -159,10 +165,20 @@ class PushSubscriptionRepository(ABC):
     async def list_by_user(self, user_id: UUID) -> list[PushSubscription]:
         raise NotImplementedError
 
+    async def remove_many(self, user_id: UUID, endpoints: list[str]) -> int:
+        """Удалить несколько подписок пользователя (реализации могут сделать это одним запросом)."""
+        for endpoint in endpoints:
+            await self.remove(user_id, endpoint)
+        return len(endpoints)
+
 
 class DirectMessageRepository(ABC):
     @abstractmethod
-    async def add(self, dm: DirectMessage) -> None:
+    async def add(self, dm: DirectMessage) -> int | None:
+        """Сохранить сообщение. Возвращает порядковый номер сообщения в паре (если реализация его ведёт).
+
+        Счётчик непрочитанных получателя увеличивается в той же транзакции.
+        """
         raise NotImplementedError
 
     @abstractmethod
@@ -173,6 +189,15 @@ class DirectMessageRepository(ABC):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    async def list_pair_keyset(self, user_a: UUID, user_b: UUID, *, limit: int = 50, before: tuple[datetime, UUID] | None = None, after: tuple[datetime, UUID] | None = None) -> list[DirectMessage]:
+        """Keyset пагинация по (sent_at, id).
+
+        before — сообщения строго раньше курсора (sent_at desc); after — строго позже курсора
+        (sent_at asc, delta-синхронизация переподключившегося клиента). Без курсоров — последние limit.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     async def delete_pair(self, user_a: UUID, user_b: UUID) -> int:
         """Удалить всю переписку между двумя пользователями.
@@ -199,6 +224,11 @@ class DirectReadStateRepository(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    async def set_last_read(self, user_id: UUID, friend_id: UUID, when: datetime) -> None:
-        """Обновить момент последнего прочтения (upsert)."""
+    async def set_last_read(self, user_id: UUID, friend_id: UUID, when: datetime) -> int | None:
+        """Обновить момент последнего прочтения (upsert) и счётчик непрочитанных; вернуть новое значение счётчика."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_unread(self, user_id: UUID, friend_id: UUID) -> int:
+        """Текущее значение счётчика непрочитанных user_id от friend_id."""
         raise NotImplementedError
@@ -92,3 +92,18 @@ class CallInviteService(ABC):
     @abstractmethod
     async def list_pending_for(self, user_id: UUID) -> list[dict]:  # pragma: no cover
         raise NotImplementedError
+
+
+class AsrEngine(ABC):
+    """Распознавание речи: аудио (bytes или файловый объект с позицией в начале) -> текст.
+
+    Ошибки возвращаются плейсхолдером вида "(asr failed ...)" / "(asr exception ...)", а не исключением.
+    """
+
+    name: str = "asr"
+    # Дедуп по sha256 содержимого имеет смысл только для реального (дорогого) движка
+    dedupe: bool = True
+
+    @abstractmethod
+    async def transcribe(self, audio: Any, *, filename: str = "audio.webm", content_type: str = "audio/webm") -> str:  # pragma: no cover - интерфейс
+        raise NotImplementedError
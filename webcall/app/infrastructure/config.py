@@ -49,6 +49,11 @@ class Settings(BaseSettings):
     VAPID_PUBLIC_KEY: str | None = None
     VAPID_PRIVATE_KEY: str | None = None
     VAPID_SUBJECT: str | None = None
+    PUSH_SEND_WORKERS: int = 8  # потоков пула отправки Web Push (устройства пользователя шлются параллельно)
+    DIRECT_PUSH_DELAY_SEC: int = 600  # через сколько секунд напоминать push'ем о непрочитанном личном сообщении
+    DIRECT_PUSH_POLL_SEC: float = 5.0  # период опроса таблицы direct_push_jobs
+    DIRECT_PUSH_BATCH: int = 200  # сколько наступивших задач забирать за один проход
+    DIRECT_DECRYPT_OFFLOAD_MIN: int = 32  # с какого размера страницы истории ЛС расшифровывать в пуле потоков (0 — всегда в event loop)
 
     # Rate limiting (формат: "<limit>/<window_sec>") например 100/60
     RATE_LIMIT: str | None = None
@@ -66,16 +71,52 @@ class Settings(BaseSettings):
     # self  – (по умолчанию) только собственный голос владельца агента
     # room  – агрегировать голос всех участников комнаты (каждый сегмент будет размечен именем участника)
     AI_SUMMARY_VOICE_SCOPE: str = "room"
+    # Конец комнаты: персональные summary нескольких владельцев агентов формируются одним batch запросом к AI
+    AI_SUMMARY_BATCH_ROOM_END: bool = False
+    # Компактная подсказка для AI: псевдонимы говорящих + легенда, время корзинами (сек) только при смене
+    AI_SUMMARY_COMPACT_PROMPT: bool = True
+    AI_SUMMARY_COMPACT_TIME_BUCKET_SEC: int = 60
+    # Порог Jaccard (по шинглам) для отсева почти-дубликатов голосовых сегментов; 0 — отключить
+    AI_SUMMARY_VOICE_DEDUPE_THRESHOLD: float = 0.8
+    # TTL очистка памяти summary v2: завершённые сессии и логи комнат без сессий, room-wide голос (сек)
+    AI_SUMMARY_SESSION_TTL_SEC: int = 1800
+    AI_SUMMARY_BROADCAST_VOICE_TTL_SEC: int = 1800
+    AI_SUMMARY_SWEEP_INTERVAL_SEC: int = 60
     TELEGRAM_BOT_TOKEN: str | None = None  # токен бота для отправки итоговых выжимок
     TELEGRAM_CHAT_ID: str | None = None  # (устаревшее) глобальный chat id; если установлен используется как fallback
     TELEGRAM_BOT_NAME: str | None = None  # username бота без @ для генерации deep-link
+    TELEGRAM_DISPATCH_WORKERS: int = 4  # воркеров отправки в диспетчере
+    TELEGRAM_RATE_PER_CHAT: float = 1.0  # лимит сообщений в секунду на один чат (Bot API: ~1/s)
+    TELEGRAM_RATE_GLOBAL: float = 30.0  # общий лимит сообщений в секунду на бота (Bot API: ~30/s)
+    TELEGRAM_SEND_CONCURRENCY: int = 8  # одновременных sendMessage при рассылке по нескольким чатам (общий HTTP пул)
+    TELEGRAM_DIGEST_WINDOW_SEC: float = 0.0  # окно склейки выжимок одному пользователю в одно сообщение (0 = выкл.; с outbox — склейка строк пользователя из одной пачки claim)
+    TELEGRAM_OUTBOX_ENABLED: bool = False  # хранить очередь диспетчера в таблице telegram_outbox (переживает деплой, несколько воркеров)
+    TELEGRAM_OUTBOX_BATCH: int = 20  # сколько строк outbox забирать за один claim
+    TELEGRAM_OUTBOX_POLL_SEC: float = 1.0  # период опроса outbox при пустой очереди
+    TELEGRAM_OUTBOX_LEASE_SEC: int = 60  # через сколько секунд строка в sending (упавший воркер) снова доступна
+    TELEGRAM_CHAT_ID_CACHE_TTL_SEC: int = 300  # TTL кэша user_id -> chat_id (0 = без кэша); confirm/revoke инвалидируют запись после commit
+    # Кэш локален для процесса: при нескольких uvicorn воркерах остальные увидят новую привязку / revoke не позже TTL
     OPENAI_API_KEY: str | None = None  # ключ OpenAI (НЕ хранить в репо)
     AI_MODEL_FALLBACK: str | None = None  # запасная модель если основная недоступна
     # Voice capture / ASR
     VOICE_CAPTURE_ENABLED: bool = False
     VOICE_CHUNK_MAX_MS: int = 5000  # длительность сегмента MediaRecorder
     VOICE_ASR_MODEL: str = "whisper-1"  # модель для распознавания (OpenAI)
+    VOICE_ASR_ENGINE: str = "openai"  # движок распознавания: openai | stub (детерминированная замена для тестов/бенчмарков)
+    VOICE_ASR_WORKERS: int = 4  # одновременных распознаваний на процесс
+    VOICE_ASR_QUEUE_SIZE: int = 64  # ёмкость очереди финализаций (дальше — ожидание постановки)
     VOICE_MAX_TOTAL_MB: int = 30  # ограничение на суммарный объём аудиоданных
+    VOICE_SPOOL_ENABLED: bool = True  # копить чанки во временном файле на говорящего (а не в памяти) и отдавать в ASR файлом
+    VOICE_SPOOL_DIR: str | None = None  # каталог для spool файлов (по умолчанию системный tmp)
+    VOICE_PIPELINE_ENABLED: bool = False  # распознавать сегменты (по VOICE_CHUNK_MAX_MS) во время записи, а не целиком на stop
+    VOICE_PIPELINE_MAX_CONCURRENCY: int = 2  # одновременных ASR запросов на одного говорящего в pipelined режиме
+    # Backend хранения голосовых транскриптов: memory | redis (общий для нескольких воркеров)
+    VOICE_TRANSCRIPTS_BACKEND: str = "memory"
+    VOICE_TRANSCRIPTS_LRU_SIZE: int = 1024  # локальный LRU узла перед Redis (кол-во транскриптов)
+    # Кэш рёбер дружбы (проверка get_pair в DM / read-ack): memory | redis (общий для воркеров + pub/sub инвалидация)
+    FRIENDSHIP_CACHE_BACKEND: str = "memory"  # memory (LRU процесса, TTL не больше 5 с — другие воркеры не инвалидируются) | redis
+    FRIENDSHIP_CACHE_TTL_SEC: int = 300  # TTL записи (0 = без кэша); изменения дружбы сбрасывают ребро сразу (на всех воркерах — только с redis)
+    FRIENDSHIP_CACHE_SIZE: int = 10000  # размер локального LRU (кол-во пар)
 
 
 @lru_cache()
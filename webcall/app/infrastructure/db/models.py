@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from uuid import UUID
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, String, Text, UniqueConstraint
+from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -90,9 +90,36 @@ class DirectMessages(Base):
     sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), index=True, nullable=False)
     __table_args__ = (
         UniqueConstraint('id', name='uq_direct_msg_id'),
+        # Keyset пагинация истории пары по (sent_at, id)
+        Index('ix_direct_messages_pair_sent_id', 'user_a_id', 'user_b_id', 'sent_at', 'id'),
     )
 
 
+class DirectPairStats(Base):
+    """Счётчики переписки пары (user_a_id < user_b_id, как в direct_messages).
+
+    message_count увеличивается атомарно (UPDATE ... RETURNING) в той же транзакции, что и вставка
+    сообщения: порядковый номер сообщения в паре без COUNT(*) по истории.
+    """
+    __tablename__ = 'direct_pair_stats'
+    user_a_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    user_b_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    message_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_message_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True)
+
+
+class DirectUnreadCounters(Base):
+    """Материализованный счётчик непрочитанных: сколько сообщений от other_id не прочитал owner_id.
+
+    Увеличивается при отправке сообщения, пересчитывается / обнуляется при read-ack —
+    список друзей не считает строки direct_messages.
+    """
+    __tablename__ = 'direct_unread_counters'
+    owner_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    other_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    unread: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
 class DirectReadStates(Base):
     __tablename__ = 'direct_read_states'
     owner_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id'), primary_key=True)
@@ -120,3 +147,48 @@ class TelegramLinks(Base):
     __table_args__ = (
         UniqueConstraint('user_id', 'chat_id', name='uq_user_chat_once'),
     )
+
+
+class TelegramOutbox(Base):
+    """Исходящие сообщения Telegram диспетчера (durable очередь).
+
+    Статусы (PendingTask): pending -> sending -> sent | pending (ретрай) | failed.
+    Воркеры забирают готовые строки пачкой через SELECT ... FOR UPDATE SKIP LOCKED и ставят
+    lease (locked_until): строка, "зависшая" в sending после падения процесса, снова доступна по его истечении.
+    Значение locked_until служит и токеном владения: итог попытки пишется только при совпадении.
+    Дедупликация: уникальный (dedupe_key, dedupe_bucket), bucket — номер окна dedupe TTL.
+    """
+    __tablename__ = 'telegram_outbox'
+    id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True)
+    user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), index=True, nullable=False)
+    chat_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    reason: Mapped[str] = mapped_column(String(200), nullable=False)
+    dedupe_key: Mapped[str] = mapped_column(String(300), nullable=False)
+    dedupe_bucket: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+
+    __table_args__ = (
+        Index('ix_telegram_outbox_status_next', 'status', 'next_attempt_at'),
+        Index('uq_telegram_outbox_dedupe', 'dedupe_key', 'dedupe_bucket', unique=True),
+    )
+
+
+class DirectPushJobs(Base):
+    """Отложенный push о непрочитанном личном сообщении.
+
+    Одна запись на пару (получатель, отправитель): новое сообщение заменяет (supersede) ожидающую
+    задачу, read-ack получателя её удаляет. Воркер планировщика забирает наступившие задачи по due_at.
+    """
+    __tablename__ = 'direct_push_jobs'
+    recipient_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    sender_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    message_sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+    due_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), index=True, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
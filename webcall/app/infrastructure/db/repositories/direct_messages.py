@@ -1,21 +1,41 @@
 from __future__ import annotations
 
-from typing import List
+import base64
+from datetime import datetime
+from typing import List, Tuple
 from uuid import UUID
 
-from sqlalchemy import select, and_, desc, delete, func
+from sqlalchemy import select, and_, or_, desc, delete, func, insert, literal, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ....core.domain.models import DirectMessage
 from ....core.ports.repositories import DirectMessageRepository
 from .. import models as m
+from .direct_reads import upsert_unread
+
+
+def encode_cursor(sent_at: datetime, message_id: UUID) -> str:
+    """Непрозрачный курсор позиции сообщения (sent_at, id) для keyset пагинации."""
+    raw = f"{sent_at.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Обратное к encode_cursor; ValueError на некорректный курсор."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, mid = raw.split('|', 1)
+        return datetime.fromisoformat(ts), UUID(mid)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
 
 
 class PgDirectMessageRepository(DirectMessageRepository):
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
 
-    async def add(self, dm: DirectMessage) -> None:  # type: ignore[override]
+    async def add(self, dm: DirectMessage) -> int | None:  # type: ignore[override]
         row = m.DirectMessages(
             id=dm.id,
             user_a_id=dm.user_a_id,
@@ -25,32 +45,79 @@ class PgDirectMessageRepository(DirectMessageRepository):
             sent_at=dm.sent_at,
         )
         self.session.add(row)
+        # Счётчик пары в той же транзакции: порядковый номер без COUNT(*) по истории
+        ordinal = await self._bump_pair_stats(dm.user_a_id, dm.user_b_id, dm.sent_at)
+        # Непрочитанные получателя — там же: сообщение и счётчик фиксируются вместе
+        recipient = dm.user_b_id if dm.sender_id == dm.user_a_id else dm.user_a_id
+        await upsert_unread(self.session, recipient, dm.sender_id, by=1)
+        # Отправитель ответил — его ожидающий отложенный push об этой переписке больше не нужен
+        await self.session.execute(
+            delete(m.DirectPushJobs).where(and_(m.DirectPushJobs.recipient_id == dm.sender_id, m.DirectPushJobs.sender_id == recipient))
+        )
         await self.session.commit()
+        return ordinal
+
+    async def _bump_pair_stats(self, ua: UUID, ub: UUID, sent_at: datetime) -> int:
+        stats = m.DirectPairStats
+        bump = (
+            update(stats)
+            .where(and_(stats.user_a_id == ua, stats.user_b_id == ub))
+            .values(message_count=stats.message_count + 1, last_message_at=sent_at)
+            .returning(stats.message_count)
+        )
+        for _ in range(2):
+            count = (await self.session.execute(bump)).scalar_one_or_none()
+            if count is not None:
+                return int(count)
+            # Первое сообщение пары: вставка в savepoint (параллельная вставка — повторяем UPDATE)
+            try:
+                async with self.session.begin_nested():
+                    await self.session.execute(
+                        insert(stats).values(user_a_id=ua, user_b_id=ub, message_count=1, last_message_at=sent_at)
+                    )
+                return 1
+            except IntegrityError:
+                continue
+        raise RuntimeError("direct_pair_stats: failed to bump counter")
+
+    async def get_pair_stats(self, user_a: UUID, user_b: UUID) -> tuple[int, datetime | None]:
+        """(число сообщений, время последнего сообщения) пары; (0, None) — переписки нет."""
+        ua, ub = (user_a, user_b) if str(user_a) <= str(user_b) else (user_b, user_a)
+        res = await self.session.execute(
+            select(m.DirectPairStats.message_count, m.DirectPairStats.last_message_at)
+            .where(and_(m.DirectPairStats.user_a_id == ua, m.DirectPairStats.user_b_id == ub))
+        )
+        row = res.first()
+        return (int(row[0]), row[1]) if row else (0, None)
 
     async def list_pair(self, user_a: UUID, user_b: UUID, limit: int = 50, before: UUID | None = None) -> List[DirectMessage]:  # type: ignore[override]
-        a_s, b_s = str(user_a), str(user_b)
-        if a_s <= b_s:
-            ua, ub = user_a, user_b
-        else:
-            ua, ub = user_b, user_a
-        stmt = select(m.DirectMessages).where(and_(m.DirectMessages.user_a_id == ua, m.DirectMessages.user_b_id == ub))
+        cursor = None
         if before:
-            # Понадобится получить sent_at указанного сообщения и фильтровать по времени
-            sub = select(m.DirectMessages.sent_at).where(m.DirectMessages.id == before).scalar_subquery()
-            stmt = stmt.where(m.DirectMessages.sent_at < sub)
-        stmt = stmt.order_by(desc(m.DirectMessages.sent_at)).limit(limit)
-        rows = (await self.session.execute(stmt)).scalars().all()
-        result: List[DirectMessage] = []
-        for r in rows:
-            result.append(DirectMessage(
-                id=r.id,
-                user_a_id=r.user_a_id,
-                user_b_id=r.user_b_id,
-                sender_id=r.sender_id,
-                ciphertext=r.ciphertext,
-                sent_at=r.sent_at,
-            ))
-        return result
+            # Позиция сообщения-курсора — одним обращением по id, дальше keyset по (sent_at, id)
+            res = await self.session.execute(select(m.DirectMessages.sent_at, m.DirectMessages.id).where(m.DirectMessages.id == before))
+            row = res.first()
+            if row is None:
+                return []
+            cursor = (row[0], row[1])
+        return await self.list_pair_keyset(user_a, user_b, limit=limit, before=cursor)
+
+    async def list_pair_keyset(self, user_a: UUID, user_b: UUID, *, limit: int = 50, before: Tuple[datetime, UUID] | None = None, after: Tuple[datetime, UUID] | None = None) -> List[DirectMessage]:  # type: ignore[override]
+        ua, ub = (user_a, user_b) if str(user_a) <= str(user_b) else (user_b, user_a)
+        dm = m.DirectMessages
+        stmt = select(dm).where(and_(dm.user_a_id == ua, dm.user_b_id == ub))
+        key = tuple_(dm.sent_at, dm.id)
+        if after is not None:
+            # Delta: новее курсора, от старых к новым
+            stmt = stmt.where(key > tuple_(literal(after[0]), literal(after[1], dm.id.type))).order_by(dm.sent_at, dm.id)
+        else:
+            if before is not None:
+                stmt = stmt.where(key < tuple_(literal(before[0]), literal(before[1], dm.id.type)))
+            stmt = stmt.order_by(desc(dm.sent_at), desc(dm.id))
+        rows = (await self.session.execute(stmt.limit(limit))).scalars().all()
+        return [
+            DirectMessage(id=r.id, user_a_id=r.user_a_id, user_b_id=r.user_b_id, sender_id=r.sender_id, ciphertext=r.ciphertext, sent_at=r.sent_at)
+            for r in rows
+        ]
 
     async def delete_pair(self, user_a: UUID, user_b: UUID) -> int:  # type: ignore[override]
         a_s, b_s = str(user_a), str(user_b)
@@ -62,6 +129,15 @@ class PgDirectMessageRepository(DirectMessageRepository):
         stmt = delete(m.DirectMessages).where(and_(m.DirectMessages.user_a_id == ua, m.DirectMessages.user_b_id == ub))
         res = await self.session.execute(stmt)
         deleted = res.rowcount if res.rowcount is not None else 0
+        await self.session.execute(
+            delete(m.DirectPairStats).where(and_(m.DirectPairStats.user_a_id == ua, m.DirectPairStats.user_b_id == ub))
+        )
+        await self.session.execute(
+            delete(m.DirectUnreadCounters).where(or_(
+                and_(m.DirectUnreadCounters.owner_id == ua, m.DirectUnreadCounters.other_id == ub),
+                and_(m.DirectUnreadCounters.owner_id == ub, m.DirectUnreadCounters.other_id == ua),
+            ))
+        )
         await self.session.commit()
         return deleted
 
@@ -3,11 +3,40 @@ from __future__ import annotations
 from datetime import datetime
 from uuid import UUID
 
-from sqlalchemy import select
+from sqlalchemy import and_, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ....core.ports.repositories import DirectReadStateRepository
-from ..models import DirectReadStates
+from ..models import DirectMessages, DirectPairStats, DirectReadStates, DirectUnreadCounters
+
+
+def _order_pair(a: UUID, b: UUID) -> tuple[UUID, UUID]:
+    return (a, b) if str(a) <= str(b) else (b, a)
+
+
+async def upsert_unread(session: AsyncSession, user_id: UUID, friend_id: UUID, *, by: int = 0, set_to: int | None = None) -> int:
+    """Счётчик непрочитанных user_id от friend_id: +by или =set_to, без commit (в транзакции вызывающего)."""
+    c = DirectUnreadCounters
+    value = set_to if set_to is not None else c.unread + by
+    stmt = (
+        update(c)
+        .where(and_(c.owner_id == user_id, c.other_id == friend_id))
+        .values(unread=value)
+        .returning(c.unread)
+    )
+    for _ in range(2):
+        unread = (await session.execute(stmt)).scalar_one_or_none()
+        if unread is not None:
+            return int(unread)
+        initial = set_to if set_to is not None else by
+        try:
+            async with session.begin_nested():
+                await session.execute(insert(c).values(owner_id=user_id, other_id=friend_id, unread=initial))
+            return int(initial)
+        except IntegrityError:
+            continue
+    raise RuntimeError("direct_unread_counters: failed to update counter")
 
 
 class PgDirectReadStateRepository(DirectReadStateRepository):
@@ -23,7 +52,7 @@ class PgDirectReadStateRepository(DirectReadStateRepository):
         row = res.scalars().first()
         return row.last_read_at if row else None
 
-    async def set_last_read(self, user_id: UUID, friend_id: UUID, when: datetime) -> None:  # type: ignore[override]
+    async def set_last_read(self, user_id: UUID, friend_id: UUID, when: datetime) -> int | None:  # type: ignore[override]
         # upsert-поведение: попробуем загрузить, затем вставить/обновить
         res = await self.session.execute(
             select(DirectReadStates).where(
@@ -36,4 +65,31 @@ class PgDirectReadStateRepository(DirectReadStateRepository):
         else:
             row = DirectReadStates(owner_id=user_id, other_id=friend_id, last_read_at=when)
             self.session.add(row)
+        unread = await self._recount_unread(user_id, friend_id, when)
         await self.session.commit()
+        return unread
+
+    async def _recount_unread(self, user_id: UUID, friend_id: UUID, when: datetime) -> int:
+        """Счётчик после прочтения до when: 0, если when не раньше последнего сообщения пары, иначе пересчёт."""
+        ua, ub = _order_pair(user_id, friend_id)
+        last_at = (await self.session.execute(
+            select(DirectPairStats.last_message_at).where(and_(DirectPairStats.user_a_id == ua, DirectPairStats.user_b_id == ub))
+        )).scalar_one_or_none()
+        unread = 0
+        if last_at is not None and when < last_at:
+            unread = int((await self.session.execute(
+                select(func.count()).select_from(DirectMessages).where(
+                    DirectMessages.user_a_id == ua,
+                    DirectMessages.user_b_id == ub,
+                    DirectMessages.sender_id == friend_id,
+                    DirectMessages.sent_at > when,
+                )
+            )).scalar_one() or 0)
+        await upsert_unread(self.session, user_id, friend_id, set_to=unread)
+        return unread
+
+    async def get_unread(self, user_id: UUID, friend_id: UUID) -> int:  # type: ignore[override]
+        res = await self.session.execute(
+            select(DirectUnreadCounters.unread).where(and_(DirectUnreadCounters.owner_id == user_id, DirectUnreadCounters.other_id == friend_id))
+        )
+        return int(res.scalar_one_or_none() or 0)
@@ -3,13 +3,14 @@ from __future__ import annotations
 from typing import List, Optional
 from uuid import UUID
 
-from sqlalchemy import and_, or_, select, update
+from sqlalchemy import and_, case, func, literal, or_, select, update
 from sqlalchemy import delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ....core.domain.models import Friendship, FriendStatus
+from ....core.domain.models import Friendship, FriendListItem, FriendStatus
 from ....core.ports.repositories import FriendshipRepository
-from ..models import Friendships
+from ..models import DirectUnreadCounters, Friendships, Users
+from ...services.friendship_cache import FriendshipCache, get_friendship_cache
 
 
 def _order_pair(a: UUID, b: UUID) -> tuple[UUID, UUID]:
@@ -17,17 +18,25 @@ def _order_pair(a: UUID, b: UUID) -> tuple[UUID, UUID]:
 
 
 class PgFriendshipRepository(FriendshipRepository):
-    def __init__(self, session: AsyncSession) -> None:
+    def __init__(self, session: AsyncSession, cache: FriendshipCache | None = None) -> None:
         self.session = session
+        self.cache = cache if cache is not None else get_friendship_cache()
 
     async def get_pair(self, user_a: UUID, user_b: UUID) -> Optional[Friendship]:  # type: ignore[override]
+        # Проверка дружбы стоит в начале каждого DM / read-ack — в установившемся режиме отвечает кэш
+        hit, cached = await self.cache.get(user_a, user_b)
+        if hit:
+            return cached
+        token = await self.cache.read_token(user_a, user_b)
         ua, ub = _order_pair(user_a, user_b)
         stmt = select(Friendships).where(and_(Friendships.user_a_id == ua, Friendships.user_b_id == ub))
         res = await self.session.execute(stmt)
         row = res.scalar_one_or_none()
-        if not row:
-            return None
-        return Friendship(id=row.id, user_a_id=row.user_a_id, user_b_id=row.user_b_id, requested_by=row.requested_by, status=FriendStatus(row.status), created_at=row.created_at, updated_at=row.updated_at)
+        f = None
+        if row:
+            f = Friendship(id=row.id, user_a_id=row.user_a_id, user_b_id=row.user_b_id, requested_by=row.requested_by, status=FriendStatus(row.status), created_at=row.created_at, updated_at=row.updated_at)
+        await self.cache.put(user_a, user_b, f, token=token)
+        return f
 
     async def list_friends(self, user_id: UUID, status: FriendStatus = FriendStatus.accepted) -> List[Friendship]:  # type: ignore[override]
         stmt = select(Friendships).where(and_(or_(Friendships.user_a_id == user_id, Friendships.user_b_id == user_id), Friendships.status == status.value))
@@ -41,6 +50,28 @@ class PgFriendshipRepository(FriendshipRepository):
         rows = res.scalars().all()
         return [Friendship(id=r.id, user_a_id=r.user_a_id, user_b_id=r.user_b_id, requested_by=r.requested_by, status=FriendStatus(r.status), created_at=r.created_at, updated_at=r.updated_at) for r in rows]
 
+    async def list_overview(self, user_id: UUID, *, requests: bool = False, with_unread: bool = True) -> List[FriendListItem]:  # type: ignore[override]
+        other_id = case((Friendships.user_a_id == user_id, Friendships.user_b_id), else_=Friendships.user_a_id)
+        # Непрочитанные — из материализованного счётчика (direct_unread_counters), без подсчёта сообщений
+        unread = func.coalesce(DirectUnreadCounters.unread, 0) if with_unread else literal(0)
+        stmt = (
+            select(Friendships, other_id.label('other_id'), Users.username, Users.email, unread.label('unread'))
+            .outerjoin(Users, Users.id == other_id)
+            .where(or_(Friendships.user_a_id == user_id, Friendships.user_b_id == user_id))
+        )
+        if with_unread:
+            stmt = stmt.outerjoin(DirectUnreadCounters, and_(DirectUnreadCounters.owner_id == user_id, DirectUnreadCounters.other_id == other_id))
+        if requests:
+            stmt = stmt.where(Friendships.status == FriendStatus.pending.value, Friendships.requested_by != user_id)
+        else:
+            stmt = stmt.where(Friendships.status == FriendStatus.accepted.value)
+        res = await self.session.execute(stmt)
+        items: List[FriendListItem] = []
+        for r, oid, username, email, cnt in res.all():
+            f = Friendship(id=r.id, user_a_id=r.user_a_id, user_b_id=r.user_b_id, requested_by=r.requested_by, status=FriendStatus(r.status), created_at=r.created_at, updated_at=r.updated_at)
+            items.append(FriendListItem(friendship=f, other_id=oid, username=username, email=email, unread=int(cnt or 0)))
+        return items
+
     async def add(self, f: Friendship) -> None:  # type: ignore[override]
         ua, ub = _order_pair(f.user_a_id, f.user_b_id)
         self.session.add(
@@ -55,6 +86,7 @@ class PgFriendshipRepository(FriendshipRepository):
             )
         )
         await self.session.commit()
+        await self.cache.invalidate(ua, ub)
 
     async def update(self, f: Friendship) -> None:  # type: ignore[override]
         await self.session.execute(
@@ -63,6 +95,7 @@ class PgFriendshipRepository(FriendshipRepository):
             .values(status=f.status.value, requested_by=f.requested_by, updated_at=f.updated_at)
         )
         await self.session.commit()
+        await self.cache.invalidate(f.user_a_id, f.user_b_id)
 
     async def remove(self, user_a: UUID, user_b: UUID) -> None:  # type: ignore[override]
         ua, ub = _order_pair(user_a, user_b)
@@ -70,3 +103,4 @@ class PgFriendshipRepository(FriendshipRepository):
             delete(Friendships).where(and_(Friendships.user_a_id == ua, Friendships.user_b_id == ub))
         )
         await self.session.commit()
+        await self.cache.invalidate(ua, ub)
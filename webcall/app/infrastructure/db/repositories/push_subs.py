@@ -68,6 +68,17 @@ class PgPushSubscriptionRepository(PushSubscriptionRepository):
         )
         await self.session.commit()
 
+    async def remove_many(self, user_id: UUID, endpoints: list[str]) -> int:  # type: ignore[override]
+        if not endpoints:
+            return 0
+        res = await self.session.execute(
+            delete(PushSubscriptions).where(
+                (PushSubscriptions.user_id == user_id) & (PushSubscriptions.endpoint.in_(list(endpoints)))
+            )
+        )
+        await self.session.commit()
+        return int(res.rowcount or 0)
+
     async def list_by_user(self, user_id: UUID) -> List[PushSubscription]:  # type: ignore[override]
         res = await self.session.execute(select(PushSubscriptions).where(PushSubscriptions.user_id == user_id))
         rows = res.scalars().all()
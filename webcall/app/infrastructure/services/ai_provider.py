@@ -11,7 +11,9 @@ from collections import Counter
 from typing import List, Optional
 import httpx
 import asyncio
+import json
 from .summary import AISummaryProvider
+from .summary_v2.prompt_codec import LEGEND_PREFIX
 from ..config import get_settings
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -46,13 +48,23 @@ class HeuristicAIProvider(AISummaryProvider):
             "Последние реплики:\n" + last_lines
         )
 
+    async def generate_batch_summary(self, shared_lines: List[str], targets: list, legend: str | None = None) -> dict[str, str]:  # type: ignore[override]
+        # Эвристика не экономит токены, но сохраняет контракт batch режима (используется в тестах / без ключа)
+        out: dict[str, str] = {}
+        for t in targets:
+            window = [shared_lines[i - 1] for i in t.line_ids if 0 < i <= len(shared_lines)]
+            out[t.tag] = await self.generate_summary(window, t.system_prompt)
+        return out
+
 
 class OpenAIAIProvider(AISummaryProvider):
     """Провайдер, использующий OpenAI Chat Completions/Responses API.
 
     Используем минимальный вызов с моделью из AI_MODEL_PROVIDER (после префикса 'openai:').
     Формат plain_messages: список строк. Мы склеиваем в одну подсказку, обрезая при необходимости.
+    Принимает компактный формат (первая строка — легенда псевдонимов участников).
     """
+    compact_prompt = True
 
     def __init__(self, api_key: str, model: str, fallback: str | None = None) -> None:
         self.api_key = api_key
@@ -63,6 +75,9 @@ class OpenAIAIProvider(AISummaryProvider):
         if not plain_messages:
             return "Нет данных для анализа."
         prompt_messages = plain_messages[-500:]  # safety bound
+        # Компактный формат: легенда псевдонимов всегда первая строка — не теряем её при обрезке хвоста
+        if len(plain_messages) > 500 and plain_messages[0].startswith(LEGEND_PREFIX):
+            prompt_messages = [plain_messages[0]] + plain_messages[-499:]
         joined = "\n".join(prompt_messages)
         system = system_prompt or (
             "Ты ассистент, делающий краткую структурированную выжимку группового чата:"
@@ -101,6 +116,70 @@ class OpenAIAIProvider(AISummaryProvider):
             return _error_fallback(joined, f"exc:{e.__class__.__name__}")
 
 
+    async def generate_batch_summary(self, shared_lines: List[str], targets: list, legend: str | None = None) -> dict[str, str]:  # type: ignore[override]
+        """Один запрос на всю комнату: общий контент передаётся единожды, окна пользователей — номерами строк.
+
+        Ответ модели ожидается JSON-объектом {tag: summary}. Теги, которых нет в ответе, просто отсутствуют
+        в результате — оркестратор досчитает их персональным запросом.
+        """
+        if not shared_lines or not targets:
+            return {}
+        numbered = "\n".join(f"{i} {line}" for i, line in enumerate(shared_lines, start=1))
+        blocks = []
+        for t in targets:
+            block = f"<{t.tag}> участник: {t.user_name or t.user_id}; строки: {_format_line_ranges(t.line_ids)}"
+            if t.system_prompt:
+                block += "\nПерсональные инструкции: " + t.system_prompt.strip().replace("\n", " ")[:1000]
+            blocks.append(block)
+        system = (
+            "Ты ассистент, делающий персональные выжимки группового звонка для нескольких участников сразу."
+            " Для каждого участника используй ТОЛЬКО строки его окна и следуй его персональным инструкциям;"
+            " по умолчанию: 1) Основные темы 2) Принятые решения 3) Открытые вопросы. Пиши лаконично на русском."
+            " Верни строго JSON-объект вида {\"<тег>\": \"<выжимка>\"} без дополнительного текста."
+        )
+        url = "https://api.openai.com/v1/chat/completions"
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        body = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": (f"{legend}\n" if legend else "") + f"Общий контент (строки пронумерованы):\n{numbered}\n---\nУчастники:\n" + "\n".join(blocks)},
+            ],
+            "temperature": 0.3,
+            "max_tokens": min(4000, 600 * len(targets)),
+            "response_format": {"type": "json_object"},
+        }
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            r = await client.post(url, json=body, headers=headers)
+            if r.status_code != 200 and self.fallback and r.status_code in {400, 404}:
+                body["model"] = self.fallback
+                r = await client.post(url, json=body, headers=headers)
+            if r.status_code != 200:
+                raise RuntimeError(f"OpenAI HTTP {r.status_code}")
+            content = r.json()['choices'][0]['message']['content']  # type: ignore[index]
+        data = json.loads(content)
+        if not isinstance(data, dict):
+            raise ValueError("batch summary: JSON object expected")
+        return {str(k): str(v).strip() for k, v in data.items() if isinstance(v, str) and v.strip()}
+
+
+def _format_line_ranges(ids: List[int]) -> str:
+    """[1,2,3,7,9,10] -> '1-3,7,9-10' (компактная разметка окна пользователя)."""
+    if not ids:
+        return "—"
+    ordered = sorted(set(ids))
+    parts: list[str] = []
+    start = prev = ordered[0]
+    for i in ordered[1:]:
+        if i == prev + 1:
+            prev = i
+            continue
+        parts.append(f"{start}-{prev}" if start != prev else str(start))
+        start = prev = i
+    parts.append(f"{start}-{prev}" if start != prev else str(start))
+    return ",".join(parts)
+
+
 def _error_fallback(joined: str, reason: str) -> str:
     tail = "\n".join(joined.splitlines()[-10:])
     return (
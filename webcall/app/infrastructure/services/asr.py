@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+"""ASR движки и общий пул финализаций.
+
+Все распознавания процесса (финализация записи, сегменты pipelined режима) проходят через
+AsrWorkerPool: ограниченная очередь + фиксированное число воркеров, поэтому всплеск
+завершившихся звонков не запускает неограниченное число параллельных загрузок.
+Результат кэшируется по sha256 содержимого аудио — повтор той же записи (ретрай) бесплатен,
+одновременные запросы одного и того же аудио склеиваются в один. Без реального движка
+(нет OPENAI_API_KEY, stub) хеш не считается. Хеш файлового аудио (до
+VOICE_MAX_TOTAL_MB) считается в потоке, а не в event loop.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import contextlib
+import hashlib
+import logging
+import time
+
+import httpx
+
+from ...core.ports.services import AsrEngine
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:  # метрики опциональны
+    from prometheus_client import Counter, Histogram
+    ASR_QUEUE_WAIT = Histogram('asr_queue_wait_seconds', 'Time ASR jobs wait in queue before a worker picks them up')
+    ASR_AUDIO_SECONDS = Counter('asr_audio_seconds_total', 'Estimated seconds of audio transcribed')
+    ASR_WALL_SECONDS = Counter('asr_wall_seconds_total', 'Wall-clock seconds spent in ASR engine calls')
+    ASR_FAILURES = Counter('asr_failures_total', 'ASR jobs that returned a failure placeholder', ['engine'])
+    ASR_CACHE_HITS = Counter('asr_cache_hits_total', 'ASR jobs served from the content-hash cache')
+except Exception:  # pragma: no cover
+    ASR_QUEUE_WAIT = None
+    ASR_AUDIO_SECONDS = None
+    ASR_WALL_SECONDS = None
+    ASR_FAILURES = None
+    ASR_CACHE_HITS = None
+
+_READ_BLOCK = 64 * 1024
+_DIGEST_INLINE_MAX = 256 * 1024  # небольшие байтовые сегменты (pipelined режим) хешируются без потока
+_FAILURE_PREFIXES = ('(asr ', '(no audio')
+
+
+def _audio_size(audio: Any) -> int:
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        return len(audio)
+    with contextlib.suppress(Exception):
+        pos = audio.tell()
+        audio.seek(0, 2)
+        size = audio.tell()
+        audio.seek(pos)
+        return size
+    return 0
+
+
+def audio_digest(audio: Any) -> str:
+    """sha256 содержимого; файловый объект читается блоками и возвращается в начало."""
+    h = hashlib.sha256()
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        h.update(audio)
+        return h.hexdigest()
+    audio.seek(0)
+    while True:
+        block = audio.read(_READ_BLOCK)
+        if not block:
+            break
+        h.update(block)
+    audio.seek(0)
+    return h.hexdigest()
+
+
+async def audio_digest_async(audio: Any) -> str:
+    """audio_digest для async кода: файловые объекты и крупные буферы — в пуле потоков."""
+    if isinstance(audio, (bytes, bytearray, memoryview)) and len(audio) <= _DIGEST_INLINE_MAX:
+        return audio_digest(audio)
+    return await asyncio.to_thread(audio_digest, audio)
+
+
+class OpenAIAsrEngine(AsrEngine):
+    name = "openai"
+
+    def __init__(self, *, timeout: float = 120.0) -> None:
+        self.timeout = timeout
+
+    @property
+    def dedupe(self) -> bool:  # type: ignore[override]
+        # Без ключа движок сразу отвечает "(asr disabled ...)" — хешировать аудио незачем
+        return bool(get_settings().OPENAI_API_KEY)
+
+    async def transcribe(self, audio: Any, *, filename: str = "audio.webm", content_type: str = "audio/webm") -> str:
+        settings = get_settings()
+        if not settings.OPENAI_API_KEY:
+            return "(asr disabled: no OPENAI_API_KEY)"
+        files = {
+            'file': (filename, audio, content_type),
+        }
+        data = {
+            'model': settings.VOICE_ASR_MODEL or 'whisper-1',
+            'response_format': 'text'
+        }
+        headers = { 'Authorization': f'Bearer {settings.OPENAI_API_KEY}' }
+        url = 'https://api.openai.com/v1/audio/transcriptions'
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                r = await client.post(url, data=data, files=files, headers=headers)
+                if r.status_code == 200:
+                    return r.text.strip()
+                return f"(asr failed http {r.status_code})"
+        except Exception as e:  # pragma: no cover
+            return f"(asr exception {e.__class__.__name__})"
+
+
+class StubAsrEngine(AsrEngine):
+    """Детерминированная локальная замена для тестов и бенчмарков: текст зависит только от содержимого.
+
+    latency_per_mb имитирует время распознавания (секунды на мегабайт аудио).
+    """
+    name = "stub"
+    dedupe = False  # ответ и так мгновенный, хеш считает сам движок
+
+    def __init__(self, *, latency_per_mb: float = 0.0) -> None:
+        self.latency_per_mb = latency_per_mb
+        self.calls = 0
+
+    async def transcribe(self, audio: Any, *, filename: str = "audio.webm", content_type: str = "audio/webm") -> str:
+        self.calls += 1
+        size = _audio_size(audio)
+        if size == 0:
+            return "(no audio)"
+        if self.latency_per_mb:
+            await asyncio.sleep(self.latency_per_mb * size / (1024 * 1024))
+        return f"stub transcript {audio_digest(audio)[:12]} ({size} bytes)"
+
+
+@dataclass
+class _AsrJob:
+    digest: str
+    audio: Any
+    size: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AsrWorkerPool:
+    """Ограниченная очередь распознаваний и фиксированный пул воркеров (ленивый старт)."""
+
+    def __init__(self, engine: AsrEngine, *, workers: int = 4, queue_size: int = 64, cache_size: int = 256,
+                 bytes_per_audio_sec: int = 4000) -> None:
+        self.engine = engine
+        self._workers = max(1, int(workers or 1))
+        self._queue: asyncio.Queue[_AsrJob] = asyncio.Queue(maxsize=max(1, int(queue_size or 1)))
+        self._tasks: List[asyncio.Task] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._cache_size = max(0, int(cache_size))
+        self._bytes_per_audio_sec = max(1, int(bytes_per_audio_sec or 4000))
+        self._stats: Dict[str, float] = {
+            'jobs': 0, 'cache_hits': 0, 'coalesced': 0, 'failures': 0,
+            'queue_wait_sec': 0.0, 'audio_sec': 0.0, 'wall_sec': 0.0,
+        }
+
+    def start(self) -> None:
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self._workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def shutdown(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        for t in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await t
+        self._tasks.clear()
+
+    async def transcribe(self, audio: Any, *, release: Callable[[], None] | None = None) -> str:
+        """Распознать аудио через очередь. Повтор того же содержимого берётся из кэша.
+
+        release — владение audio переходит пулу: release() вызывается, когда ни хеширование, ни движок
+        его больше не читают, даже если ожидающий вызов отменён (закрывать файл раньше нельзя).
+        """
+        job = asyncio.ensure_future(self._transcribe_owned(audio, release))
+        # Отменённый вызывающий не забирает результат — не логируем "exception was never retrieved"
+        job.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(job)
+
+    async def _transcribe_owned(self, audio: Any, release: Callable[[], None] | None) -> str:
+        try:
+            return await self._transcribe(audio)
+        finally:
+            if release is not None:
+                try:
+                    release()
+                except Exception:
+                    logger.debug("asr: release failed", exc_info=True)
+
+    async def _transcribe(self, audio: Any) -> str:
+        if not self.engine.dedupe:
+            # Нет реального движка (ASR выключен / stub): без хеша, кэша и склейки
+            return await self._enqueue('', audio)
+        digest = await audio_digest_async(audio)
+        cached = self._cache.get(digest)
+        if cached is not None:
+            self._cache.move_to_end(digest)
+            self._stats['cache_hits'] += 1
+            if ASR_CACHE_HITS is not None:
+                ASR_CACHE_HITS.inc()
+            return cached
+        pending = self._inflight.get(digest)
+        if pending is not None:
+            self._stats['coalesced'] += 1
+            return await asyncio.shield(pending)
+        return await self._enqueue(digest, audio)
+
+    async def _enqueue(self, digest: str, audio: Any) -> str:
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        if digest:
+            self._inflight[digest] = fut
+        self.start()
+        try:
+            await self._queue.put(_AsrJob(digest=digest, audio=audio, size=_audio_size(audio), future=fut))
+        except BaseException:
+            # Отмена до постановки в очередь: не оставляем "висящий" future для склеенных запросов
+            self._inflight.pop(digest, None)
+            if not fut.done():
+                fut.cancel()
+            raise
+        return await asyncio.shield(fut)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:  # pragma: no cover
+                if not job.future.done():
+                    job.future.set_result("(asr exception CancelledError)")
+                raise
+            except Exception as e:  # pragma: no cover
+                logger.exception("asr: worker error: %s", e)
+                if not job.future.done():
+                    job.future.set_result(f"(asr exception {e.__class__.__name__})")
+            finally:
+                self._inflight.pop(job.digest, None)
+                self._queue.task_done()
+
+    async def _run(self, job: _AsrJob) -> None:
+        wait = time.monotonic() - job.enqueued_at
+        started = time.monotonic()
+        text = (await self.engine.transcribe(job.audio) or '').strip()
+        wall = time.monotonic() - started
+        audio_sec = job.size / self._bytes_per_audio_sec
+        failed = text.startswith(_FAILURE_PREFIXES)
+        self._stats['jobs'] += 1
+        self._stats['queue_wait_sec'] += wait
+        self._stats['wall_sec'] += wall
+        self._stats['audio_sec'] += audio_sec
+        if ASR_QUEUE_WAIT is not None:
+            ASR_QUEUE_WAIT.observe(wait)
+        if ASR_WALL_SECONDS is not None:
+            ASR_WALL_SECONDS.inc(wall)
+        if ASR_AUDIO_SECONDS is not None:
+            ASR_AUDIO_SECONDS.inc(audio_sec)
+        if failed:
+            self._stats['failures'] += 1
+            if ASR_FAILURES is not None:
+                ASR_FAILURES.labels(self.engine.name).inc()
+        elif self._cache_size and job.digest:
+            # Кэшируем только успешные ответы: ретрай после сбоя должен реально повторить запрос
+            self._cache[job.digest] = text
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        logger.debug("asr: done engine=%s bytes=%s wait=%.3f wall=%.3f failed=%s qsize=%s", self.engine.name, job.size, wait, wall, failed, self._queue.qsize())
+        if not job.future.done():
+            job.future.set_result(text)
+
+    def stats(self) -> Dict[str, float]:
+        out = dict(self._stats)
+        out['queue_depth'] = self._queue.qsize()
+        # Секунд аудио на секунду работы движка (throughput / realtime factor)
+        out['audio_per_wall_sec'] = (out['audio_sec'] / out['wall_sec']) if out['wall_sec'] else 0.0
+        return out
+
+
+def get_asr_engine() -> AsrEngine:
+    settings = get_settings()
+    kind = (getattr(settings, 'VOICE_ASR_ENGINE', 'openai') or 'openai').lower()
+    if kind == 'stub':
+        return StubAsrEngine()
+    return OpenAIAsrEngine()
+
+
+_asr_pool_singleton: Optional[AsrWorkerPool] = None
+
+
+def get_asr_pool() -> AsrWorkerPool:
+    global _asr_pool_singleton
+    if _asr_pool_singleton is None:
+        settings = get_settings()
+        _asr_pool_singleton = AsrWorkerPool(
+            get_asr_engine(),
+            workers=getattr(settings, 'VOICE_ASR_WORKERS', 4),
+            queue_size=getattr(settings, 'VOICE_ASR_QUEUE_SIZE', 64),
+        )
+    return _asr_pool_singleton
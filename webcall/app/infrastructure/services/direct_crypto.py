@@ -8,34 +8,76 @@ from __future__ import annotations
   fernet_key = base_key[:32] -> urlsafe_b64encode
 
 Fernet обеспечивает аутентифицированное шифрование (AES128 + HMAC). Размер шифртекста возрастает.
+
+Производный ключ и объект Fernet кэшируются (LRU по упорядоченной паре): страница истории из 100
+сообщений одной пары больше не пересчитывает SHA-256 и не собирает Fernet на каждое сообщение.
+Крупные страницы расшифровываются в пуле потоков, чтобы не держать event loop.
 """
 
+import asyncio
 import hashlib
 import base64
+from functools import lru_cache
+from typing import Iterable, List, Tuple
 from uuid import UUID
 from cryptography.fernet import Fernet
 from ..config import get_settings
 
+FERNET_CACHE_SIZE = 4096
+
+
+def _key_for(secret: str, ua: str, ub: str) -> bytes:
+    raw = hashlib.sha256((secret + '::dm::' + ua + '::' + ub).encode('utf-8')).digest()
+    # Берём первые 32 байта (весь digest) и кодируем в base64 для Fernet
+    return base64.urlsafe_b64encode(raw)
+
 
 def _derive_key(a: UUID, b: UUID) -> bytes:
-    s = get_settings().JWT_SECRET
     a_s, b_s = str(a), str(b)
     if a_s <= b_s:
         ua, ub = a_s, b_s
     else:
         ua, ub = b_s, a_s
-    raw = hashlib.sha256((s + '::dm::' + ua + '::' + ub).encode('utf-8')).digest()
-    # Берём первые 32 байта (весь digest) и кодируем в base64 для Fernet
-    return base64.urlsafe_b64encode(raw)
+    return _key_for(get_settings().JWT_SECRET, ua, ub)
+
+
+@lru_cache(maxsize=FERNET_CACHE_SIZE)
+def _cached_fernet(ua: str, ub: str, secret: str) -> Fernet:
+    # secret входит в ключ кэша: смена JWT_SECRET (тесты, ротация) не оставит устаревших ключей
+    return Fernet(_key_for(secret, ua, ub))
+
+
+def _pair_fernet(a: UUID, b: UUID) -> Fernet:
+    a_s, b_s = str(a), str(b)
+    if a_s > b_s:
+        a_s, b_s = b_s, a_s
+    return _cached_fernet(a_s, b_s, get_settings().JWT_SECRET)
 
 
 def encrypt_direct(a: UUID, b: UUID, plaintext: str) -> str:
-    key = _derive_key(a, b)
-    f = Fernet(key)
-    return f.encrypt(plaintext.encode('utf-8')).decode('utf-8')
+    return _pair_fernet(a, b).encrypt(plaintext.encode('utf-8')).decode('utf-8')
 
 
 def decrypt_direct(a: UUID, b: UUID, ciphertext: str) -> str:
-    key = _derive_key(a, b)
-    f = Fernet(key)
-    return f.decrypt(ciphertext.encode('utf-8')).decode('utf-8')
+    return _pair_fernet(a, b).decrypt(ciphertext.encode('utf-8')).decode('utf-8')
+
+
+def decrypt_direct_many(items: Iterable[Tuple[UUID, UUID, str]]) -> List[str]:
+    """Расшифровать пачку (a, b, ciphertext). Нерасшифровываемые элементы возвращаются как есть
+    (повреждённый ciphertext или чужой ключ — клиент попробует расшифровать локально)."""
+    out: List[str] = []
+    for a, b, ct in items:
+        try:
+            out.append(decrypt_direct(a, b, ct))
+        except Exception:
+            out.append(ct)
+    return out
+
+
+async def decrypt_direct_batch(items: List[Tuple[UUID, UUID, str]], offload_min: int | None = None) -> List[str]:
+    """decrypt_direct_many для async кода: от offload_min элементов — в пуле потоков."""
+    if offload_min is None:
+        offload_min = int(getattr(get_settings(), 'DIRECT_DECRYPT_OFFLOAD_MIN', 32) or 0)
+    if offload_min <= 0 or len(items) < offload_min:
+        return decrypt_direct_many(items)
+    return await asyncio.to_thread(decrypt_direct_many, items)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+"""Планировщик отложенных push о непрочитанных личных сообщениях.
+
+Раньше каждое (десятое) сообщение порождало BackgroundTasks корутину с asyncio.sleep(600):
+тысячи спящих задач на воркер, и все терялись при рестарте. Теперь задача — строка
+direct_push_jobs (ключ — пара получатель/отправитель, due_at), её забирает один цикл опроса:
+  - новое сообщение пары заменяет ожидающую задачу (supersede), read-ack — удаляет, ответ получателя
+    удаляет её в транзакции самого сообщения (PgDirectMessageRepository.add);
+  - наступившие задачи забираются пачкой (FOR UPDATE SKIP LOCKED — несколько процессов не дублируют
+    отправку), условие "не прочитано" проверяется тем же запросом (outer join direct_read_states);
+    прочитанные удаляются сразу, непрочитанным due_at сдвигается на lease_sec (аренда);
+  - подписки всех получателей пачки читаются одним запросом, отправка — через общий PushDeliveryService;
+  - задача удаляется только после отправки: упал процесс между claim и отправкой — через lease_sec
+    задачу заберут снова (at-least-once, повторный push возможен, потерянный — нет).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+import asyncio
+import contextlib
+import logging
+
+from sqlalchemy import and_, delete, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+from ..config import get_settings
+from ..db.models import DirectPushJobs, DirectReadStates, PushSubscriptions
+from ..db.session import get_session
+from .webpush import WebPushMessage, get_push_delivery
+
+logger = logging.getLogger(__name__)
+
+
+class DirectPushScheduler:
+    def __init__(self, session_factory: Callable[[], Any] | None = None, *, delay_sec: float = 600, poll_sec: float = 5.0, batch: int = 200,
+                 lease_sec: float = 60) -> None:
+        self._session = session_factory or get_session
+        self.delay_sec = delay_sec
+        self.lease_sec = lease_sec
+        self.poll_sec = poll_sec
+        self.batch = max(1, int(batch))
+        self._task: Optional[asyncio.Task] = None
+        self._stop = False
+
+    async def schedule(self, recipient_id: UUID, sender_id: UUID, sent_at: datetime) -> None:
+        """Запланировать push получателю; ожидающая задача этой пары заменяется (срок считается от нового сообщения)."""
+        due = sent_at + timedelta(seconds=self.delay_sec)
+        values = dict(message_sent_at=sent_at, due_at=due)
+        async with self._session() as session:
+            for _ in range(2):
+                try:
+                    async with session.begin():
+                        res = await session.execute(
+                            update(DirectPushJobs)
+                            .where(DirectPushJobs.recipient_id == recipient_id, DirectPushJobs.sender_id == sender_id)
+                            .values(**values)
+                        )
+                        if not res.rowcount:
+                            await session.execute(insert(DirectPushJobs).values(
+                                recipient_id=recipient_id, sender_id=sender_id, created_at=datetime.utcnow(), **values))
+                    return
+                except IntegrityError:
+                    # Параллельная вставка той же пары — повторяем как update
+                    continue
+
+    async def cancel(self, recipient_id: UUID, sender_id: UUID) -> int:
+        """Снять ожидающий push (получатель прочитал переписку или сам ответил)."""
+        async with self._session() as session:
+            async with session.begin():
+                res = await session.execute(
+                    delete(DirectPushJobs).where(DirectPushJobs.recipient_id == recipient_id, DirectPushJobs.sender_id == sender_id)
+                )
+        return int(res.rowcount or 0)
+
+    async def claim_due(self, now: datetime | None = None) -> Tuple[int, List[DirectPushJobs]]:
+        """Забрать наступившие задачи: (сколько забрано, задачи с всё ещё непрочитанным сообщением).
+
+        Прочитанные удаляются сразу; непрочитанные остаются в таблице с due_at = now + lease_sec —
+        удалить их после отправки должен вызывающий (complete).
+        """
+        now = now or datetime.utcnow()
+        async with self._session() as session:
+            async with session.begin():
+                q = (
+                    select(DirectPushJobs, DirectReadStates.last_read_at)
+                    .outerjoin(DirectReadStates, and_(
+                        DirectReadStates.owner_id == DirectPushJobs.recipient_id,
+                        DirectReadStates.other_id == DirectPushJobs.sender_id,
+                    ))
+                    .where(DirectPushJobs.due_at <= now)
+                    .order_by(DirectPushJobs.due_at)
+                    .limit(self.batch)
+                    .with_for_update(skip_locked=True, of=DirectPushJobs)
+                )
+                rows = (await session.execute(q)).all()
+                if not rows:
+                    return 0, []
+                unread: List[DirectPushJobs] = []
+                read: List[DirectPushJobs] = []
+                for job, last_read in rows:
+                    (unread if last_read is None or last_read < job.message_sent_at else read).append(job)
+                if read:
+                    await session.execute(
+                        delete(DirectPushJobs)
+                        .where(tuple_(DirectPushJobs.recipient_id, DirectPushJobs.sender_id).in_([(j.recipient_id, j.sender_id) for j in read]))
+                    )
+                if unread:
+                    await session.execute(
+                        update(DirectPushJobs)
+                        .where(tuple_(DirectPushJobs.recipient_id, DirectPushJobs.sender_id).in_([(j.recipient_id, j.sender_id) for j in unread]))
+                        .values(due_at=now + timedelta(seconds=self.lease_sec))
+                    )
+        return len(rows), unread
+
+    async def complete(self, jobs: List[DirectPushJobs]) -> None:
+        """Удалить отправленные задачи. Задача, заменённая новым сообщением во время отправки (другой
+        message_sent_at), остаётся — о новом сообщении push ещё не уходил."""
+        if not jobs:
+            return
+        async with self._session() as session:
+            async with session.begin():
+                await session.execute(
+                    delete(DirectPushJobs).where(
+                        tuple_(DirectPushJobs.recipient_id, DirectPushJobs.sender_id, DirectPushJobs.message_sent_at)
+                        .in_([(j.recipient_id, j.sender_id, j.message_sent_at) for j in jobs])
+                    )
+                )
+
+    async def run_due(self, now: datetime | None = None) -> int:
+        """Один проход: отправить push по наступившим непрочитанным задачам. Возвращает число забранных задач."""
+        claimed, jobs = await self.claim_due(now)
+        delivery = get_push_delivery()
+        if not jobs or delivery is None:
+            await self.complete(jobs)
+            return claimed
+        recipients = {j.recipient_id for j in jobs}
+        async with self._session() as session:
+            res = await session.execute(select(PushSubscriptions).where(PushSubscriptions.user_id.in_(list(recipients))))
+            subs_by_user: Dict[UUID, list] = {}
+            for s in res.scalars().all():
+                subs_by_user.setdefault(s.user_id, []).append(s)
+        sends = []
+        owners = []
+        for j in jobs:
+            subs = subs_by_user.get(j.recipient_id)
+            if not subs:
+                continue
+            msg = WebPushMessage(title="Новое сообщение", body="Вам новое сообщение", data={"type": "direct", "from": str(j.sender_id)})
+            sends.append(delivery.send_many(subs, msg))
+            owners.append(j.recipient_id)
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        await self.complete(jobs)
+        gone: Dict[UUID, List[str]] = {}
+        for uid, r in zip(owners, results):
+            if isinstance(r, Exception):
+                logger.warning("direct_push: send failed user=%s err=%s", uid, r)
+                continue
+            if r.gone:
+                gone.setdefault(uid, []).extend(r.gone)
+        if gone:
+            from ..db.repositories.push_subs import PgPushSubscriptionRepository
+            async with self._session() as session:
+                repo = PgPushSubscriptionRepository(session)
+                for uid, endpoints in gone.items():
+                    with contextlib.suppress(Exception):
+                        await repo.remove_many(uid, list(dict.fromkeys(endpoints)))
+        logger.info("direct_push: claimed=%s unread=%s sent_to=%s", claimed, len(jobs), len(owners))
+        return claimed
+
+    async def _loop(self) -> None:
+        while not self._stop:
+            try:
+                claimed = await self.run_due()
+            except asyncio.CancelledError:  # pragma: no cover
+                raise
+            except Exception as e:
+                logger.warning("direct_push: loop error %s", e)
+                claimed = 0
+            if claimed >= self.batch:
+                await asyncio.sleep(0)
+                continue
+            await asyncio.sleep(self.poll_sec)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stop = False
+            self._task = asyncio.create_task(self._loop())
+
+    async def shutdown(self) -> None:
+        self._stop = True
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await self._task
+            self._task = None
+
+
+_scheduler_singleton: DirectPushScheduler | None = None
+
+
+def get_direct_push_scheduler() -> DirectPushScheduler:
+    global _scheduler_singleton
+    if _scheduler_singleton is None:
+        settings = get_settings()
+        _scheduler_singleton = DirectPushScheduler(
+            delay_sec=float(getattr(settings, 'DIRECT_PUSH_DELAY_SEC', 600) or 600),
+            poll_sec=float(getattr(settings, 'DIRECT_PUSH_POLL_SEC', 5.0) or 5.0),
+            batch=int(getattr(settings, 'DIRECT_PUSH_BATCH', 200) or 200),
+        )
+    return _scheduler_singleton
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+"""Кэш рёбер дружбы (упорядоченная пара пользователей -> Friendship | None).
+
+Каждое личное сообщение, read-ack и история начинаются с проверки "это друзья?" (get_pair).
+Статус пары меняется редко, поэтому ответ кэшируется:
+  - локальный LRU процесса с TTL (кэшируется и отсутствие дружбы);
+  - опционально Redis (backend=redis): String friend_edge:{a}:{b} => JSON, EX = TTL, общий для воркеров,
+    и Pub/Sub канал friend_edges — инвалидация локальных LRU других узлов.
+Без Redis другие воркеры (gunicorn -w N) об изменении не узнают, поэтому TTL memory-бэкенда
+ограничен MEMORY_TTL_MAX_SEC секундами.
+Запись в friendships (add / update / remove репозитория) сбрасывает ребро. От гонки "прочитали старое
+из БД -> параллельная запись инвалидировала -> положили старое в кэш" защищают счётчик поколений
+процесса и версия ребра в Redis (friend_edge_ver:{a}:{b}, INCR при инвалидации): read_token() снимает
+обе до чтения, put() пишет в Redis только если версия не изменилась (проверка и SET — одним скриптом).
+"""
+
+from collections import OrderedDict
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Optional, Tuple
+from uuid import UUID
+import asyncio
+import contextlib
+import json
+import logging
+import time
+import uuid
+
+from ...core.domain.models import Friendship, FriendStatus
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = 'friend_edges'
+MEMORY_TTL_MAX_SEC = 5.0  # без pub/sub инвалидации воркеры видят чужие изменения с этой задержкой
+_VERSION_KEY_TTL_SEC = 86400
+
+# SET ребра, только если версия не сменилась с момента read_token (KEYS: ребро, версия; ARGV: json, версия, ttl)
+_PUT_IF_VERSION = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+  return 1
+end
+return 0
+"""
+
+
+def _pair_key(a: UUID, b: UUID) -> str:
+    a_s, b_s = str(a), str(b)
+    return f"{a_s}:{b_s}" if a_s <= b_s else f"{b_s}:{a_s}"
+
+
+def _encode(f: Optional[Friendship]) -> str:
+    if f is None:
+        return json.dumps({'none': True})
+    return json.dumps({
+        'id': str(f.id), 'a': str(f.user_a_id), 'b': str(f.user_b_id), 'by': str(f.requested_by),
+        'status': f.status.value, 'created_at': f.created_at.isoformat(), 'updated_at': f.updated_at.isoformat(),
+    })
+
+
+def _decode(raw: str | bytes) -> Tuple[bool, Optional[Friendship]]:
+    try:
+        data = json.loads(raw)
+        if data.get('none'):
+            return True, None
+        return True, Friendship(
+            id=UUID(data['id']), user_a_id=UUID(data['a']), user_b_id=UUID(data['b']), requested_by=UUID(data['by']),
+            status=FriendStatus(data['status']), created_at=datetime.fromisoformat(data['created_at']),
+            updated_at=datetime.fromisoformat(data['updated_at']),
+        )
+    except Exception:
+        return False, None
+
+
+class FriendshipCache:
+    def __init__(self, ttl_sec: float = 300.0, max_size: int = 10000, redis: Any = None) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_size = max(16, int(max_size or 10000))
+        self.redis = redis
+        self.generation = 0
+        self._items: OrderedDict[str, Tuple[Optional[Friendship], float]] = OrderedDict()
+        self._node_id = uuid.uuid4().hex
+        self._listener_task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_sec > 0
+
+    def _redis_key(self, key: str) -> str:
+        return f"friend_edge:{key}"
+
+    def _version_key(self, key: str) -> str:
+        return f"friend_edge_ver:{key}"
+
+    # --- локальный LRU ---
+    def _local_get(self, key: str) -> Tuple[bool, Optional[Friendship]]:
+        item = self._items.get(key)
+        if item is None:
+            return False, None
+        f, expires = item
+        if expires < time.monotonic():
+            self._items.pop(key, None)
+            return False, None
+        self._items.move_to_end(key)
+        return True, f
+
+    def _local_put(self, key: str, f: Optional[Friendship]) -> None:
+        self._items[key] = (f, time.monotonic() + self.ttl_sec)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def _drop(self, key: str) -> None:
+        self.generation += 1
+        self._items.pop(key, None)
+
+    # --- API ---
+    async def get(self, a: UUID, b: UUID) -> Tuple[bool, Optional[Friendship]]:
+        """(найдено, дружба). Возвращается копия: роутеры меняют объект перед update."""
+        if not self.enabled:
+            return False, None
+        key = _pair_key(a, b)
+        hit, f = self._local_get(key)
+        if not hit and self.redis is not None:
+            try:
+                raw = await self.redis.get(self._redis_key(key))
+            except Exception:
+                logger.debug("friendship cache: redis get failed", exc_info=True)
+                raw = None
+            if raw:
+                hit, f = _decode(raw)
+                if hit:
+                    self._local_put(key, f)
+        if not hit:
+            return False, None
+        return True, (replace(f) if f is not None else None)
+
+    async def read_token(self, a: UUID, b: UUID) -> Tuple[int, Optional[str]]:
+        """Снимок (поколение процесса, версия ребра в Redis) до чтения из БД — передаётся в put()."""
+        version: Optional[str] = None
+        if self.redis is not None and self.enabled:
+            try:
+                version = str(await self.redis.get(self._version_key(_pair_key(a, b))) or '0')
+            except Exception:
+                logger.debug("friendship cache: redis version get failed", exc_info=True)
+        return self.generation, version
+
+    async def put(self, a: UUID, b: UUID, f: Optional[Friendship], token: Tuple[int, Optional[str]] | None = None) -> None:
+        """Положить результат чтения из БД. token — read_token() до чтения: если с тех пор была
+        инвалидация (в этом процессе или, для Redis, на любом узле), результат мог устареть и не кэшируется."""
+        if not self.enabled:
+            return
+        generation, version = token if token is not None else (self.generation, None)
+        if generation != self.generation:
+            return
+        key = _pair_key(a, b)
+        self._local_put(key, replace(f) if f is not None else None)
+        if self.redis is None:
+            return
+        ttl = max(1, int(self.ttl_sec))
+        try:
+            if token is None:
+                await self.redis.set(self._redis_key(key), _encode(f), ex=ttl)
+            elif version is not None:
+                await self.redis.eval(_PUT_IF_VERSION, 2, self._redis_key(key), self._version_key(key), _encode(f), version, ttl)
+        except Exception:
+            logger.debug("friendship cache: redis put failed", exc_info=True)
+
+    async def invalidate(self, a: UUID, b: UUID) -> None:
+        key = _pair_key(a, b)
+        self._drop(key)
+        if self.redis is not None:
+            try:
+                # Версия — раньше удаления: чтение, начатое до записи, уже не положит старое ребро обратно
+                await self.redis.incr(self._version_key(key))
+                await self.redis.expire(self._version_key(key), _VERSION_KEY_TTL_SEC)
+                await self.redis.delete(self._redis_key(key))
+                await self.redis.publish(EVENTS_CHANNEL, json.dumps({'key': key, 'node': self._node_id}))
+            except Exception:
+                logger.warning("friendship cache: redis invalidate failed key=%s", key, exc_info=True)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._items.clear()
+
+    # --- уведомления других узлов ---
+    def _handle_event(self, payload: str | bytes) -> None:
+        try:
+            event = json.loads(payload)
+        except Exception:
+            return
+        if event.get('node') == self._node_id or not event.get('key'):
+            return
+        self._drop(event['key'])
+
+    async def _listener(self) -> None:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(EVENTS_CHANNEL)
+        try:
+            async for msg in pubsub.listen():
+                if msg.get('type') != 'message':
+                    continue
+                self._handle_event(msg['data'])
+        finally:
+            with contextlib.suppress(Exception):
+                await pubsub.unsubscribe(EVENTS_CHANNEL)
+                await pubsub.close()
+
+    def start(self) -> None:
+        if self.redis is None or not self.enabled:
+            return
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listener())
+
+    async def shutdown(self) -> None:
+        if self._listener_task:
+            self._listener_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await self._listener_task
+            self._listener_task = None
+
+
+_friendship_cache: FriendshipCache | None = None
+
+
+def get_friendship_cache() -> FriendshipCache:
+    global _friendship_cache
+    if _friendship_cache is None:
+        settings = get_settings()
+        ttl = float(getattr(settings, 'FRIENDSHIP_CACHE_TTL_SEC', 300) or 0)
+        size = int(getattr(settings, 'FRIENDSHIP_CACHE_SIZE', 10000) or 10000)
+        redis = None
+        if (getattr(settings, 'FRIENDSHIP_CACHE_BACKEND', 'memory') or 'memory').lower() == 'redis':
+            try:
+                from redis.asyncio import from_url as redis_from_url
+                redis = redis_from_url(settings.REDIS_URL, decode_responses=True)
+            except Exception:  # pragma: no cover - fallback
+                redis = None
+        if redis is None and ttl > MEMORY_TTL_MAX_SEC:
+            ttl = MEMORY_TTL_MAX_SEC
+        _friendship_cache = FriendshipCache(ttl_sec=ttl, max_size=size, redis=redis)
+    return _friendship_cache
@@ -4,8 +4,7 @@ from uuid import UUID
 from typing import Iterable
 
 from ...core.ports.services import PushNotifier
-from ...infrastructure.config import get_settings
-from ...infrastructure.services.webpush import WebPushSender, WebPushMessage
+from ...infrastructure.services.webpush import WebPushMessage, get_push_delivery
 from ...core.ports.repositories import PushSubscriptionRepository, UserRepository
 
 
@@ -27,28 +26,14 @@ class SimplePushNotifier(PushNotifier):
         subs = await self._subs_repo.list_by_user(target.id)
         if not subs:
             return
-        settings = get_settings()
-        if not (settings.VAPID_PUBLIC_KEY and settings.VAPID_PRIVATE_KEY and settings.VAPID_SUBJECT):
+        delivery = get_push_delivery()
+        if delivery is None:
             return
-        sender = WebPushSender(vapid_public=settings.VAPID_PUBLIC_KEY, vapid_private=settings.VAPID_PRIVATE_KEY, subject=settings.VAPID_SUBJECT)
-        for s in subs:
-            msg = WebPushMessage(
-                title="Входящий звонок",
-                body=f"{from_username or 'Пользователь'} хочет поговорить",
-                icon=None,
-                data={"room_id": room_id, "from": str(from_user_id), "from_name": from_username},
-            )
-            attempts = 0
-            while attempts < 3:
-                attempts += 1
-                try:
-                    await sender.send(s.endpoint, s.p256dh, s.auth, msg)
-                    break
-                except Exception as e:  # pragma: no cover - сеть
-                    text = str(e)
-                    if any(code in text for code in ("410", "404")):
-                        await self._subs_repo.remove(target.id, s.endpoint)
-                        break
-                    if any(code in text for code in ("429", "500", "502", "503")) and attempts < 3:
-                        continue
-                    break
+        msg = WebPushMessage(
+            title="Входящий звонок",
+            body=f"{from_username or 'Пользователь'} хочет поговорить",
+            icon=None,
+            data={"room_id": room_id, "from": str(from_user_id), "from_name": from_username},
+        )
+        # Все устройства параллельно; ретраи 429/5xx и удаление 404/410 — внутри сервиса доставки
+        await delivery.deliver(self._subs_repo, target.id, msg, subs=subs)
@@ -154,9 +154,22 @@ def get_summary_collector() -> SummaryCollector:
 
 
 class AISummaryProvider:  # интерфейс для адаптера AI
+    # Провайдер принимает компактный формат строк (псевдонимы говорящих + легенда, см. summary_v2.prompt_codec)
+    compact_prompt: bool = False
+
     async def generate_summary(self, plain_messages: list[str]) -> str:  # pragma: no cover - интерфейс
         raise NotImplementedError
 
+    async def generate_batch_summary(self, shared_lines: list[str], targets: list, legend: str | None = None) -> dict[str, str]:  # pragma: no cover - интерфейс
+        """Пакетная генерация: общий контент один раз + окна/промпты нескольких пользователей.
+
+        legend — расшифровка псевдонимов говорящих, если shared_lines в компактном формате.
+
+        Возвращает tag -> текст summary. Провайдер без поддержки batch оставляет NotImplementedError,
+        вызывающий код откатывается на персональные запросы.
+        """
+        raise NotImplementedError
+
 
 async def summarize_messages(messages: List[ChatMessage], ai_provider: 'AISummaryProvider | None', *, system_prompt: str | None = None) -> SummaryResult:
     """Формирует SummaryResult из предоставленного списка сообщений (без модификации коллектора).
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+"""Отсев почти-дубликатов голосовых сегментов.
+
+Перекрывающиеся окна Whisper и proxy сегменты (voice_transcript_proxy) дают тексты,
+отличающиеся парой слов/пунктуацией. Точное сравнение и проверка подстроки их не ловят.
+
+Сегмент -> множество хешей словесных шинглов (по 3 слова; для коротких текстов — символьные по 5).
+Почти-дубликат: Jaccard >= threshold, либо новый сегмент почти целиком содержится в уже принятом
+(containment >= threshold). Если наоборот старый почти целиком содержится в новом — новый его заменяет.
+"""
+
+from typing import Callable, FrozenSet, List, Tuple, TypeVar
+import re
+import zlib
+
+DEFAULT_THRESHOLD = 0.8
+_WORD_SHINGLE = 3
+_CHAR_SHINGLE = 5
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+T = TypeVar('T')
+
+# Вердикты NearDuplicateIndex.check
+NEW = 'new'
+DUPLICATE = 'duplicate'
+SUPERSEDES = 'supersedes'
+
+
+def shingles(text: str) -> FrozenSet[int]:
+    """Хеши шинглов нормализованного текста (регистр, пунктуация и пробелы не влияют)."""
+    words = _TOKEN_RE.findall(text.lower())
+    if len(words) >= _WORD_SHINGLE * 2:
+        grams = (" ".join(words[i:i + _WORD_SHINGLE]) for i in range(len(words) - _WORD_SHINGLE + 1))
+    else:
+        joined = " ".join(words)
+        if len(joined) <= _CHAR_SHINGLE:
+            grams = iter([joined]) if joined else iter(())
+        else:
+            grams = (joined[i:i + _CHAR_SHINGLE] for i in range(len(joined) - _CHAR_SHINGLE + 1))
+    return frozenset(zlib.crc32(g.encode('utf-8')) for g in grams)
+
+
+def jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+class NearDuplicateIndex:
+    """Индекс принятых сегментов: шинглы в порядке добавления (позиция = индекс сегмента у владельца)."""
+
+    __slots__ = ('threshold', '_items')
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._items: List[FrozenSet[int]] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def check(self, text: str) -> Tuple[str, int, FrozenSet[int]]:
+        """Вердикт для нового сегмента: (NEW|DUPLICATE|SUPERSEDES, индекс совпавшего или -1, шинглы)."""
+        sh = shingles(text)
+        if not sh:
+            return NEW, -1, sh
+        for idx, other in enumerate(self._items):
+            if not other:
+                continue
+            inter = len(sh & other)
+            if not inter:
+                continue
+            # новый длиннее и поглощает старый — расширение (продолжение той же фразы)
+            if len(sh) > len(other) and inter / len(other) >= self.threshold:
+                return SUPERSEDES, idx, sh
+            if inter / (len(sh) + len(other) - inter) >= self.threshold or inter / len(sh) >= self.threshold:
+                return DUPLICATE, idx, sh
+        return NEW, -1, sh
+
+    def add(self, sh: FrozenSet[int]) -> None:
+        self._items.append(sh)
+
+    def replace(self, idx: int, sh: FrozenSet[int]) -> None:
+        self._items[idx] = sh
+
+
+def dedupe_segments(segments: List[T], *, threshold: float = DEFAULT_THRESHOLD, index: NearDuplicateIndex | None = None,
+                    key: Callable[[T], str] | None = None) -> Tuple[List[T], int]:
+    """Фильтрует список сегментов (порядок сохраняется). Возвращает (оставшиеся, отброшено байт).
+
+    index можно передать общий — тогда дубликаты отсекаются и относительно уже принятых
+    сегментов других говорящих (room режим). key — текст элемента (для VoiceSegment: lambda s: s.text).
+    """
+    idx = index if index is not None else NearDuplicateIndex(threshold)
+    text_of = key or (lambda x: x)  # type: ignore[assignment, return-value]
+    base = len(idx)
+    kept: List[T] = []
+    dropped = 0
+    for seg in segments:
+        text = text_of(seg)
+        verdict, pos, sh = idx.check(text)
+        if verdict == DUPLICATE:
+            dropped += len(text.encode('utf-8'))
+            continue
+        if verdict == SUPERSEDES and pos >= base:
+            old = kept[pos - base]
+            dropped += len(text_of(old).encode('utf-8'))
+            kept[pos - base] = seg
+            idx.replace(pos, sh)
+            continue
+        # SUPERSEDES сегмента другого говорящего: оставляем оба (чужой список не трогаем)
+        kept.append(seg)
+        idx.add(sh)
+    return kept, dropped
@@ -48,3 +48,16 @@ class MessageLog:
         if not bucket:
             return []
         return [m for m in bucket if not is_technical(m)]
+
+    def rooms(self) -> List[str]:
+        return list(self._storage.keys())
+
+    def last_ts(self, room_id: str) -> int | None:
+        bucket = self._storage.get(room_id)
+        return bucket[-1].ts if bucket else None
+
+    def drop_room(self, room_id: str) -> None:
+        self._storage.pop(room_id, None)
+
+    def retained_bytes(self) -> int:
+        return sum(len(m.content.encode('utf-8')) for bucket in self._storage.values() for m in bucket)
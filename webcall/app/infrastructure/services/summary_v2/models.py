@@ -1,6 +1,7 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import re
 import time
 
 
@@ -42,17 +43,98 @@ class SummaryResult:
         return cls(room_id=room_id, message_count=0, generated_at=int(time.time()*1000), summary_text="Нет сообщений для суммаризации.", sources=[], used_voice=False, participants=[])
 
 
+@dataclass(slots=True)
+class BatchTarget:
+    """Участник пакетной (batch) генерации: окно владельца агента внутри общего контента комнаты.
+
+    line_ids — номера строк общего контента (1-based), попадающих в окно пользователя.
+    """
+    tag: str
+    user_id: str
+    user_name: str | None
+    line_ids: List[int]
+    system_prompt: str | None = None
+
+
 TECHNICAL_PATTERNS = [
     '(asr failed http 400)',
     '(asr failed',
     'error asr',
 ]
 
-def is_technical(msg: ChatMessage) -> bool:
-    low = msg.content.lower().strip()
+# Плейсхолдеры ASR (voice_capture / transcribe_chunks), которые не несут речи
+ASR_PLACEHOLDER_PREFIXES = ('(no audio', '(asr failed', '(asr exception', '(asr disabled')
+
+_WS_RE = re.compile(r"\s+")
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def is_technical_text(text: str) -> bool:
+    low = text.lower().strip()
     if not low:
         return True
     for p in TECHNICAL_PATTERNS:
         if p in low:
             return True
     return False
+
+
+def split_sentences(text: str) -> Tuple[str, ...]:
+    norm = _WS_RE.sub(" ", text.strip())
+    if not norm:
+        return ()
+    parts = tuple(p.strip() for p in _SENTENCE_RE.split(norm) if p.strip())
+    return parts or (norm,)
+
+
+@dataclass(slots=True)
+class VoiceSegment:
+    """Голосовой транскрипт, разобранный один раз при поступлении (store_transcript / add_voice_transcript).
+
+    Мета-префикс `[meta captureTs=... session=...]` снимается, текст режется на предложения —
+    дальше сборщики summary работают с готовыми полями без повторного парсинга.
+    """
+    text: str  # тело без мета-префикса
+    capture_ts: int | None
+    session: str | None
+    speaker: str | None
+    sentences: Tuple[str, ...]
+    has_meta: bool = False
+    technical: bool = False
+
+    @classmethod
+    def from_text(cls, text: str, *, capture_ts: int | None = None, session: str | None = None, speaker: str | None = None, has_meta: bool = False) -> 'VoiceSegment':
+        body = text.strip()
+        technical = is_technical_text(body)
+        return cls(text=body, capture_ts=capture_ts, session=session, speaker=speaker,
+                   sentences=() if technical else split_sentences(body), has_meta=has_meta, technical=technical)
+
+    @classmethod
+    def parse(cls, raw: str, *, speaker: str | None = None) -> 'VoiceSegment':
+        raw = (raw or '').strip()
+        capture_ts: int | None = None
+        session: str | None = None
+        has_meta = False
+        if raw.startswith('[meta '):
+            end = raw.find(']')
+            if end != -1:
+                has_meta = True
+                for part in raw[6:end].split():
+                    k, _, v = part.partition('=')
+                    if k == 'captureTs':
+                        try:
+                            capture_ts = int(v)
+                        except ValueError:
+                            pass
+                    elif k == 'session':
+                        session = v or None
+                raw = raw[end + 1:]
+        return cls.from_text(raw, capture_ts=capture_ts, session=session, speaker=speaker, has_meta=has_meta)
+
+    @property
+    def is_placeholder(self) -> bool:
+        return self.text.lower().startswith(ASR_PLACEHOLDER_PREFIXES)
+
+
+def is_technical(msg: ChatMessage) -> bool:
+    return is_technical_text(msg.content)
@@ -1,10 +1,13 @@
 from __future__ import annotations
-from typing import Dict, Tuple, List
-import time, contextlib
+from dataclasses import replace
+from typing import Dict, Tuple, List, Optional
+import asyncio, time, contextlib
 from .message_log import MessageLog
-from .models import SummaryResult, ChatMessage, TECHNICAL_PATTERNS
-from .strategies import ChatStrategy, CombinedVoiceChatStrategy
+from .models import SummaryResult, ChatMessage, BatchTarget, VoiceSegment
+from .strategies import ChatStrategy, CombinedVoiceChatStrategy, BatchRoomStrategy
 from .user_agent import UserAgentSession
+from .dedupe import NearDuplicateIndex, DUPLICATE, SUPERSEDES, DEFAULT_THRESHOLD, dedupe_segments
+from .prompt_codec import get_compaction_stats
 from ...config import get_settings as _get_settings
 from ..ai_provider import get_user_system_prompt
 from ..voice_transcript import get_voice_collector
@@ -12,6 +15,14 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+try:  # метрики опциональны
+    from prometheus_client import Gauge
+    SUMMARY_SESSIONS_LIVE = Gauge('summary_v2_sessions_live', 'Summary v2 sessions held in memory', ['state'])
+    SUMMARY_RETAINED_BYTES = Gauge('summary_v2_retained_bytes', 'Approx bytes of text retained by summary v2', ['kind'])
+except Exception:  # pragma: no cover
+    SUMMARY_SESSIONS_LIVE = None
+    SUMMARY_RETAINED_BYTES = None
+
 
 class SummaryOrchestrator:
     """Оркестратор новой архитектуры персональных агентов.
@@ -34,6 +45,7 @@ class SummaryOrchestrator:
         # Стратегии (для fallback путей — вероятно не нужны, но оставим)
         self._chat_strategy = ChatStrategy()
         self._combined_strategy = CombinedVoiceChatStrategy()
+        self._batch_strategy = BatchRoomStrategy()
         # Unified counters (in-memory) — не критично к перезапуску
         self._counters: Dict[str, int] = {
             'voice_add_total': 0,
@@ -50,9 +62,27 @@ class SummaryOrchestrator:
             'session_auto_resumed': 0,
             'voice_broadcast_add_total': 0,
             'voice_broadcast_reject_stale': 0,
+            'batch_room_builds': 0,
+            'batch_users_served': 0,
+            'batch_fallback_users': 0,
+            # Почти-дубликаты голоса (Jaccard по шинглам): в сессиях, в broadcast буфере, между говорящими room режима
+            'voice_dedupe_dropped': 0,
+            'voice_dedupe_dropped_bytes': 0,
+            'voice_broadcast_dedupe_dropped_bytes': 0,
+            'voice_room_dedupe_dropped_bytes': 0,
+            'sweep_runs': 0,
+            'sweep_sessions_evicted': 0,
+            'sweep_broadcast_evicted': 0,
+            'sweep_room_logs_evicted': 0,
         }
-        # Room-wide (broadcast) voice сегменты: room_id -> list[ (capture_ts|None, text) ]
-        self._room_broadcast_voice: Dict[str, List[Tuple[int | None, str]]] = {}
+        # Room-wide (broadcast) voice сегменты: room_id -> list[VoiceSegment] (captureTs уже разобран)
+        self._room_broadcast_voice: Dict[str, List[VoiceSegment]] = {}
+        # Шинглы broadcast сегментов (позиции совпадают с _room_broadcast_voice[room_id])
+        self._room_broadcast_index: Dict[str, NearDuplicateIndex] = {}
+        # Последнее пополнение broadcast буфера комнаты (мс) — для TTL очистки
+        self._room_broadcast_touched: Dict[str, int] = {}
+        # Фоновая очистка завершённых сессий / broadcast буферов / логов пустых комнат
+        self._sweeper_task: Optional[asyncio.Task] = None
         # Кэш настроек (ленивое обновление при изменении окружения)
         self._settings_cache = None
         try:
@@ -66,12 +96,124 @@ class SummaryOrchestrator:
     def get_counters(self) -> Dict[str, int]:
         return dict(self._counters)
 
-    def _bump(self, key: str) -> None:
+    def _bump(self, key: str, n: int = 1) -> None:
         try:
-            self._counters[key] = self._counters.get(key, 0) + 1
+            self._counters[key] = self._counters.get(key, 0) + n
         except Exception:
             pass
 
+    def _dedupe_threshold(self) -> float:
+        settings = self._settings_cache or _get_settings()
+        try:
+            return float(getattr(settings, 'AI_SUMMARY_VOICE_DEDUPE_THRESHOLD', DEFAULT_THRESHOLD))
+        except Exception:
+            return DEFAULT_THRESHOLD
+
+    def _sess_add_voice(self, sess: UserAgentSession, text: str | VoiceSegment) -> None:
+        """sess.add_voice_transcript + учёт отброшенных сессией почти-дубликатов в счётчиках."""
+        before, before_bytes = sess.dedupe_dropped, sess.dedupe_dropped_bytes
+        sess.add_voice_transcript(text)
+        if sess.dedupe_dropped != before:
+            self._bump('voice_dedupe_dropped', sess.dedupe_dropped - before)
+            self._bump('voice_dedupe_dropped_bytes', sess.dedupe_dropped_bytes - before_bytes)
+
+    # ---- Очистка памяти (TTL) ----
+    def start_sweeper(self) -> None:
+        if self._sweeper_task is not None and not self._sweeper_task.done():
+            return
+        self._sweeper_task = asyncio.create_task(self._sweeper())
+        logger.info("summary_v2: sweeper started")
+
+    async def shutdown(self) -> None:
+        if self._sweeper_task:
+            self._sweeper_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sweeper_task
+            self._sweeper_task = None
+        logger.info("summary_v2: sweeper stopped")
+
+    async def _sweeper(self) -> None:
+        while True:
+            settings = self._settings_cache or _get_settings()
+            await asyncio.sleep(max(5, int(getattr(settings, 'AI_SUMMARY_SWEEP_INTERVAL_SEC', 60) or 60)))
+            try:
+                self.sweep()
+            except Exception:
+                logger.warning("summary_v2: sweep failed", exc_info=True)
+
+    def sweep(self, now_ms: int | None = None) -> Dict[str, int]:
+        """Удаляет завершённые сессии и broadcast буферы старше TTL, логи комнат без сессий; обновляет gauges.
+
+        Активные (не остановленные) сессии не трогаем — их жизненный цикл определяет комната.
+        """
+        now_ms = now_ms if now_ms is not None else int(time.time()*1000)
+        settings = self._settings_cache or _get_settings()
+        session_ttl_ms = int(getattr(settings, 'AI_SUMMARY_SESSION_TTL_SEC', 1800)) * 1000
+        voice_ttl_ms = int(getattr(settings, 'AI_SUMMARY_BROADCAST_VOICE_TTL_SEC', 1800)) * 1000
+        evicted_sessions = 0
+        for key, sess in list(self._sessions.items()):
+            if sess.end_ts is not None and now_ms - sess.end_ts > session_ttl_ms:
+                self._sessions.pop(key, None)
+                evicted_sessions += 1
+        # Индекс комнат: оставляем только сессии, всё ещё зарегистрированные в _sessions
+        for room_id, lst in list(self._room_sessions.items()):
+            alive = [x for x in lst if self._sessions.get((x.room_id, x.user_id)) is x]
+            if alive:
+                self._room_sessions[room_id] = alive
+            else:
+                self._room_sessions.pop(room_id, None)
+        evicted_voice = 0
+        for room_id in list(self._room_broadcast_voice.keys()):
+            touched = self._room_broadcast_touched.get(room_id, 0)
+            if now_ms - touched > voice_ttl_ms:
+                self._room_broadcast_voice.pop(room_id, None)
+                self._room_broadcast_index.pop(room_id, None)
+                self._room_broadcast_touched.pop(room_id, None)
+                evicted_voice += 1
+        evicted_logs = 0
+        for room_id in self._log.rooms():
+            last = self._log.last_ts(room_id)
+            if room_id not in self._room_sessions and (last is None or now_ms - last > session_ttl_ms):
+                self._log.drop_room(room_id)
+                evicted_logs += 1
+        self._bump('sweep_runs')
+        self._bump('sweep_sessions_evicted', evicted_sessions)
+        self._bump('sweep_broadcast_evicted', evicted_voice)
+        self._bump('sweep_room_logs_evicted', evicted_logs)
+        stats = self.memory_stats()
+        if SUMMARY_SESSIONS_LIVE is not None:
+            with contextlib.suppress(Exception):
+                SUMMARY_SESSIONS_LIVE.labels(state='active').set(stats['sessions_active'])
+                SUMMARY_SESSIONS_LIVE.labels(state='ended').set(stats['sessions_ended'])
+        if SUMMARY_RETAINED_BYTES is not None:
+            with contextlib.suppress(Exception):
+                for kind in ('chat', 'voice', 'broadcast'):
+                    SUMMARY_RETAINED_BYTES.labels(kind=kind).set(stats[f'{kind}_bytes'])
+        if evicted_sessions or evicted_voice or evicted_logs:
+            logger.info("summary_v2: sweep evicted sessions=%s broadcast_rooms=%s room_logs=%s live=%s prompt_tokens_saved~%s/%s",
+                        evicted_sessions, evicted_voice, evicted_logs, stats['sessions_active'] + stats['sessions_ended'],
+                        stats['prompt_saved_tokens'], stats['prompt_plain_tokens'])
+        return {'sessions': evicted_sessions, 'broadcast_rooms': evicted_voice, 'room_logs': evicted_logs}
+
+    def memory_stats(self) -> Dict[str, int]:
+        """Сколько сессий и текста (байт, приблизительно) удерживается в памяти + экономия компактного промпта (prompt_*)."""
+        active = sum(1 for x in self._sessions.values() if x.end_ts is None)
+        voice_bytes = sum(len(v.text.encode('utf-8')) for x in self._sessions.values() for v in x._voice_segments)
+        broadcast_bytes = sum(len(v.text.encode('utf-8')) for bucket in self._room_broadcast_voice.values() for v in bucket)
+        compaction = get_compaction_stats()
+        return {
+            'sessions_active': active,
+            'sessions_ended': len(self._sessions) - active,
+            'rooms': len(self._room_sessions),
+            'chat_bytes': self._log.retained_bytes(),
+            'voice_bytes': voice_bytes,
+            'broadcast_bytes': broadcast_bytes,
+            'prompts_compacted': compaction['prompts'],
+            'prompt_plain_tokens': compaction['plain_tokens'],
+            'prompt_compact_tokens': compaction['compact_tokens'],
+            'prompt_saved_tokens': compaction['saved_tokens'],
+        }
+
     def add_chat(self, room_id: str, author_id: str | None, author_name: str | None, content: str) -> None:
         """Регистрация нового чат сообщения.
 
@@ -86,41 +228,54 @@ class SummaryOrchestrator:
                 # активная если не stop или msg.ts <= end
                 sess.add_chat(msg)
 
-    def add_voice_transcript(self, room_id: str, transcript: str, user_id: str | None = None) -> None:
+    def add_voice_transcript(self, room_id: str, transcript: str | VoiceSegment, user_id: str | None = None) -> None:
         """Добавление транскрипта.
 
+        Строка разбирается в VoiceSegment здесь один раз (meta captureTs / session, предложения);
+        готовый сегмент (store_transcript уже разобрал) принимается без повторного парсинга.
+
         Поведение:
         - user_id указан  -> персональная сессия пользователя (как раньше).
         - user_id отсутствует (None) -> сохраняем в room-wide broadcast буфер; позже он будет "подтянут" в любые персональные окна при генерации summary если у них нет собственных voice сегментов.
         """
         if not transcript:
             return
-        transcript = transcript.strip()
-        if not transcript:
+        seg = transcript if isinstance(transcript, VoiceSegment) else VoiceSegment.parse(transcript)
+        if not seg.text:
             return
         # Ветка broadcast (глобальный транскрипт)
         if user_id is None:
-            capture_ts = None
-            raw = transcript
-            # Извлекаем captureTs если есть meta
-            try:
-                if raw.startswith('[meta ') and 'captureTs=' in raw:
-                    end = raw.find(']')
-                    if end != -1:
-                        meta_block = raw[6:end].strip()
-                        for p in meta_block.split():
-                            if p.startswith('captureTs='):
-                                with contextlib.suppress(Exception):
-                                    capture_ts = int(p.split('=',1)[1])
-                        raw_body = raw[end+1:].lstrip()
-                        raw = raw_body or raw
-            except Exception:
-                pass
             # Сохраняем без фильтров stale (пользовательские окна сами проверят свежесть относительно start_ts)
             bucket = self._room_broadcast_voice.setdefault(room_id, [])
-            bucket.append((capture_ts, raw))
+            self._room_broadcast_touched[room_id] = int(time.time()*1000)
+            threshold = self._dedupe_threshold()
+            if threshold > 0:
+                index = self._room_broadcast_index.get(room_id)
+                if index is None or len(index) != len(bucket):
+                    # Индекс рассинхронизирован (буфер почищен/пересоздан) — строим заново
+                    index = NearDuplicateIndex(threshold)
+                    for old in bucket:
+                        index.add(index.check(old.text)[2])
+                    self._room_broadcast_index[room_id] = index
+                verdict, pos, sh = index.check(seg.text)
+                if verdict == DUPLICATE:
+                    self._bump('voice_dedupe_dropped')
+                    self._bump('voice_broadcast_dedupe_dropped_bytes', len(seg.text.encode('utf-8')))
+                    logger.debug("summary_v2: broadcast voice near-duplicate dropped room=%s chars=%s", room_id, len(seg.text))
+                    return
+                if verdict == SUPERSEDES:
+                    self._bump('voice_dedupe_dropped')
+                    self._bump('voice_broadcast_dedupe_dropped_bytes', len(bucket[pos].text.encode('utf-8')))
+                    if seg.capture_ts is None:
+                        seg = replace(seg, capture_ts=bucket[pos].capture_ts)
+                    bucket[pos] = seg
+                    index.replace(pos, sh)
+                    logger.debug("summary_v2: broadcast voice segment superseded room=%s pos=%s chars=%s", room_id, pos, len(seg.text))
+                    return
+                index.add(sh)
+            bucket.append(seg)
             self._bump('voice_broadcast_add_total')
-            logger.info("summary_v2: broadcast voice added room=%s captureTs=%s chars=%s", room_id, capture_ts, len(raw))
+            logger.info("summary_v2: broadcast voice added room=%s captureTs=%s chars=%s", room_id, seg.capture_ts, len(seg.text))
             return
         key = (room_id, user_id)
         sess = self._sessions.get(key)
@@ -134,49 +289,28 @@ class SummaryOrchestrator:
             self._room_sessions.setdefault(room_id, []).append(sess)
             logger.debug("summary_v2: auto-created session on voice transcript room=%s user=%s", room_id, user_id)
             self._bump('session_auto_created_on_voice')
-        technical = False
-        low = transcript.lower()
-        if low.startswith('(no audio') or low.startswith('(asr failed') or low.startswith('(asr exception') or low.startswith('(asr disabled'):
-            technical = True
-        # Парсинг мета-префикса (если мы его добавили в voice_capture)
-        meta_capture_ts = None
-        has_meta = False
-        try:
-            if transcript.startswith('[meta '):
-                end = transcript.find(']')
-                if end != -1:
-                    meta_block = transcript[6:end].strip()
-                    body = transcript[end+1:].lstrip()
-                    parts = meta_block.split()
-                    for p in parts:
-                        if p.startswith('captureTs='):
-                            try:
-                                meta_capture_ts = int(p.split('=',1)[1])
-                            except Exception:
-                                pass
-                    has_meta = True
-                    # Проверка на устаревание относительно старта текущей сессии
-                    if meta_capture_ts is not None and meta_capture_ts < (sess.start_ts - 150):
-                        logger.debug("summary_v2: ignore stale voice transcript by captureTs room=%s user=%s captureTs=%s start_ts=%s", room_id, user_id, meta_capture_ts, sess.start_ts)
-                        self._bump('voice_reject_stale')
-                        return
-                    transcript = body
-        except Exception:
-            pass
+        if seg.speaker is None:
+            # Копия: сегмент может быть общим (индекс комнаты, окна других пользователей)
+            seg = replace(seg, speaker=sess.user_name or user_id)
+        # Проверка на устаревание относительно старта текущей сессии (meta из voice_capture)
+        if seg.capture_ts is not None and seg.capture_ts < (sess.start_ts - 150):
+            logger.debug("summary_v2: ignore stale voice transcript by captureTs room=%s user=%s captureTs=%s start_ts=%s", room_id, user_id, seg.capture_ts, sess.start_ts)
+            self._bump('voice_reject_stale')
+            return
         # Если меты нет – применяем строгий фильтр: окно <=10s от старта и отсутствие предыдущих voice сегментов
-        if not has_meta:
+        if not seg.has_meta:
             now_ms = int(time.time()*1000)
-            voice_already = bool(getattr(sess, '_voice_segments', None))  # type: ignore[attr-defined]
+            voice_already = bool(sess._voice_segments)
             age = now_ms - sess.start_ts
             if age > 10_000 or voice_already:
                 logger.debug("summary_v2: reject voice(no-meta) room=%s user=%s age_ms=%s has_voice=%s", room_id, user_id, age, voice_already)
                 self._bump('voice_reject_no_meta')
                 return
-        sess.add_voice_transcript(transcript)
+        self._sess_add_voice(sess, seg)
         self._bump('voice_add_total')
         logger.info(
             "summary_v2: add_voice_transcript room=%s user=%s chars=%s technical=%s meta=%s captureTs=%s head=%r",
-            room_id, user_id, len(transcript), technical, has_meta, meta_capture_ts, transcript[:60]
+            room_id, user_id, len(seg.text), seg.is_placeholder, seg.has_meta, seg.capture_ts, seg.text[:60]
         )
 
     async def start_user_window(self, room_id: str, user_id: str, user_name: str | None = None) -> None:
@@ -184,19 +318,11 @@ class SummaryOrchestrator:
         key = (room_id, user_id)
         # перезапуск должен сбросить старую сессию
         old = self._sessions.get(key)
-        preserved_voice: list[str] | None = None
+        preserved_voice: list[VoiceSegment] | None = None
         if old:
-            try:
-                # Если в старой сессии уже есть voice сегменты и нет чат сообщений – НЕ теряем их
-                if getattr(old, '_voice_segments', None) and not getattr(old, '_messages', None):  # type: ignore[attr-defined]
-                    preserved_voice = []
-                    import re as _re
-                    for _seg in list(getattr(old, '_voice_segments')):  # type: ignore[attr-defined]
-                        # На всякий случай удалим meta, если вдруг просочилась
-                        cleaned = _re.sub(r'^\[meta [^]]*\]\s*', '', _seg.strip()) if isinstance(_seg, str) else _seg
-                        preserved_voice.append(cleaned)
-            except Exception:
-                preserved_voice = None
+            # Если в старой сессии уже есть voice сегменты и нет чат сообщений – НЕ теряем их (meta снята при приёме)
+            if old._voice_segments and not old._messages:
+                preserved_voice = list(old._voice_segments)
             # мягко помечаем остановку старой
             old.stop()
             with contextlib.suppress(ValueError):
@@ -206,7 +332,7 @@ class SummaryOrchestrator:
         if preserved_voice:
             for vseg in preserved_voice:
                 try:
-                    sess.add_voice_transcript(vseg)
+                    self._sess_add_voice(sess, vseg)
                 except Exception:
                     pass
             logger.debug("summary_v2: restored voice segments on restart room=%s user=%s count=%s", room_id, user_id, len(preserved_voice))
@@ -237,16 +363,14 @@ class SummaryOrchestrator:
                 voice_key = f"{room_id}:{user_id}"
                 with contextlib.suppress(Exception):
                     vt = await vc.get_transcript(voice_key)
-                    if vt and getattr(vt, 'text', None):
-                        txt = vt.text.strip()
-                        low = txt.lower()
-                        if txt and not low.startswith('(no audio chunks') and not low.startswith('(asr failed') and not low.startswith('(asr exception') and not low.startswith('(asr disabled'):
-                            sess = UserAgentSession(room_id=room_id, user_id=user_id)
-                            sess.add_voice_transcript(txt)
-                            self._sessions[key] = sess
-                            self._room_sessions.setdefault(room_id, []).append(sess)
-                            logger.warning("summary_v2: recovered session from voice transcript room=%s user=%s len=%s", room_id, user_id, len(txt))
-                            self._bump('session_recovered_from_voice')
+                    vseg = _transcript_segment(vt)
+                    if vseg is not None and vseg.text and not vseg.is_placeholder:
+                        sess = UserAgentSession(room_id=room_id, user_id=user_id)
+                        self._sess_add_voice(sess, vseg)
+                        self._sessions[key] = sess
+                        self._room_sessions.setdefault(room_id, []).append(sess)
+                        logger.warning("summary_v2: recovered session from voice transcript room=%s user=%s len=%s", room_id, user_id, len(vseg.text))
+                        self._bump('session_recovered_from_voice')
             except Exception:
                 pass
             if not sess:
@@ -268,41 +392,19 @@ class SummaryOrchestrator:
             if not msgs_now and not voice_now:
                 vc_fb = get_voice_collector()
                 vt_fb = await vc_fb.get_transcript(f"{room_id}:{user_id}")
-                if vt_fb and getattr(vt_fb, 'text', None):
-                    raw_fb = vt_fb.text.strip()
-                    if raw_fb and not raw_fb.lower().startswith('(no audio'):
-                        # Парсим мету чтобы достать captureTs (может отсутствовать — тогда считаем свежим)
-                        capture_ts_fb = None
-                        if raw_fb.startswith('[meta ') and 'captureTs=' in raw_fb:
-                            end_br = raw_fb.find(']')
-                            if end_br != -1:
-                                meta_block = raw_fb[6:end_br].strip()
-                                for part in meta_block.split():
-                                    if part.startswith('captureTs='):
-                                        with contextlib.suppress(Exception):
-                                            capture_ts_fb = int(part.split('=',1)[1])
-                        fresh_ok = True
-                        if capture_ts_fb is not None and capture_ts_fb < (sess.start_ts - 150):
-                            fresh_ok = False
-                        if fresh_ok:
-                            # Удаляем мета префикс при добавлении во внутренние сегменты, оставляем чистый текст
-                            if raw_fb.startswith('[meta ') and ']' in raw_fb:
-                                body_pos = raw_fb.find(']')
-                                if body_pos != -1:
-                                    raw_clean = raw_fb[body_pos+1:].lstrip()
-                                else:
-                                    raw_clean = raw_fb
-                            else:
-                                raw_clean = raw_fb
-                            sess.add_voice_transcript(raw_clean)
-                            logger.info("summary_v2: fallback attached stored transcript room=%s user=%s len=%s captureTs=%s start_ts=%s", room_id, user_id, len(raw_clean), capture_ts_fb, sess.start_ts)
-                            self._bump('voice_fallback_attached')
-                            # Попробуем удалить чтобы не переиспользовать
-                            with contextlib.suppress(Exception):
-                                await vc_fb.pop_transcript(f"{room_id}:{user_id}")
-                        else:
-                            logger.debug("summary_v2: fallback transcript stale room=%s user=%s captureTs=%s start_ts=%s", room_id, user_id, capture_ts_fb, sess.start_ts)
-                            self._bump('voice_fallback_stale')
+                seg_fb = _transcript_segment(vt_fb)
+                if seg_fb is not None and seg_fb.text and not seg_fb.text.lower().startswith('(no audio'):
+                    # captureTs разобран при сохранении (может отсутствовать — тогда считаем свежим)
+                    if seg_fb.capture_ts is None or seg_fb.capture_ts >= (sess.start_ts - 150):
+                        self._sess_add_voice(sess, seg_fb)
+                        logger.info("summary_v2: fallback attached stored transcript room=%s user=%s len=%s captureTs=%s start_ts=%s", room_id, user_id, len(seg_fb.text), seg_fb.capture_ts, sess.start_ts)
+                        self._bump('voice_fallback_attached')
+                        # Попробуем удалить чтобы не переиспользовать
+                        with contextlib.suppress(Exception):
+                            await vc_fb.pop_transcript(f"{room_id}:{user_id}")
+                    else:
+                        logger.debug("summary_v2: fallback transcript stale room=%s user=%s captureTs=%s start_ts=%s", room_id, user_id, seg_fb.capture_ts, sess.start_ts)
+                        self._bump('voice_fallback_stale')
         except Exception:
             pass
 
@@ -319,9 +421,9 @@ class SummaryOrchestrator:
                 with contextlib.suppress(Exception):
                     vc = get_voice_collector()
                     vt2 = await vc.get_transcript(f"{room_id}:{user_id}")
-                    if vt2 and vt2.generated_at > sess.end_ts:
-                        txt2 = (vt2.text or '').strip()
-                        if txt2 and not txt2.lower().startswith('(no audio'):
+                    seg2 = _transcript_segment(vt2)
+                    if seg2 is not None and vt2.generated_at > sess.end_ts:
+                        if seg2.text and not seg2.text.lower().startswith('(no audio'):
                             fresh_voice = True
                 if new_chat or fresh_voice:
                     # Создаём новую сессию с началом = макс(end_ts+1, first_new_ts)
@@ -340,8 +442,8 @@ class SummaryOrchestrator:
                         sess.add_chat(m)
                     if fresh_voice:
                         with contextlib.suppress(Exception):
-                            if vt2 and vt2.text:
-                                sess.add_voice_transcript(vt2.text.strip())
+                            if seg2 is not None:
+                                self._sess_add_voice(sess, seg2)
                             logger.info("summary_v2: auto-resumed session room=%s user=%s new_chat=%s fresh_voice=%s", room_id, user_id, new_chat, fresh_voice)
                             self._bump('session_auto_resumed')
             except Exception:
@@ -353,16 +455,15 @@ class SummaryOrchestrator:
                 voice_key = f"{room_id}:{user_id}"
                 with contextlib.suppress(Exception):
                     vt = await vc.get_transcript(voice_key)
-                    if vt and getattr(vt, 'text', None):
-                        txt = vt.text.strip()
-                        low = txt.lower()
+                    vseg = _transcript_segment(vt)
+                    if vseg is not None:
                         # Фильтрация: текст нетехнический и сгенерирован не раньше старта (разрешаем небольшой дрейф -100мс)
-                        if txt and not (low.startswith('(no audio chunks') or low.startswith('(asr failed') or low.startswith('(asr exception') or low.startswith('(asr disabled')) and vt.generated_at >= (sess.start_ts - 100):
-                            sess.add_voice_transcript(txt)
-                            logger.info("summary_v2: lazy attach voice transcript room=%s user=%s len=%s gen_at=%s start_ts=%s", room_id, user_id, len(txt), vt.generated_at, sess.start_ts)
+                        if vseg.text and not vseg.is_placeholder and vt.generated_at >= (sess.start_ts - 100):
+                            self._sess_add_voice(sess, vseg)
+                            logger.info("summary_v2: lazy attach voice transcript room=%s user=%s len=%s gen_at=%s start_ts=%s", room_id, user_id, len(vseg.text), vt.generated_at, sess.start_ts)
                             self._bump('voice_lazy_attached')
                         else:
-                            logger.debug("summary_v2: skip voice transcript placeholder/technical room=%s user=%s raw=%r", room_id, user_id, txt[:80] if txt else txt)
+                            logger.debug("summary_v2: skip voice transcript placeholder/technical room=%s user=%s raw=%r", room_id, user_id, vseg.text[:80])
                             self._bump('voice_lazy_skipped_placeholder')
             except Exception:
                 pass
@@ -371,13 +472,13 @@ class SummaryOrchestrator:
                 bkt = self._room_broadcast_voice.get(room_id, [])
                 if bkt:
                     imported = 0
-                    for capture_ts, raw in bkt[-50:]:  # ограничим хвост
+                    for bseg in bkt[-50:]:  # ограничим хвост
                         # фильтр устаревания: если capture_ts задан и явно до start_ts > 10s — пропустить
-                        if capture_ts is not None and capture_ts < (sess.start_ts - 10_000):
+                        if bseg.capture_ts is not None and bseg.capture_ts < (sess.start_ts - 10_000):
                             self._bump('voice_broadcast_reject_stale')
                             continue
                         try:
-                            sess.add_voice_transcript(raw)
+                            self._sess_add_voice(sess, bseg)
                             imported += 1
                         except Exception:
                             pass
@@ -396,7 +497,7 @@ class SummaryOrchestrator:
             if result.message_count == 0:
                 vseg = getattr(sess, '_voice_segments', [])  # type: ignore[attr-defined]
                 if vseg:
-                    lens = [len(x) for x in vseg]
+                    lens = [len(x.text) for x in vseg]
                     logger.warning("summary_v2: empty result but voice_segments present room=%s user=%s segments=%s lens=%s", room_id, user_id, len(vseg), lens)
         except Exception:
             pass
@@ -417,12 +518,11 @@ class SummaryOrchestrator:
                         with contextlib.suppress(Exception):
                             vc = get_voice_collector()
                             vt_wait = await vc.get_transcript(f"{room_id}:{user_id}")
-                            if vt_wait and getattr(vt_wait, 'text', None):
-                                txtw = vt_wait.text.strip()
-                                loww = txtw.lower()
-                                if txtw and not (loww.startswith('(no audio') or loww.startswith('(asr failed') or loww.startswith('(asr exception') or loww.startswith('(asr disabled')):
-                                    sess.add_voice_transcript(txtw)
-                                    logger.info("summary_v2: pending wait attached voice room=%s user=%s len=%s waited_ms=%s", room_id, user_id, len(txtw), wait_total)
+                            segw = _transcript_segment(vt_wait)
+                            if segw is not None:
+                                if segw.text and not segw.is_placeholder:
+                                    self._sess_add_voice(sess, segw)
+                                    logger.info("summary_v2: pending wait attached voice room=%s user=%s len=%s waited_ms=%s", room_id, user_id, len(segw.text), wait_total)
                                     self._bump('voice_pending_attached')
                                     result = await sess.build_summary(ai_provider=ai_provider, system_prompt=system_prompt)
                                     break
@@ -436,12 +536,11 @@ class SummaryOrchestrator:
                 if not getattr(sess, '_voice_segments', None):  # всё ещё нет
                     vc = get_voice_collector()
                     vt_retry = await vc.get_transcript(f"{room_id}:{user_id}")
-                    if vt_retry and getattr(vt_retry, 'text', None):
-                        txt2 = vt_retry.text.strip()
-                        low2 = txt2.lower()
-                        if txt2 and not (low2.startswith('(no audio') or low2.startswith('(asr failed') or low2.startswith('(asr exception') or low2.startswith('(asr disabled')) and vt_retry.generated_at >= (sess.start_ts - 100):
-                            sess.add_voice_transcript(txt2)
-                            logger.info("summary_v2: second-chance attach voice transcript room=%s user=%s len=%s", room_id, user_id, len(txt2))
+                    seg_retry = _transcript_segment(vt_retry)
+                    if seg_retry is not None:
+                        if seg_retry.text and not seg_retry.is_placeholder and vt_retry.generated_at >= (sess.start_ts - 100):
+                            self._sess_add_voice(sess, seg_retry)
+                            logger.info("summary_v2: second-chance attach voice transcript room=%s user=%s len=%s", room_id, user_id, len(seg_retry.text))
                             self._bump('voice_second_chance_attached')
                             result = await sess.build_summary(ai_provider=ai_provider, system_prompt=system_prompt)
             except Exception:
@@ -455,23 +554,15 @@ class SummaryOrchestrator:
         # Fallback: если всё равно пусто, но есть voice сегменты — синтезируем минимальное summary без AI
         if result.message_count == 0 and not getattr(result, 'used_voice', False):
             try:
-                vseg2 = getattr(sess, '_voice_segments', [])  # type: ignore[attr-defined]
-                meaningful = [s for s in vseg2 if s and len(s.strip()) > 10]
+                vseg2 = sess._voice_segments
+                # meta снята при приёме сегмента, предложения уже разбиты
+                meaningful = [s for s in vseg2 if len(s.text) > 10]
                 if meaningful:
                     logger.debug("summary_v2: entering voice fallback path room=%s user=%s segments=%s ai_provider=%s", room_id, user_id, len(meaningful), bool(ai_provider))
-                    import re as _re
-                    # Удаляем meta префиксы из сегментов (если есть)
-                    meaningful = [_re.sub(r'^\[meta [^]]*\]\s*', '', s.strip()) for s in meaningful]
-                    # Если вдруг после чистки остались пустые — отфильтровать
-                    meaningful = [s for s in meaningful if s]
-                    import re, time as _t
-                    merged_voice = " ".join(meaningful)
-                    norm = re.sub(r"\s+", " ", merged_voice.strip())
-                    parts = re.split(r'(?<=[.!?])\s+', norm)
-                    parts = [p.strip() for p in parts if p.strip()]
-                    head_parts = parts[:5] if parts else [norm]
+                    parts = [p for seg in meaningful for p in (seg.sentences or (seg.text,))]
+                    head_parts = parts[:5]
                     # Формируем псевдо‑сообщения для попытки AI суммаризации
-                    now_ms = int(_t.time()*1000)
+                    now_ms = int(time.time()*1000)
                     from .models import ChatMessage, SummaryResult as _SR
                     pseudo = [ChatMessage(room_id=room_id, author_id=None, author_name='voice', content=p, ts=now_ms) for p in head_parts]
                     # Прямая попытка AI генерации (без стратегии) чтобы исключить повторные NameError внутри strategy
@@ -494,12 +585,6 @@ class SummaryOrchestrator:
                         text = "Краткая выжимка по голосу (fallback):\n" + "\n".join(head_parts)
                         result = _SR(room_id=room_id, message_count=len(pseudo), generated_at=now_ms, summary_text=text, sources=pseudo, used_voice=True, participants=[])
                         logger.warning("summary_v2: synthesized fallback voice summary room=%s user=%s parts=%s", room_id, user_id, len(pseudo))
-                    # Диагностика: если в исходных сегментах был meta, отметим это
-                    try:
-                        if any(seg.strip().startswith('[meta ') for seg in vseg2):
-                            logger.debug("summary_v2: meta prefixes were present in voice_segments and stripped room=%s user=%s", room_id, user_id)
-                    except Exception:
-                        pass
             except Exception:
                 pass
 
@@ -509,26 +594,25 @@ class SummaryOrchestrator:
             self._settings_cache = settings
             if getattr(settings, 'AI_SUMMARY_VOICE_SCOPE', 'self').lower() == 'room':
                 # Собираем голосовые сегменты всех текущих активных сессий данной комнаты
-                room_sess = [s for (r, _u) , s in self._sessions.items() if r == room_id]
-                voice_buckets: list[tuple[str|None, list[str]]] = []  # (user_name, segments)
+                room_sess = list(self._room_sessions.get(room_id, []))
+                voice_buckets: list[tuple[str|None, list[VoiceSegment]]] = []  # (user_name, segments)
                 for s in room_sess:
-                    segs = getattr(s, '_voice_segments', [])  # type: ignore[attr-defined]
-                    # фильтруем технические и совсем короткие
-                    clean = []
-                    for raw in segs:
-                        if not raw or len(raw.strip()) <= 3:
-                            continue
-                        low = raw.lower().strip()
-                        if low.startswith('(no audio') or low.startswith('(asr failed') or low.startswith('(asr exception') or low.startswith('(asr disabled'):
-                            continue
-                        # уберём meta если есть
-                        if raw.startswith('[meta ') and ']' in raw:
-                            body_pos = raw.find(']')
-                            if body_pos != -1:
-                                raw = raw[body_pos+1:].lstrip()
-                        clean.append(raw.strip())
+                    # фильтруем технические и совсем короткие (meta снята при приёме)
+                    clean = [seg for seg in s._voice_segments if len(seg.text) > 3 and not seg.is_placeholder]
                     if clean:
                         voice_buckets.append((getattr(s, 'user_name', None) or getattr(s, 'user_id', None), clean))
+                # Один и тот же звук мог попасть в сессии нескольких говорящих (proxy / общий микрофон)
+                threshold = self._dedupe_threshold()
+                if threshold > 0 and len(voice_buckets) > 1:
+                    room_index = NearDuplicateIndex(threshold)
+                    deduped: list[tuple[str|None, list[VoiceSegment]]] = []
+                    for uname, segs in voice_buckets:
+                        kept, dropped = dedupe_segments(segs, index=room_index, key=lambda v: v.text)
+                        if dropped:
+                            self._bump('voice_room_dedupe_dropped_bytes', dropped)
+                        if kept:
+                            deduped.append((uname, kept))
+                    voice_buckets = deduped
                 if voice_buckets and sum(len(v) for _n, v in voice_buckets) > 0:
                     if len(voice_buckets) == 1:
                         try:
@@ -540,14 +624,9 @@ class SummaryOrchestrator:
                     combined_voice_msgs: list[ChatMessage] = []
                     now_ms = int(time.time()*1000)
                     sentence_limit = 160  # защитный лимит
-                    import re
                     total_sentences = 0
                     for uname, segs in voice_buckets:
-                        merged_text = " ".join(segs)
-                        norm = re.sub(r"\s+", " ", merged_text.strip())
-                        parts = re.split(r'(?<=[.!?])\s+', norm)
-                        parts = [p.strip() for p in parts if p.strip()]
-                        for p in parts:
+                        for p in (p for seg in segs for p in seg.sentences):
                             combined_voice_msgs.append(ChatMessage(room_id=room_id, author_id=None, author_name=uname, content=p, ts=now_ms))
                             total_sentences += 1
                             if total_sentences >= sentence_limit:
@@ -559,12 +638,15 @@ class SummaryOrchestrator:
                         # Ограничим исходные чат сообщения (из текущей персональной сессии)
                         base_msgs = getattr(sess, '_messages', [])
                         tail_limit = 200
+                        base_tally = getattr(sess, '_tally', None)
                         if len(base_msgs) > tail_limit:
                             base_msgs = base_msgs[-tail_limit:]
+                            base_tally = None  # хвост окна — разбивку считаем по нему
                         merged_msgs = list(base_msgs) + combined_voice_msgs
+                        room_tally = base_tally.extended(combined_voice_msgs) if base_tally is not None else None
                         # Применим комбинированную стратегию напрямую
                         try:
-                            ai_re_summary = await self._combined_strategy.build(merged_msgs, ai_provider=ai_provider, system_prompt=system_prompt)
+                            ai_re_summary = await self._combined_strategy.build(merged_msgs, ai_provider=ai_provider, system_prompt=system_prompt, tally=room_tally)
                             if ai_re_summary and ai_re_summary.message_count > 0:
                                 logger.debug("summary_v2: room-voice aggregation applied room=%s user=%s participants=%s voice_sentences=%s", room_id, user_id, len(voice_buckets), len(combined_voice_msgs))
                                 result = ai_re_summary
@@ -579,6 +661,96 @@ class SummaryOrchestrator:
             pass
         return result
 
+    async def build_room_summaries(self, *, room_id: str, ai_provider, db_session, user_ids: List[str] | None = None) -> Dict[str, SummaryResult]:
+        """Batch режим: персональные summary всех владельцев агентов комнаты одним запросом к провайдеру.
+
+        Общий контент = объединение окон всех сессий комнаты (чат без повторов + голос с именем говорящего).
+        Каждый пользователь получает разметку своего окна (номера строк) и персональный prompt.
+        Пользователи, для которых batch не дал результата (порог, ошибка провайдера, нет тега в ответе),
+        досчитываются обычным build_personal_summary. Возвращает user_id -> SummaryResult.
+        """
+        sessions: Dict[str, UserAgentSession] = {}
+        for s in self._room_sessions.get(room_id, []):
+            if user_ids is not None and s.user_id not in user_ids:
+                continue
+            sessions[s.user_id] = s
+        if not sessions:
+            return {}
+        settings = self._settings_cache or _get_settings()
+        room_scope = getattr(settings, 'AI_SUMMARY_VOICE_SCOPE', 'self').lower() == 'room'
+        # 1. Чат: одни и те же объекты ChatMessage разосланы во все окна — дедуп по identity
+        chat_by_id: Dict[int, ChatMessage] = {}
+        for s in sessions.values():
+            for m in s._messages:
+                if s.end_ts is None or m.ts <= s.end_ts:
+                    chat_by_id[id(m)] = m
+        shared: List[ChatMessage] = sorted(chat_by_id.values(), key=lambda m: m.ts)[-1000:]
+        line_of: Dict[int, int] = {id(m): i + 1 for i, m in enumerate(shared)}
+        # 2. Голос: по одному блоку на говорящего
+        voice_lines: Dict[str, List[int]] = {}
+        now_ms = int(time.time()*1000)
+        # room режим: весь голос уходит всем окнам — отсекаем почти-дубликаты между говорящими
+        threshold = self._dedupe_threshold()
+        room_index = NearDuplicateIndex(threshold) if room_scope and threshold > 0 else None
+        for uid, s in sessions.items():
+            segs = s.informative_voice()
+            if sum(len(v.text) for v in segs) <= 10:
+                continue
+            if room_index is not None:
+                segs, dropped = dedupe_segments(segs, index=room_index, key=lambda v: v.text)
+                if dropped:
+                    self._bump('voice_room_dedupe_dropped_bytes', dropped)
+                if not segs:
+                    continue
+            ids: List[int] = []
+            for p in (p for v in segs for p in v.sentences):
+                shared.append(ChatMessage(room_id=room_id, author_id=uid, author_name=s.user_name or uid, content=p, ts=now_ms))
+                ids.append(len(shared))
+            voice_lines[uid] = ids
+        all_voice_ids = [i for ids in voice_lines.values() for i in ids]
+        # 3. Окна пользователей
+        targets: List[BatchTarget] = []
+        for n, (uid, s) in enumerate(sessions.items(), start=1):
+            ids = [line_of[id(m)] for m in s._messages if id(m) in line_of and (s.end_ts is None or m.ts <= s.end_ts)]
+            ids += all_voice_ids if room_scope else voice_lines.get(uid, [])
+            if not ids:
+                continue
+            system_prompt: str | None = None
+            if db_session is not None:
+                with contextlib.suppress(Exception):
+                    system_prompt = await get_user_system_prompt(db_session, uid)
+            targets.append(BatchTarget(tag=f"U{n}", user_id=uid, user_name=s.user_name, line_ids=sorted(set(ids)), system_prompt=system_prompt))
+        results: Dict[str, SummaryResult] = {}
+        if targets:
+            results = await self._batch_strategy.build_batch(shared, targets, ai_provider=ai_provider)
+            self._bump('batch_room_builds')
+            voice_id_set = set(all_voice_ids)
+            for t in targets:
+                res = results.get(t.user_id)
+                if res is not None:
+                    res.used_voice = any(i in voice_id_set for i in t.line_ids)
+                    self._bump('batch_users_served')
+            logger.info(
+                "summary_v2: batch room build room=%s targets=%s served=%s shared_lines=%s window_lines=%s",
+                room_id, len(targets), len(results), len(shared), sum(len(t.line_ids) for t in targets)
+            )
+        # 4. Fallback: персональные сборки для окон с контентом, не покрытых batch (пустые окна пропускаем)
+        for t in targets:
+            if t.user_id in results:
+                continue
+            self._bump('batch_fallback_users')
+            with contextlib.suppress(Exception):
+                results[t.user_id] = await self.build_personal_summary(room_id=room_id, user_id=t.user_id, ai_provider=ai_provider, db_session=db_session)
+        return results
+
+def _transcript_segment(vt) -> VoiceSegment | None:  # type: ignore[no-untyped-def]
+    """VoiceSegment сохранённого транскрипта (разобран в store_transcript; старые объекты — разбираем здесь)."""
+    if vt is None or not getattr(vt, 'text', None):
+        return None
+    seg = getattr(vt, 'segment', None)
+    return seg if seg is not None else VoiceSegment.parse(vt.text)
+
+
 # singleton accessor
 _orchestrator_singleton: SummaryOrchestrator | None = None
 
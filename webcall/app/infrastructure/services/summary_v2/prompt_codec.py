@@ -0,0 +1,109 @@
+"""Компактное представление сообщений для AI подсказки.
+
+`ChatMessage.to_plain` даёт `[1758649999999] Long Display Name: text` — на каждой строке
+13-значный epoch и полное имя. Кодек:
+- заменяет говорящих короткими псевдонимами (A, B, ...) с легендой в первой строке;
+- выводит относительное время корзинами (`[+5m]`) только когда корзина меняется;
+- склеивает подряд идущие реплики одного говорящего внутри одной корзины;
+- оценивает экономию токенов относительно plain формата.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List
+import string
+
+from .models import ChatMessage
+
+_ALIASES = string.ascii_uppercase
+_MERGE_SEP = " / "
+LEGEND_PREFIX = "Участники: "
+
+
+@dataclass(slots=True)
+class CompactPrompt:
+    lines: List[str]
+    legend: str
+    aliases: Dict[str, str]  # имя говорящего -> псевдоним
+    plain_tokens: int
+    compact_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.plain_tokens - self.compact_tokens)
+
+    def as_messages(self) -> List[str]:
+        """Список строк для generate_summary: легенда + тело."""
+        return ([self.legend] if self.legend else []) + self.lines
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка токенов без токенизатора: ~4 ASCII символа или ~2 прочих (кириллица) на токен."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars + 1) // 2
+
+
+def _alias(n: int) -> str:
+    if n < len(_ALIASES):
+        return _ALIASES[n]
+    return f"P{n + 1}"
+
+
+def _speaker(m: ChatMessage) -> str:
+    return m.author_name or m.author_id or "anon"
+
+
+def _bucket_label(delta_ms: int, bucket_sec: int) -> str:
+    minutes = (max(0, delta_ms) // (bucket_sec * 1000)) * bucket_sec // 60
+    if minutes >= 60:
+        return f"[+{minutes // 60}h{minutes % 60:02d}m]"
+    return f"[+{minutes}m]"
+
+
+def encode_compact(msgs: List[ChatMessage], *, bucket_sec: int = 60, merge: bool = True) -> CompactPrompt:
+    """Кодирует сообщения в компактные строки.
+
+    merge=False сохраняет соответствие 1:1 строк и сообщений (нужно batch режиму с номерами строк).
+    """
+    bucket_sec = max(60, int(bucket_sec or 60))
+    aliases: Dict[str, str] = {}
+    lines: List[str] = []
+    base_ts = min((m.ts for m in msgs), default=0)
+    last_label: str | None = None
+    last_alias: str | None = None
+    for m in msgs:
+        who = _speaker(m)
+        alias = aliases.get(who)
+        if alias is None:
+            alias = aliases[who] = _alias(len(aliases))
+        label = _bucket_label(m.ts - base_ts, bucket_sec)
+        content = m.content.strip()
+        if merge and lines and label == last_label and alias == last_alias:
+            lines[-1] = lines[-1] + _MERGE_SEP + content
+            continue
+        prefix = f"{label} " if label != last_label else ""
+        lines.append(f"{prefix}{alias}: {content}")
+        last_label, last_alias = label, alias
+    legend = (LEGEND_PREFIX + "; ".join(f"{a}={name}" for name, a in aliases.items())) if aliases else ""
+    plain_tokens = sum(estimate_tokens(m.to_plain()) for m in msgs)
+    compact_tokens = estimate_tokens(legend) + sum(estimate_tokens(l) for l in lines)
+    return CompactPrompt(lines=lines, legend=legend, aliases=aliases, plain_tokens=plain_tokens, compact_tokens=compact_tokens)
+
+
+# Накопительная статистика экономии (для диагностики, аналогично счётчикам оркестратора)
+_totals: Dict[str, int] = {'prompts': 0, 'plain_tokens': 0, 'compact_tokens': 0}
+
+
+def record(cp: CompactPrompt) -> None:
+    _totals['prompts'] += 1
+    _totals['plain_tokens'] += cp.plain_tokens
+    _totals['compact_tokens'] += cp.compact_tokens
+
+
+def get_compaction_stats() -> Dict[str, int]:
+    out = dict(_totals)
+    out['saved_tokens'] = max(0, out['plain_tokens'] - out['compact_tokens'])
+    return out
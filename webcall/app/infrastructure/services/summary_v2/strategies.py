@@ -1,12 +1,18 @@
 from __future__ import annotations
-from typing import List, Optional
-from .models import ChatMessage, SummaryResult, is_technical, ParticipantSummary
+from typing import Dict, List, Optional
+from collections import deque
+from .models import BatchTarget, ChatMessage, SummaryResult, is_technical, ParticipantSummary
+from .prompt_codec import encode_compact, record as _record_compaction
 from ...config import get_settings  # модульный импорт: использовать везде без локального переимпорта
+import logging
 import time
 
+logger = logging.getLogger(__name__)
+
 
 class BaseStrategy:
-    async def build(self, msgs: List[ChatMessage], *, ai_provider, system_prompt: str | None) -> SummaryResult:
+    async def build(self, msgs: List[ChatMessage], *, ai_provider, system_prompt: str | None, tally: ParticipantTally | None = None) -> SummaryResult:
+        """tally — готовая разбивка по участникам для msgs (если её ведёт вызывающий); иначе считается проходом."""
         raise NotImplementedError
 
     def _fallback(self, msgs: List[ChatMessage], *, prefix: str = "") -> str:
@@ -17,42 +23,84 @@ class BaseStrategy:
         body = "\n".join(lines)
         return (prefix + "\n" if prefix else "") + "Краткая выжимка:\n" + body
 
+    def _prompt_lines(self, msgs: List[ChatMessage], ai_provider, *, merge: bool = True) -> tuple[List[str], str | None]:
+        """Строки подсказки для провайдера: компактный формат (если провайдер и настройки разрешают) или to_plain.
+
+        Возвращает (строки, легенда). В персональном режиме легенда уже первая строка списка.
+        """
+        settings = get_settings()
+        if not (getattr(ai_provider, 'compact_prompt', False) and getattr(settings, 'AI_SUMMARY_COMPACT_PROMPT', True)):
+            return [m.to_plain() for m in msgs], None
+        cp = encode_compact(msgs, bucket_sec=getattr(settings, 'AI_SUMMARY_COMPACT_TIME_BUCKET_SEC', 60), merge=merge)
+        _record_compaction(cp)
+        logger.debug(
+            "summary_v2: compact prompt msgs=%s lines=%s speakers=%s tokens plain~%s compact~%s saved~%s",
+            len(msgs), len(cp.lines), len(cp.aliases), cp.plain_tokens, cp.compact_tokens, cp.saved_tokens
+        )
+        if merge:
+            return cp.as_messages(), cp.legend
+        return cp.lines, cp.legend
+
+
+class ParticipantTally:
+    """Инкрементальная разбивка по участникам: счётчик и хвост последних сообщений на автора.
+
+    Обновляется за O(1) при добавлении сообщения (сессия ведёт её в add_chat), так что breakdown
+    не требует прохода по всему окну. Правила те же, что у _build_participant_breakdown:
+    технические сообщения игнорируются, sample — до 5 последних сообщений участника.
+    """
+    __slots__ = ('_buckets',)
+
+    SAMPLE_SIZE = 5
+
+    def __init__(self) -> None:
+        # (author_id, author_name) -> [count, deque(последние тексты)]
+        self._buckets: Dict[tuple[str | None, str | None], list] = {}
+
+    def add(self, m: ChatMessage) -> None:
+        if is_technical(m):
+            return
+        bucket = self._buckets.get((m.author_id, m.author_name))
+        if bucket is None:
+            bucket = self._buckets[(m.author_id, m.author_name)] = [0, deque(maxlen=self.SAMPLE_SIZE)]
+        bucket[0] += 1
+        bucket[1].append(m.content)
+
+    def extended(self, msgs: List[ChatMessage]) -> 'ParticipantTally':
+        """Копия с дополнительными сообщениями (голосовые псевдо-сообщения поверх чата окна)."""
+        other = ParticipantTally()
+        other._buckets = {k: [c, deque(d, maxlen=self.SAMPLE_SIZE)] for k, (c, d) in self._buckets.items()}
+        for m in msgs:
+            other.add(m)
+        return other
+
+    def snapshot(self) -> List[ParticipantSummary]:
+        """Сортировка по убыванию количества сообщений, затем по имени."""
+        parts = [
+            ParticipantSummary(participant_id=pid, participant_name=pname, message_count=count, sample_messages=list(tail))
+            for (pid, pname), (count, tail) in self._buckets.items()
+        ]
+        parts.sort(key=lambda p: (-p.message_count, (p.participant_name or p.participant_id or "")))
+        return parts
+
 
 def _build_participant_breakdown(msgs: List[ChatMessage]) -> List[ParticipantSummary]:
     """Группирует сообщения по (author_id, author_name) и формирует короткую выборку.
 
-    Правила:
-    - Игнорируем технические сообщения.
-    - Для каждого участника берём последние до 5 сообщений как sample.
-    - Сортировка по убыванию количества сообщений, затем по имени.
+    Полный проход по сообщениям — для окон без инкрементальной ParticipantTally (batch, voice-only).
     """
-    buckets: dict[tuple[str | None, str | None], List[ChatMessage]] = {}
+    tally = ParticipantTally()
     for m in msgs:
-        if is_technical(m):
-            continue
-        key = (m.author_id, m.author_name)
-        buckets.setdefault(key, []).append(m)
-    parts: List[ParticipantSummary] = []
-    for (pid, pname), group in buckets.items():
-        # последние 5 сообщений участника
-        tail = group[-5:]
-        parts.append(ParticipantSummary(
-            participant_id=pid,
-            participant_name=pname,
-            message_count=len(group),
-            sample_messages=[g.content for g in tail]
-        ))
-    parts.sort(key=lambda p: (-p.message_count, (p.participant_name or p.participant_id or "")))
-    return parts
+        tally.add(m)
+    return tally.snapshot()
 
 
 class ChatStrategy(BaseStrategy):
-    async def build(self, msgs: List[ChatMessage], *, ai_provider, system_prompt: str | None) -> SummaryResult:
+    async def build(self, msgs: List[ChatMessage], *, ai_provider, system_prompt: str | None, tally: ParticipantTally | None = None) -> SummaryResult:
         settings = get_settings()
         user_msgs = [m for m in msgs if not is_technical(m)]
         if not user_msgs:
             return SummaryResult.empty(msgs[0].room_id if msgs else "unknown")
-        plain = [m.to_plain() for m in user_msgs]
         total_chars = sum(len(m.content) for m in user_msgs)
         min_chars = getattr(settings, 'AI_SUMMARY_MIN_CHARS', 0) or 0
         # Адаптивный порог: если сообщений мало (<=5) и суммарно >= 10 символов, разрешаем AI даже если не достигнут глобальный min_chars
@@ -65,6 +113,7 @@ class ChatStrategy(BaseStrategy):
             pass
         summary_text: str
         if ai_provider and settings.AI_SUMMARY_ENABLED and (total_chars >= min_chars or small_dialog_force_ai):
+            plain, _ = self._prompt_lines(user_msgs, ai_provider)
             try:
                 try:
                     summary_text = await ai_provider.generate_summary(plain, system_prompt)  # type: ignore
@@ -94,20 +143,19 @@ class ChatStrategy(BaseStrategy):
         # Используем модульный импорт get_settings (уже импортирован выше) — избегаем локального затенения
         try:
             if get_settings().AI_SUMMARY_PARTICIPANT_BREAKDOWN:
-                participants = _build_participant_breakdown(user_msgs)
+                participants = tally.snapshot() if tally is not None else _build_participant_breakdown(user_msgs)
         except Exception:
             participants = None
         return SummaryResult(room_id=user_msgs[0].room_id, message_count=len(user_msgs), generated_at=int(time.time()*1000), summary_text=summary_text, sources=tail_src, participants=participants)
 
 
 class CombinedVoiceChatStrategy(BaseStrategy):
-    async def build(self, msgs: List[ChatMessage], *, ai_provider, system_prompt: str | None) -> SummaryResult:
+    async def build(self, msgs: List[ChatMessage], *, ai_provider, system_prompt: str | None, tally: ParticipantTally | None = None) -> SummaryResult:
         # msgs уже включает voice pseudo messages + chat
         chat_part = [m for m in msgs if not is_technical(m)]
         if not chat_part:
             return SummaryResult.empty(msgs[0].room_id if msgs else "unknown")
         settings = get_settings()
-        plain = [m.to_plain() for m in chat_part]
         total_chars = sum(len(m.content) for m in chat_part)
         min_chars = getattr(settings, 'AI_SUMMARY_MIN_CHARS', 0) or 0
         # Аналог адаптивного режима для коротких голосовых / смешанных отрывков
@@ -120,6 +168,7 @@ class CombinedVoiceChatStrategy(BaseStrategy):
             pass
         summary_text: str
         if ai_provider and settings.AI_SUMMARY_ENABLED and (total_chars >= min_chars or small_dialog_force_ai):
+            plain, _ = self._prompt_lines(chat_part, ai_provider)
             try:
                 try:
                     summary_text = await ai_provider.generate_summary(plain, system_prompt)  # type: ignore
@@ -147,7 +196,65 @@ class CombinedVoiceChatStrategy(BaseStrategy):
         # Используем ранее импортированный get_settings вместо повторного локального импорта
         try:
             if get_settings().AI_SUMMARY_PARTICIPANT_BREAKDOWN:
-                participants = _build_participant_breakdown(chat_part)
+                participants = tally.snapshot() if tally is not None else _build_participant_breakdown(chat_part)
         except Exception:
             participants = None
         return SummaryResult(room_id=chat_part[0].room_id, message_count=len(chat_part), generated_at=int(time.time()*1000), summary_text=summary_text, sources=tail_src, used_voice=True, participants=participants)
+
+
+class BatchRoomStrategy(BaseStrategy):
+    """Пакетная стратегия для конца комнаты: один вызов провайдера на всех владельцев агентов.
+
+    Общий контент (чат + голос) передаётся единожды, окна пользователей — номерами строк.
+    Возвращает только тех пользователей, для которых провайдер вернул текст; остальные
+    оркестратор досчитывает персональными запросами.
+    """
+    async def build_batch(self, shared: List[ChatMessage], targets: List[BatchTarget], *, ai_provider) -> Dict[str, SummaryResult]:
+        settings = get_settings()
+        if not shared or not targets or not ai_provider or not settings.AI_SUMMARY_ENABLED:
+            return {}
+        if not hasattr(ai_provider, 'generate_batch_summary'):
+            return {}
+        min_chars = getattr(settings, 'AI_SUMMARY_MIN_CHARS', 0) or 0
+        windows: Dict[str, List[ChatMessage]] = {}
+        eligible: List[BatchTarget] = []
+        for t in targets:
+            window = [shared[i - 1] for i in t.line_ids if 0 < i <= len(shared)]
+            user_msgs = [m for m in window if not is_technical(m)]
+            total_chars = sum(len(m.content) for m in user_msgs)
+            # Тот же порог что и в CombinedVoiceChatStrategy: короткие окна уходят в персональный fallback
+            if not user_msgs or (total_chars < min_chars and not (len(user_msgs) <= 8 and total_chars >= 10)):
+                continue
+            windows[t.tag] = user_msgs
+            eligible.append(t)
+        if not eligible:
+            return {}
+        # Без склейки реплик: номера строк окон должны совпадать с позициями в shared
+        plain, legend = self._prompt_lines(shared, ai_provider, merge=False)
+        try:
+            if legend:
+                texts = await ai_provider.generate_batch_summary(plain, eligible, legend=legend)  # type: ignore
+            else:
+                texts = await ai_provider.generate_batch_summary(plain, eligible)  # type: ignore
+        except NotImplementedError:
+            return {}
+        except Exception as e:
+            logger.warning("summary_v2: batch strategy provider error targets=%s err=%s", len(eligible), e)
+            return {}
+        out: Dict[str, SummaryResult] = {}
+        now_ms = int(time.time()*1000)
+        for t in eligible:
+            text = (texts or {}).get(t.tag)
+            if not text:
+                continue
+            user_msgs = windows[t.tag]
+            tail_src = user_msgs[-5:]
+            summary_text = text.rstrip() + "\n\nИсточники (последние):\n" + "\n".join(m.content for m in tail_src)
+            participants = None
+            try:
+                if settings.AI_SUMMARY_PARTICIPANT_BREAKDOWN:
+                    participants = _build_participant_breakdown(user_msgs)
+            except Exception:
+                participants = None
+            out[t.user_id] = SummaryResult(room_id=user_msgs[0].room_id, message_count=len(user_msgs), generated_at=now_ms, summary_text=summary_text, sources=tail_src, participants=participants)
+        return out
@@ -12,22 +12,26 @@ from __future__ import annotations
 """
 from dataclasses import dataclass, field
 from typing import List, Optional
-import time, re
-from .models import ChatMessage, SummaryResult, TECHNICAL_PATTERNS, ParticipantSummary
+import time
+from .models import ChatMessage, SummaryResult, ParticipantSummary, VoiceSegment, is_technical_text
+from .dedupe import NearDuplicateIndex, DUPLICATE, SUPERSEDES, DEFAULT_THRESHOLD, shingles
+from ...config import get_settings
 import logging
 
 logger = logging.getLogger(__name__)
-from .strategies import ChatStrategy, CombinedVoiceChatStrategy
+from .strategies import ChatStrategy, CombinedVoiceChatStrategy, ParticipantTally
 
 
-def _is_technical_text(text: str) -> bool:
-    low = text.lower().strip()
-    if not low:
-        return True
-    for p in TECHNICAL_PATTERNS:
-        if p in low:
-            return True
-    return False
+def _new_voice_index() -> NearDuplicateIndex:
+    try:
+        threshold = float(getattr(get_settings(), 'AI_SUMMARY_VOICE_DEDUPE_THRESHOLD', DEFAULT_THRESHOLD))
+    except Exception:
+        threshold = DEFAULT_THRESHOLD
+    return NearDuplicateIndex(threshold)
+
+
+# Совместимость: проверка техничности теперь общая (models.is_technical_text)
+_is_technical_text = is_technical_text
 
 
 @dataclass
@@ -38,8 +42,15 @@ class UserAgentSession:
     start_ts: int = field(default_factory=lambda: int(time.time()*1000))
     end_ts: Optional[int] = None
     _messages: List[ChatMessage] = field(default_factory=list)  # только пользовательское окно
-    # Список голосовых сегментов (в порядке поступления). Поддерживает несколько записей.
-    _voice_segments: List[str] = field(default_factory=list)
+    # Разбивка чата по участникам, обновляется в add_chat (breakdown без прохода по окну)
+    _tally: ParticipantTally = field(default_factory=ParticipantTally, init=False, repr=False)
+    # Список голосовых сегментов (в порядке поступления), уже разобранных: без meta, с готовыми предложениями.
+    _voice_segments: List[VoiceSegment] = field(default_factory=list)
+    # Шинглы сегментов (позиции совпадают с _voice_segments) для отсева почти-дубликатов
+    _voice_index: NearDuplicateIndex = field(default_factory=_new_voice_index, init=False, repr=False)
+    # Отброшено почти-дубликатов (штук / байт текста)
+    dedupe_dropped: int = field(default=0, init=False)
+    dedupe_dropped_bytes: int = field(default=0, init=False)
     _chat_strategy: ChatStrategy = field(default_factory=ChatStrategy, init=False, repr=False)
     _combined_strategy: CombinedVoiceChatStrategy = field(default_factory=CombinedVoiceChatStrategy, init=False, repr=False)
 
@@ -52,47 +63,77 @@ class UserAgentSession:
         if self.end_ts is not None and msg.ts > self.end_ts:
             return
         self._messages.append(msg)
+        self._tally.add(msg)
 
-    def add_voice_transcript(self, transcript: str) -> None:
-        """Добавить транскрипт.
+    def add_voice_transcript(self, transcript: str | VoiceSegment) -> None:
+        """Добавить транскрипт (строку разбираем в VoiceSegment один раз здесь, сегмент принимаем как есть).
 
         Правила:
         - Пустые строки игнорируются.
         - Технические плейсхолдеры добавляются только если ещё нет ни одного нетехнического текста.
         - Если новый нетехнический сегмент является надстройкой предыдущего (содержит его целиком) — заменяем последний.
-        - Дубликаты игнорируем.
+        - Дубликаты игнорируем, в том числе почти-дубликаты (Jaccard по шинглам, см. dedupe.py):
+          перекрывающиеся выходы Whisper / proxy сегменты. Сегмент, поглощающий ранее принятый, заменяет его.
         """
         if not transcript:
             return
-        txt = transcript.strip()
+        seg = transcript if isinstance(transcript, VoiceSegment) else VoiceSegment.parse(transcript, speaker=self.user_name or self.user_id)
+        txt = seg.text
         if not txt:
             return
-        is_tech = _is_technical_text(txt)
-        if is_tech:
-            if any(not _is_technical_text(s) for s in self._voice_segments):
+        if seg.technical:
+            if any(not s.technical for s in self._voice_segments):
                 return
-            if self._voice_segments and self._voice_segments[-1] == txt:
+            if self._voice_segments and self._voice_segments[-1].text == txt:
                 return
-            self._voice_segments.append(txt)
+            self._voice_segments.append(seg)
+            self._voice_index.add(frozenset())
             return
         # Нормальный текст
         if self._voice_segments:
             last = self._voice_segments[-1]
             # last subset of new -> replace; new subset of last -> ignore; identical -> ignore
-            if txt == last or (len(txt) < len(last) and txt in last):
+            if txt == last.text or (len(txt) < len(last.text) and txt in last.text):
+                return
+            if len(txt) > len(last.text) and last.text in txt and not last.technical:
+                self._voice_segments[-1] = seg
+                self._voice_index.replace(len(self._voice_segments) - 1, shingles(txt))
                 return
-            if len(txt) > len(last) and last in txt and not _is_technical_text(last):
-                self._voice_segments[-1] = txt
+        if self._voice_index.threshold > 0:
+            verdict, pos, sh = self._voice_index.check(txt)
+            if verdict == DUPLICATE:
+                self.dedupe_dropped += 1
+                self.dedupe_dropped_bytes += len(txt.encode('utf-8'))
                 return
-        self._voice_segments.append(txt)
+            if verdict == SUPERSEDES:
+                self.dedupe_dropped += 1
+                self.dedupe_dropped_bytes += len(self._voice_segments[pos].text.encode('utf-8'))
+                self._voice_segments[pos] = seg
+                self._voice_index.replace(pos, sh)
+                return
+        else:
+            sh = frozenset()
+        self._voice_segments.append(seg)
+        self._voice_index.add(sh)
 
+    def informative_voice(self) -> List[VoiceSegment]:
+        """Нетехнические сегменты (пусто, если голоса нет или он только из плейсхолдеров)."""
+        return [s for s in self._voice_segments if not s.technical]
 
     def merged_voice_text(self) -> Optional[str]:
         if not self._voice_segments:
             return None
-        non_tech = [s for s in self._voice_segments if not _is_technical_text(s)]
-        base = non_tech if non_tech else self._voice_segments
-        return " \n".join(base)
+        base = self.informative_voice() or self._voice_segments
+        return " \n".join(s.text for s in base)
+
+    def _voice_messages(self, author_name: str | None = 'voice') -> List[ChatMessage]:
+        """Псевдо-сообщения из готовых предложений сегментов (без повторного split)."""
+        now_ms = int(time.time()*1000)
+        sentences = [p for seg in self.informative_voice() for p in seg.sentences]
+        if not sentences:
+            merged = (self.merged_voice_text() or '').strip()
+            sentences = [merged] if merged else []
+        return [ChatMessage(room_id=self.room_id, author_id=None, author_name=author_name, content=p, ts=now_ms) for p in sentences]
 
     def stop(self) -> None:
         if self.end_ts is None:
@@ -102,16 +143,11 @@ class UserAgentSession:
         # Отфильтруем по end_ts если окно завершено (теоретически могли добавить позже)
         msgs = [m for m in self._messages if (self.end_ts is None or m.ts <= self.end_ts)]
         voice_text = self.merged_voice_text()
+        voice_ok = bool(voice_text and len(voice_text.strip()) > 10 and not _is_technical_text(voice_text))
         # Если чат пуст, но есть валидный voice
         if not msgs:
-            if voice_text and len(voice_text.strip()) > 10 and not _is_technical_text(voice_text):
-                norm = re.sub(r"\s+", " ", voice_text.strip())
-                parts = re.split(r'(?<=[.!?])\s+', norm)
-                sentences = [p.strip() for p in parts if p.strip()]
-                if not sentences:
-                    sentences = [voice_text.strip()]
-                now_ms = int(time.time()*1000)
-                voice_msgs = [ChatMessage(room_id=self.room_id, author_id=None, author_name='voice', content=s, ts=now_ms) for s in sentences]
+            if voice_ok:
+                voice_msgs = self._voice_messages()
                 logger.info("summary_v2: voice-only summary room=%s user=%s parts=%s", self.room_id, self.user_id, len(voice_msgs))
                 # Стратегия уже добавит breakdown (она использует CombinedVoiceChatStrategy -> strategies)
                 return await self._combined_strategy.build(voice_msgs, ai_provider=ai_provider, system_prompt=system_prompt)
@@ -121,28 +157,20 @@ class UserAgentSession:
             return SummaryResult.empty(self.room_id)
         # Если все чат сообщения технические, но есть нормальный voice — используем его
         non_tech = [m for m in msgs if not _is_technical_text(m.content)]
-        if not non_tech and voice_text and len(voice_text.strip()) > 10 and not _is_technical_text(voice_text):
-            norm = re.sub(r"\s+", " ", voice_text.strip())
-            parts = re.split(r'(?<=[.!?])\s+', norm)
-            sentences = [p.strip() for p in parts if p.strip()]
-            if not sentences:
-                sentences = [voice_text.strip()]
-            now_ms = int(time.time()*1000)
-            voice_msgs = [ChatMessage(room_id=self.room_id, author_id=None, author_name='voice', content=s, ts=now_ms) for s in sentences]
+        if not non_tech and voice_ok:
+            voice_msgs = self._voice_messages()
             logger.info("summary_v2: voice-only (chat technical) summary room=%s user=%s parts=%s", self.room_id, self.user_id, len(voice_msgs))
             return await self._combined_strategy.build(voice_msgs, ai_provider=ai_provider, system_prompt=system_prompt)
+        # Инкрементальная разбивка валидна, только если фильтр по end_ts ничего не отрезал
+        tally = self._tally if len(msgs) == len(self._messages) else None
         # Комбинированный путь если voice информативный
         merged = msgs
         strategy = self._chat_strategy
-        if voice_text and len(voice_text.strip()) > 10 and not _is_technical_text(voice_text):
-            norm = re.sub(r"\s+", " ", voice_text.strip())
-            parts = re.split(r'(?<=[.!?])\s+', norm)
-            sentences = [p.strip() for p in parts if p.strip()]
-            if not sentences:
-                sentences = [voice_text.strip()]
-            now_ms = int(time.time()*1000)
-            voice_msgs = [ChatMessage(room_id=self.room_id, author_id=None, author_name='voice', content=s, ts=now_ms) for s in sentences]
+        if voice_ok:
+            voice_msgs = self._voice_messages()
             merged = msgs + voice_msgs
             strategy = self._combined_strategy
+            if tally is not None:
+                tally = tally.extended(voice_msgs)
             logger.info("summary_v2: combined voice+chat summary room=%s user=%s chat_msgs=%s voice_parts=%s", self.room_id, self.user_id, len(msgs), len(voice_msgs))
-        return await strategy.build(merged, ai_provider=ai_provider, system_prompt=system_prompt)
+        return await strategy.build(merged, ai_provider=ai_provider, system_prompt=system_prompt, tally=tally)
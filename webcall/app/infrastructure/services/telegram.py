@@ -5,12 +5,20 @@ from __future__ import annotations
 Используем обычный HTTP POST к Bot API. Для простоты и отсутствия
 доп зависимости берём httpx (уже в зависимостях). Если токена или chat id
 нет — функция молча возвращает False.
+
+Рассылка по нескольким чатам идёт конкурентно через общий httpx клиент (keep-alive пул):
+не более TELEGRAM_SEND_CONCURRENCY запросов одновременно, с лимитами на чат и на бота
+(token bucket) — время рассылки ≈ самый медленный чат, а не сумма RTT.
+Лимитер один на процесс (get_limiter): диспетчер выжимок берёт токены из тех же корзин
+и отправляет через send_prelimited, чтобы один запрос не списывался дважды.
 """
 
 import httpx
 import asyncio
 import logging
 import contextlib
+import time
+from typing import Dict
 from ..config import get_settings
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -18,39 +26,181 @@ from ..db.models import TelegramLinks
 
 logger = logging.getLogger(__name__)
 
+# Лимит Bot API — 4096 символов; режем чуть раньше, чтобы не потерять окончание
+MAX_TEXT_LEN = 4000
+
+
+def split_text(parts: list[str], limit: int = MAX_TEXT_LEN, sep: str = "\n\n") -> list[str]:
+    """Склеить части в сообщения не длиннее limit.
+
+    Части пакуются жадно через sep; слишком длинная часть режется по переводу строки
+    (или жёстко по limit, если переводов нет).
+    """
+    pieces: list[str] = []
+    for part in parts:
+        part = part.strip()
+        while len(part) > limit:
+            cut = part.rfind("\n", 0, limit)
+            if cut <= 0:
+                cut = limit
+            pieces.append(part[:cut].rstrip())
+            part = part[cut:].lstrip()
+        if part:
+            pieces.append(part)
+    out: list[str] = []
+    for piece in pieces:
+        if out and len(out[-1]) + len(sep) + len(piece) <= limit:
+            out[-1] = out[-1] + sep + piece
+        else:
+            out.append(piece)
+    return out
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не более capacity накоплено."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = max(0.001, float(rate))
+        self.capacity = max(1.0, float(capacity if capacity is not None else rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float | None = None) -> float:
+        """Взять токен. 0 — взят; иначе сколько секунд ждать до следующего (токен не списывается)."""
+        now = now if now is not None else time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class _FanoutLimiter:
+    """Ограничения рассылки: семафор на одновременные запросы + token bucket на чат и общий."""
+
+    def __init__(self, concurrency: int, rate_per_chat: float, rate_global: float) -> None:
+        self.sem = asyncio.Semaphore(max(1, int(concurrency)))
+        self.rate_per_chat = rate_per_chat
+        self.global_bucket = TokenBucket(rate_global)
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                now = time.monotonic()
+                for cid in [c for c, b in self.chat_buckets.items() if now - b.updated > 60]:
+                    self.chat_buckets.pop(cid, None)
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.rate_per_chat, 1.0)
+        return bucket
+
+    def take_chat(self, chat_id: str) -> float:
+        """Взять токен чата без ожидания: 0 — взят, иначе сколько секунд ждать."""
+        return self._chat_bucket(chat_id).take()
+
+    async def acquire_global(self) -> None:
+        while (wait := self.global_bucket.take()) > 0:
+            await asyncio.sleep(wait)
+
+    async def acquire(self, chat_id: str) -> None:
+        # Ждём только свой чат — остальные корутины рассылки продолжают работу
+        while (wait := self.take_chat(chat_id)) > 0:
+            await asyncio.sleep(wait)
+        await self.acquire_global()
+
+
+_client: httpx.AsyncClient | None = None
+_limiter: _FanoutLimiter | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        settings = get_settings()
+        conc = int(getattr(settings, 'TELEGRAM_SEND_CONCURRENCY', 8) or 8)
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=conc, max_keepalive_connections=conc),
+        )
+    return _client
+
+
+def get_limiter() -> _FanoutLimiter:
+    global _limiter
+    if _limiter is None:
+        settings = get_settings()
+        _limiter = _FanoutLimiter(
+            int(getattr(settings, 'TELEGRAM_SEND_CONCURRENCY', 8) or 8),
+            float(getattr(settings, 'TELEGRAM_RATE_PER_CHAT', 1.0) or 1.0),
+            float(getattr(settings, 'TELEGRAM_RATE_GLOBAL', 30.0) or 30.0),
+        )
+    return _limiter
+
+
+async def close_client() -> None:
+    """Закрыть общий HTTP клиент (lifespan shutdown)."""
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        with contextlib.suppress(Exception):
+            await client.aclose()
+
 
 async def _post_message(token: str, chat_id: str, text: str) -> bool:
     url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text[:4000]}
-    timeout = httpx.Timeout(10.0, connect=5.0)
+    payload = {"chat_id": chat_id, "text": text[:MAX_TEXT_LEN]}
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            r = await client.post(url, data=payload)
-            if r.status_code != 200:
-                body = None
-                with contextlib.suppress(Exception):  # type: ignore[name-defined]
-                    body = r.text[:300]
-                logger.warning("telegram: sendMessage failed status=%s chat_id=%s body=%r", r.status_code, chat_id, body)
-                return False
-            return True
+        r = await _get_client().post(url, data=payload)
+        if r.status_code != 200:
+            body = None
+            with contextlib.suppress(Exception):  # type: ignore[name-defined]
+                body = r.text[:300]
+            logger.warning("telegram: sendMessage failed status=%s chat_id=%s body=%r", r.status_code, chat_id, body)
+            return False
+        return True
     except Exception as e:  # pragma: no cover
         logger.error("telegram: exception sending chat_id=%s err=%s", chat_id, e)
         return False
 
 
-async def send_message(text: str, chat_ids: list[str] | None = None, session: AsyncSession | None = None) -> bool:
-    """Отправка сообщения.
+async def _send_one(token: str, chat_id: str, text: str) -> bool:
+    limiter = get_limiter()
+    # Ожидание лимитов — до семафора, чтобы не занимать слот конкурентности
+    await limiter.acquire(chat_id)
+    async with limiter.sem:
+        ok = await _post_message(token, chat_id, text)
+    logger.info("telegram: dispatched chat_id=%s ok=%s text_len=%s", chat_id, ok, len(text))
+    return ok
 
-    Приоритет:
-      1. Если передан список chat_ids — отправляем каждому.
-      2. Иначе, если есть связанные confirmed chat_id в БД (session обязателен) — отправляем всем уникальным.
-      3. Иначе fallback к глобальному TELEGRAM_CHAT_ID.
-    Возвращает True если удалось хотя бы в один чат.
+
+async def send_prelimited(text: str, chat_id: str) -> bool:
+    """Отправка в один чат, когда вызывающий уже взял токены чата и бота у get_limiter().
+
+    Диспетчер не ждёт лимит чата внутри воркера, а откладывает задачу — поэтому лимиты он
+    проверяет сам, а здесь они повторно не списываются. Семафор конкурентности общий с рассылкой.
     """
     settings = get_settings()
     if not settings.TELEGRAM_BOT_TOKEN:
         logger.debug("telegram: skip send (no token)")
         return False
+    async with get_limiter().sem:
+        ok = await _post_message(settings.TELEGRAM_BOT_TOKEN, str(chat_id), text)
+    logger.info("telegram: dispatched chat_id=%s ok=%s text_len=%s", chat_id, ok, len(text))
+    return ok
+
+
+async def send_message_results(text: str, chat_ids: list[str] | None = None, session: AsyncSession | None = None) -> Dict[str, bool]:
+    """Отправка сообщения с результатом по каждому чату: {chat_id: ok}.
+
+    Выбор получателей — как в send_message. Пустой dict — отправлять некуда (нет токена / целей).
+    """
+    settings = get_settings()
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logger.debug("telegram: skip send (no token)")
+        return {}
     token = settings.TELEGRAM_BOT_TOKEN
 
     targets: list[str] = []
@@ -64,13 +214,25 @@ async def send_message(text: str, chat_ids: list[str] | None = None, session: As
         targets = [settings.TELEGRAM_CHAT_ID]
     if not targets:
         logger.debug("telegram: skip send (no targets)")
-        return False
-    success_any = False
-    for cid in set(targets):
-        ok = await _post_message(token, cid, text)
-        success_any = success_any or ok
-        logger.info("telegram: dispatched chat_id=%s ok=%s text_len=%s", cid, ok, len(text))
-    return success_any
+        return {}
+    unique = list(dict.fromkeys(str(c) for c in targets))
+    if len(unique) == 1:
+        return {unique[0]: await _send_one(token, unique[0], text)}
+    results = await asyncio.gather(*(_send_one(token, cid, text) for cid in unique), return_exceptions=True)
+    return {cid: (r is True) for cid, r in zip(unique, results)}
+
+
+async def send_message(text: str, chat_ids: list[str] | None = None, session: AsyncSession | None = None) -> bool:
+    """Отправка сообщения.
+
+    Приоритет:
+      1. Если передан список chat_ids — отправляем каждому.
+      2. Иначе, если есть связанные confirmed chat_id в БД (session обязателен) — отправляем всем уникальным.
+      3. Иначе fallback к глобальному TELEGRAM_CHAT_ID.
+    Возвращает True если удалось хотя бы в один чат (по чатам — send_message_results).
+    """
+    results = await send_message_results(text, chat_ids=chat_ids, session=session)
+    return any(results.values())
 
 
 # Синхронный helper (если где-то нужен) — не используем в async коде.
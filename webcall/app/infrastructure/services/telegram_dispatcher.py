@@ -10,38 +10,115 @@ from __future__ import annotations
 
 Дубликаты подавляются по ключу (user_id, summary_hash, reason) в течение TTL.
 
+Устройство:
+  - asyncio.Queue готовых задач и N воркеров (TELEGRAM_DISPATCH_WORKERS);
+  - ретраи и отложенные из-за лимитов задачи ждут в куче (due, seq, task), которую разбирает
+    отдельная корутина — воркеры не спят внутри, один проблемный чат не держит остальных;
+  - token bucket на чат (TELEGRAM_RATE_PER_CHAT, ~1 msg/s) и общий (TELEGRAM_RATE_GLOBAL, ~30 msg/s),
+    как в лимитах Bot API; корзины общие с рассылкой telegram.send_message (telegram.get_limiter),
+    отправка — через send_prelimited, без повторного списания;
+  - опциональный digest (TELEGRAM_DIGEST_WINDOW_SEC): выжимки одному пользователю в пределах окна
+    склеиваются в одно сообщение (с разбиением по лимиту длины) — меньше запросов и откатов по лимиту чата;
+    с outbox окно не выдерживается, склеиваются строки одного пользователя из одной пачки claim.
+
 Не претендует на полноту брокера. В перспективе можно заменить
 на Redis Stream / Celery.
 """
 
-import asyncio, hashlib, time, contextlib, logging
-from dataclasses import dataclass
-from typing import Optional, Dict, Deque, Set
-from collections import deque
+import asyncio, hashlib, heapq, itertools, time, contextlib, logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import ClassVar, Optional, Dict, List, Tuple
+from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from .telegram import send_message as low_level_send
+from .telegram import MAX_TEXT_LEN, get_limiter, send_prelimited as low_level_send, split_text
 from ..config import get_settings
 from ..db.session import get_session
-from ..db.models import TelegramLinks
-from sqlalchemy import select
+from .telegram_link import get_chat_id_cache, get_confirmed_chat_id, get_confirmed_chat_ids
 
 logger = logging.getLogger(__name__)
 
+try:  # метрики опциональны
+    from prometheus_client import Counter, Gauge, Histogram
+    TG_QUEUE_DEPTH = Gauge('telegram_dispatch_queue_depth', 'Telegram dispatcher tasks waiting', ['kind'])
+    TG_SEND_LATENCY = Histogram('telegram_send_latency_seconds', 'Telegram sendMessage latency')
+    TG_DISPATCH = Counter('telegram_dispatch_total', 'Telegram dispatcher task outcomes', ['result'])
+    TG_SEEN_KEYS = Gauge('telegram_dispatch_seen_keys', 'Telegram dispatcher dedupe keys within TTL')
+except Exception:  # pragma: no cover
+    TG_QUEUE_DEPTH = None
+    TG_SEND_LATENCY = None
+    TG_DISPATCH = None
+    TG_SEEN_KEYS = None
+
 @dataclass
 class PendingTask:
+    """Задача отправки. Статусы: pending -> sending -> sent | pending (ретрай) | failed."""
+    PENDING: ClassVar[str] = 'pending'
+    SENDING: ClassVar[str] = 'sending'
+    SENT: ClassVar[str] = 'sent'
+    FAILED: ClassVar[str] = 'failed'
+    _TRANSITIONS: ClassVar[Dict[str, Tuple[str, ...]]] = {
+        'pending': ('sending', 'failed'),
+        'sending': ('sent', 'pending', 'failed'),
+        'sent': (),
+        'failed': (),
+    }
+
     user_id: str
     text: str
     reason: str
     attempts: int = 0
-    created_at: float = time.time()
+    created_at: float = field(default_factory=time.time)
+    chat_id: Optional[str] = None  # разрешается один раз при первой попытке
+    status: str = 'pending'
+    id: Optional[UUID] = None  # строка telegram_outbox (None — задача только в памяти)
+    last_error: Optional[str] = None
+    parts: Optional[List[str]] = None  # digest: накопленные тексты (None — обычная задача)
+    lease_until: Optional[datetime] = None  # outbox: locked_until, выданный при claim (токен владения строкой)
+    merged: Optional[List['PendingTask']] = None  # outbox digest: строки, склеенные в это сообщение (итог — общий)
+
+    def transition(self, new_status: str) -> None:
+        if new_status not in self._TRANSITIONS.get(self.status, ()):
+            raise ValueError(f"PendingTask: invalid transition {self.status} -> {new_status}")
+        self.status = new_status
+
 
 class TelegramDispatcher:
-    def __init__(self) -> None:
-        self._queue: Deque[PendingTask] = deque()
-        self._seen: Dict[str, float] = {}  # dedupe key -> ts
+    BACKOFF_BASE = 0.75
+    MAX_ATTEMPTS = 3
+    OUTBOX_PURGE_INTERVAL = 300.0  # как часто pump чистит завершённые строки outbox (сек)
+
+    def __init__(self, *, workers: int | None = None, limiter=None, outbox=None,
+                 digest_window_sec: float | None = None) -> None:
+        settings = get_settings()
+        # Durable очередь (TELEGRAM_OUTBOX_ENABLED): задачи хранятся в telegram_outbox, память — только буфер воркеров
+        if outbox is None and getattr(settings, 'TELEGRAM_OUTBOX_ENABLED', False):
+            from .telegram_outbox import TelegramOutboxStore
+            outbox = TelegramOutboxStore(lease_sec=int(getattr(settings, 'TELEGRAM_OUTBOX_LEASE_SEC', 60) or 60))
+        self._outbox = outbox
+        self._outbox_batch = max(1, int(getattr(settings, 'TELEGRAM_OUTBOX_BATCH', 20) or 20))
+        self._outbox_poll_sec = float(getattr(settings, 'TELEGRAM_OUTBOX_POLL_SEC', 1.0) or 1.0)
+        self._outbox_wakeup = asyncio.Event()
+        self._outbox_task: Optional[asyncio.Task] = None
+        self._outbox_purged_at = 0.0  # monotonic последней очистки outbox
+        self._queue: asyncio.Queue[PendingTask] = asyncio.Queue()
+        # Отложенные задачи: (monotonic due, seq, task)
+        self._delayed: List[Tuple[float, int, PendingTask]] = []
+        self._delayed_wakeup = asyncio.Event()
+        self._seq = itertools.count()
+        # dedupe key -> ts в порядке вставки: самые старые в голове, очистка — pop с головы
+        self._seen: OrderedDict[str, float] = OrderedDict()
         self._seen_ttl = 3600  # 1h
-        self._lock = asyncio.Lock()
-        self._worker_task: Optional[asyncio.Task] = None
+        self._seen_max = 50000  # страховка по памяти при всплеске уникальных ключей
+        self._workers_n = max(1, int(workers or getattr(settings, 'TELEGRAM_DISPATCH_WORKERS', 4) or 4))
+        # Лимиты Bot API — общий с рассылкой лимитер процесса (None — telegram.get_limiter() при первой отправке)
+        self._limiter = limiter
+        # Digest: открытая (ещё не отправленная) задача-накопитель на пользователя
+        self._digest_window = float(digest_window_sec if digest_window_sec is not None else getattr(settings, 'TELEGRAM_DIGEST_WINDOW_SEC', 0) or 0)
+        self._digests: Dict[str, PendingTask] = {}
+        self._worker_tasks: List[asyncio.Task] = []
+        self._pump_task: Optional[asyncio.Task] = None
         self._stop = False
         self._started = False
 
@@ -49,15 +126,29 @@ class TelegramDispatcher:
         if self._started:
             return
         self._started = True
-        self._worker_task = asyncio.create_task(self._worker())
-        logger.info("telegram_dispatcher: started")
+        self._stop = False
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers_n)]
+        self._pump_task = asyncio.create_task(self._delayed_pump())
+        if self._outbox is not None:
+            self._outbox_task = asyncio.create_task(self._outbox_pump())
+        logger.info("telegram_dispatcher: started workers=%s outbox=%s", self._workers_n, self._outbox is not None)
 
     async def shutdown(self) -> None:
         self._stop = True
-        if self._worker_task:
-            self._worker_task.cancel()
+        tasks = list(self._worker_tasks)
+        if self._pump_task:
+            tasks.append(self._pump_task)
+        if self._outbox_task:
+            tasks.append(self._outbox_task)
+        for t in tasks:
+            t.cancel()
+        for t in tasks:
             with contextlib.suppress(asyncio.CancelledError):
-                await self._worker_task
+                await t
+        self._worker_tasks = []
+        self._pump_task = None
+        self._outbox_task = None
+        self._started = False
         logger.info("telegram_dispatcher: stopped")
 
     async def queue_summary(self, user_id: str, text: str, *, reason: str) -> bool:
@@ -66,75 +157,288 @@ class TelegramDispatcher:
             return False
         key, h = self._dedupe_key(user_id, text, reason)
         now = time.time()
-        # Очистка старых ключей из _seen (ленивая)
-        if len(self._seen) > 5000:
-            drop = [k for k,v in self._seen.items() if now - v > self._seen_ttl]
-            for k in drop:
-                self._seen.pop(k, None)
+        self._prune_seen(now)
         if key in self._seen:
             logger.info("dispatcher: duplicate suppressed user=%s reason=%s hash=%s", user_id, reason, h)
             return False
-        self._seen[key] = now
+        if self._outbox is not None:
+            try:
+                queued = await self._outbox.enqueue(UUID(str(user_id)), text, reason, key)
+            except Exception as e:
+                logger.warning("dispatcher: outbox enqueue failed user=%s err=%s, using memory queue", user_id, e)
+            else:
+                if not queued:
+                    logger.info("dispatcher: duplicate suppressed (outbox) user=%s reason=%s hash=%s", user_id, reason, h)
+                    return False
+                self._remember(key, now)
+                self._outbox_wakeup.set()
+                if not self._started:
+                    self.start()
+                logger.info("dispatcher: enqueue outbox user=%s reason=%s hash=%s len=%s", user_id, reason, h, len(text))
+                return True
+        self._remember(key, now)
+        if self._digest_window > 0:
+            self._add_to_digest(user_id, text, reason)
+            if not self._started:
+                self.start()
+            logger.info("dispatcher: enqueue digest user=%s reason=%s hash=%s len=%s", user_id, reason, h, len(text))
+            return True
         task = PendingTask(user_id=user_id, text=text, reason=reason)
-        self._queue.append(task)
+        self._queue.put_nowait(task)
+        self._update_depth()
         if not self._started:
             self.start()
-        logger.info("dispatcher: enqueue user=%s reason=%s hash=%s len=%s qsize=%s", user_id, reason, h, len(text), len(self._queue))
+        logger.info("dispatcher: enqueue user=%s reason=%s hash=%s len=%s qsize=%s", user_id, reason, h, len(text), self._queue.qsize())
         return True
 
+    def _prune_seen(self, now: float) -> None:
+        """Снять с головы истёкшие ключи (вставка идёт по возрастанию времени) — амортизированно O(1)."""
+        seen = self._seen
+        while seen:
+            key, ts = next(iter(seen.items()))
+            if now - ts <= self._seen_ttl and len(seen) <= self._seen_max:
+                break
+            seen.popitem(last=False)
+        if TG_SEEN_KEYS is not None:
+            TG_SEEN_KEYS.set(len(seen))
+
+    def _remember(self, key: str, now: float) -> None:
+        self._seen[key] = now
+        if TG_SEEN_KEYS is not None:
+            TG_SEEN_KEYS.set(len(self._seen))
+
+    def _add_to_digest(self, user_id: str, text: str, reason: str) -> None:
+        """Дописать выжимку в открытый digest пользователя; первый текст открывает окно."""
+        task = self._digests.get(user_id)
+        if task is not None:
+            task.parts.append(text)  # type: ignore[union-attr]
+            if reason not in task.reason.split('+'):
+                task.reason = f"{task.reason}+{reason}"[:200]
+            self._count('merged')
+            return
+        task = PendingTask(user_id=user_id, text=text, reason=reason, parts=[text])
+        self._digests[user_id] = task
+        self._defer(task, self._digest_window)
+
+    def _close_digest(self, task: PendingTask) -> None:
+        """Окно digest истекло: склеиваем тексты, лишние сообщения (сверх лимита длины) — отдельными задачами."""
+        if self._digests.get(task.user_id) is task:
+            self._digests.pop(task.user_id, None)
+        parts, task.parts = task.parts or [], None
+        chunks = split_text(parts) or [task.text]
+        task.text = chunks[0]
+        for extra in chunks[1:]:
+            self._queue.put_nowait(PendingTask(user_id=task.user_id, text=extra, reason=task.reason, chat_id=task.chat_id))
+        if len(parts) > 1:
+            logger.info("dispatcher: digest user=%s summaries=%s messages=%s", task.user_id, len(parts), len(chunks))
+
+    def _merge_claimed(self, tasks: List[PendingTask]) -> List[PendingTask]:
+        """Digest для outbox: строки одного пользователя из пачки claim — одним сообщением.
+
+        Тексты пакуются целиком (не длиннее MAX_TEXT_LEN), поэтому у каждой строки ровно одно сообщение:
+        первая строка группы несёт склеенный текст, остальные ждут в merged и помечаются вместе с ней.
+        Строки в БД хранят свои тексты — при ретрае группа собирается заново.
+        """
+        by_user: Dict[str, List[PendingTask]] = {}
+        for task in tasks:
+            by_user.setdefault(task.user_id, []).append(task)
+        out: List[PendingTask] = []
+        for group in by_user.values():
+            head: Optional[PendingTask] = None
+            messages = 0
+            for task in group:
+                if head is not None and len(head.text) + 2 + len(task.text) <= MAX_TEXT_LEN:
+                    head.text = f"{head.text}\n\n{task.text}"
+                    head.merged = (head.merged or []) + [task]
+                    if task.reason not in head.reason.split('+'):
+                        head.reason = f"{head.reason}+{task.reason}"[:200]
+                    self._count('merged')
+                    continue
+                head = task
+                messages += 1
+                out.append(task)
+            if len(group) > 1:
+                logger.info("dispatcher: outbox digest user=%s rows=%s messages=%s", group[0].user_id, len(group), messages)
+        return out
+
     def _dedupe_key(self, user_id: str, text: str, reason: str):
         h = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
         return f"{user_id}:{reason}:{h}", h
 
-    async def _worker(self) -> None:
-        settings = get_settings()
-        BACKOFF_BASE = 0.75
+    def _update_depth(self) -> None:
+        if TG_QUEUE_DEPTH is not None:
+            TG_QUEUE_DEPTH.labels('ready').set(self._queue.qsize())
+            TG_QUEUE_DEPTH.labels('delayed').set(len(self._delayed))
+
+    def _defer(self, task: PendingTask, delay: float) -> None:
+        heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), task))
+        self._delayed_wakeup.set()
+        self._update_depth()
+
+    async def _delayed_pump(self) -> None:
+        """Переносит наступившие отложенные задачи в очередь; спит до ближайшего срока или новой задачи."""
         while not self._stop:
-            try:
-                if not self._queue:
-                    await asyncio.sleep(0.2)
-                    continue
-                task = self._queue.popleft()
-                sent = False
-                chat_id: Optional[str] = None
-                # Получаем chat_id напрямую быстрой выборкой
-                try:
-                    async with get_session() as session:
-                        q = select(TelegramLinks.chat_id).where(TelegramLinks.user_id == task.user_id, TelegramLinks.status == 'confirmed', TelegramLinks.chat_id.is_not(None))
-                        res = await session.execute(q)
-                        chat_id = res.scalar_one_or_none()
-                except Exception as e:
-                    logger.warning("dispatcher: chat_id fetch error user=%s err=%s", task.user_id, e)
-                if not settings.TELEGRAM_BOT_TOKEN:
-                    logger.info("dispatcher: skip no_token user=%s reason=%s", task.user_id, task.reason)
-                    continue
-                if not chat_id:
-                    logger.info("dispatcher: skip no_chat_id user=%s reason=%s", task.user_id, task.reason)
-                    continue
-                # Попытка отправки с ретраями
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _due, _seq, task = heapq.heappop(self._delayed)
+                self._queue.put_nowait(task)
+            self._update_depth()
+            timeout = (self._delayed[0][0] - now) if self._delayed else None
+            self._delayed_wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._delayed_wakeup.wait(), timeout)
+
+    async def _outbox_pump(self) -> None:
+        """Забирает пачки готовых строк outbox в очередь воркеров (не больше, чем воркеры успеют разобрать)."""
+        while not self._stop:
+            await self._purge_outbox()
+            claimed = 0
+            if self._queue.qsize() < self._workers_n:
                 try:
-                    sent = await low_level_send(task.text, chat_ids=[chat_id])
+                    tasks = await self._outbox.claim(self._outbox_batch)
                 except Exception as e:
-                    logger.error("dispatcher: low-level exception user=%s err=%s", task.user_id, e)
-                    sent = False
-                if sent:
-                    logger.info("dispatcher: sent user=%s reason=%s attempts=%s qsize=%s", task.user_id, task.reason, task.attempts+1, len(self._queue))
-                    continue
-                # Если не отправлено — ретрай при временной ошибке
-                task.attempts += 1
-                if task.attempts < 3:
-                    delay = BACKOFF_BASE * (2 ** (task.attempts - 1))
-                    logger.info("dispatcher: retry user=%s reason=%s attempt=%s delay=%.2f", task.user_id, task.reason, task.attempts, delay)
-                    await asyncio.sleep(delay)
-                    self._queue.append(task)
-                else:
-                    logger.warning("dispatcher: drop user=%s reason=%s attempts=%s", task.user_id, task.reason, task.attempts)
+                    logger.warning("dispatcher: outbox claim failed err=%s", e)
+                    tasks = []
+                if tasks:
+                    if self._digest_window > 0:
+                        tasks = self._merge_claimed(tasks)
+                    await self._prefetch_chat_ids(tasks)
+                for task in tasks:
+                    self._queue.put_nowait(task)
+                claimed = len(tasks)
+                self._update_depth()
+            if claimed >= self._outbox_batch:
+                await asyncio.sleep(0)
+                continue
+            self._outbox_wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._outbox_wakeup.wait(), self._outbox_poll_sec)
+
+    async def _purge_outbox(self) -> None:
+        """Удаление старых sent / failed строк — не чаще OUTBOX_PURGE_INTERVAL, ошибка не останавливает pump."""
+        now = time.monotonic()
+        if self._outbox_purged_at and now - self._outbox_purged_at < self.OUTBOX_PURGE_INTERVAL:
+            return
+        self._outbox_purged_at = now
+        try:
+            removed = await self._outbox.purge()
+        except Exception as e:
+            logger.warning("dispatcher: outbox purge failed err=%s", e)
+            return
+        if removed:
+            logger.info("dispatcher: outbox purged rows=%s", removed)
+
+    async def _resolve_chat_id(self, user_id: str) -> Optional[str]:
+        """chat_id из кэша; при промахе — выборка (результат кэшируется)."""
+        hit, chat_id = get_chat_id_cache().get(user_id)
+        if hit:
+            return chat_id
+        async with get_session() as session:
+            return await get_confirmed_chat_id(session, user_id)
+
+    async def _prefetch_chat_ids(self, tasks: List[PendingTask]) -> None:
+        """Холодный старт пачки: chat_id всех пользователей пачки одним IN запросом."""
+        cache = get_chat_id_cache()
+        need = {t.user_id for t in tasks if t.chat_id is None and not cache.get(t.user_id)[0]}
+        if not need:
+            return
+        try:
+            async with get_session() as session:
+                await get_confirmed_chat_ids(session, need)
+        except Exception as e:
+            logger.warning("dispatcher: chat_id prefetch failed users=%s err=%s", len(need), e)
+
+    async def _worker(self) -> None:
+        while not self._stop:
+            try:
+                task = await self._queue.get()
+                self._update_depth()
+                await self._process(task)
             except asyncio.CancelledError:  # pragma: no cover
                 break
             except Exception as e:  # pragma: no cover
                 logger.exception("dispatcher: worker loop error: %s", e)
                 await asyncio.sleep(1)
 
+    async def _process(self, task: PendingTask) -> None:
+        settings = get_settings()
+        if task.parts is not None:
+            self._close_digest(task)
+        if not settings.TELEGRAM_BOT_TOKEN:
+            logger.info("dispatcher: skip no_token user=%s reason=%s", task.user_id, task.reason)
+            await self._finish(task, 'skipped', error='no_token')
+            return
+        if task.chat_id is None:
+            try:
+                task.chat_id = await self._resolve_chat_id(task.user_id)
+            except Exception as e:
+                logger.warning("dispatcher: chat_id fetch error user=%s err=%s", task.user_id, e)
+        chat_id = task.chat_id
+        if not chat_id:
+            logger.info("dispatcher: skip no_chat_id user=%s reason=%s", task.user_id, task.reason)
+            await self._finish(task, 'skipped', error='no_chat_id')
+            return
+        if self._limiter is None:
+            self._limiter = get_limiter()
+        # Лимит на чат: не ждём внутри воркера, а откладываем задачу
+        wait = self._limiter.take_chat(chat_id)
+        if wait > 0:
+            self._defer(task, wait)
+            return
+        # Общий лимит касается всех задач — короткое ожидание здесь допустимо
+        await self._limiter.acquire_global()
+        started = time.monotonic()
+        error: Optional[str] = None
+        try:
+            sent = await low_level_send(task.text, chat_id)
+        except Exception as e:
+            logger.error("dispatcher: low-level exception user=%s err=%s", task.user_id, e)
+            sent = False
+            error = e.__class__.__name__
+        if TG_SEND_LATENCY is not None:
+            TG_SEND_LATENCY.observe(time.monotonic() - started)
+        if sent:
+            logger.info("dispatcher: sent user=%s reason=%s attempts=%s qsize=%s", task.user_id, task.reason, task.attempts+1, self._queue.qsize())
+            await self._finish(task, 'sent')
+            return
+        # Если не отправлено — ретрай при временной ошибке (через кучу отложенных / next_attempt_at в outbox)
+        task.attempts += 1
+        if task.attempts < self.MAX_ATTEMPTS:
+            delay = self.BACKOFF_BASE * (2 ** (task.attempts - 1))
+            logger.info("dispatcher: retry user=%s reason=%s attempt=%s delay=%.2f", task.user_id, task.reason, task.attempts, delay)
+            await self._finish(task, 'retried', error=error or 'send_failed', delay=delay)
+        else:
+            logger.warning("dispatcher: drop user=%s reason=%s attempts=%s", task.user_id, task.reason, task.attempts)
+            await self._finish(task, 'dropped', error=error or 'send_failed')
+
+    async def _finish(self, task: PendingTask, result: str, *, error: Optional[str] = None, delay: float = 0.0) -> None:
+        """Итог попытки: метрика + переход состояния (в памяти или в строке outbox)."""
+        self._count(result)
+        if task.id is None or self._outbox is None:
+            if result == 'retried':
+                self._defer(task, delay)
+            return
+        try:
+            for row in [task, *(task.merged or [])]:
+                if row is not task:
+                    row.attempts, row.chat_id = task.attempts, task.chat_id
+                if result == 'sent':
+                    await self._outbox.mark_sent(row)
+                elif result == 'retried':
+                    await self._outbox.mark_retry(row, delay, error)
+                else:
+                    await self._outbox.mark_failed(row, error)
+        except Exception as e:
+            # Строка останется в sending и будет перезабрана по истечении lease
+            logger.warning("dispatcher: outbox update failed id=%s result=%s err=%s", task.id, result, e)
+
+    def _count(self, result: str) -> None:
+        if TG_DISPATCH is not None:
+            TG_DISPATCH.labels(result).inc()
+
+    def pending(self) -> Dict[str, int]:
+        return {'ready': self._queue.qsize(), 'delayed': len(self._delayed)}
+
 _dispatcher_singleton: TelegramDispatcher | None = None
 
 def get_dispatcher() -> TelegramDispatcher:
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import secrets
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
+from uuid import UUID
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import event, select, update
 
+from ..config import get_settings
 from ..db.models import TelegramLinks
 
 TOKEN_TTL_MINUTES = 10
@@ -68,18 +71,121 @@ async def confirm_link(session: AsyncSession, token: str, chat_id: str) -> bool:
     link.chat_id = chat_id
     link.status = 'confirmed'
     link.confirmed_at = now
+    _invalidate_after_commit(session, link.user_id)
     return True
 
 
-async def get_confirmed_chat_id(session: AsyncSession, user_id) -> Optional[str]:
+class ChatIdCache:
+    """TTL кэш user_id -> confirmed chat_id (None тоже кэшируется: у пользователя нет привязки).
+
+    Доставка summary в установившемся режиме не ходит в БД; confirm_link / revoke_user_links
+    инвалидируют запись пользователя после commit. Счётчик поколений не даёт чтению, начатому
+    до commit, положить в кэш старое значение. Инвалидация локальна для процесса: другие
+    воркеры увидят изменение не позже TTL.
+    """
+
+    def __init__(self, ttl_sec: float = 300.0, max_size: int = 10000) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_size = max_size
+        self.generation = 0
+        self._items: Dict[str, Tuple[Optional[str], float]] = {}
+
+    def get(self, user_id) -> Tuple[bool, Optional[str]]:
+        """(найдено, chat_id)."""
+        item = self._items.get(str(user_id))
+        if item is None:
+            return False, None
+        chat_id, expires = item
+        if expires < time.monotonic():
+            self._items.pop(str(user_id), None)
+            return False, None
+        return True, chat_id
+
+    def put(self, user_id, chat_id: Optional[str], generation: int | None = None) -> None:
+        """generation — значение self.generation до чтения из БД; была инвалидация — не кэшируем."""
+        if generation is not None and generation != self.generation:
+            return
+        if len(self._items) >= self.max_size:
+            now = time.monotonic()
+            for k in [k for k, (_c, exp) in self._items.items() if exp < now]:
+                self._items.pop(k, None)
+            if len(self._items) >= self.max_size:
+                self._items.clear()
+        self._items[str(user_id)] = (chat_id, time.monotonic() + self.ttl_sec)
+
+    def invalidate(self, user_id) -> None:
+        self.generation += 1
+        self._items.pop(str(user_id), None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._items.clear()
+
+
+_chat_id_cache: ChatIdCache | None = None
+
+
+def get_chat_id_cache() -> ChatIdCache:
+    global _chat_id_cache
+    if _chat_id_cache is None:
+        ttl = getattr(get_settings(), 'TELEGRAM_CHAT_ID_CACHE_TTL_SEC', 300) or 0
+        _chat_id_cache = ChatIdCache(ttl_sec=float(ttl))
+    return _chat_id_cache
+
+
+def _invalidate_after_commit(session: AsyncSession, user_id) -> None:
+    """Сбросить кэш пользователя после commit вызывающего: до него другие сессии видят старую привязку."""
+    cache = get_chat_id_cache()
+    sync_session = getattr(session, 'sync_session', None)
+    if sync_session is None:
+        cache.invalidate(user_id)
+        return
+    event.listen(sync_session, 'after_commit', lambda _s: cache.invalidate(user_id), once=True)
+
+
+async def get_confirmed_chat_ids(session: AsyncSession, user_ids: Iterable) -> Dict[str, Optional[str]]:
+    """confirmed chat_id для набора пользователей: попадания из кэша, промахи — одним IN запросом.
+
+    Ключи результата — str(user_id); у пользователей без привязки значение None.
+    """
+    cache = get_chat_id_cache()
+    out: Dict[str, Optional[str]] = {}
+    missing: Dict[str, UUID] = {}
+    for uid in user_ids:
+        key = str(uid)
+        if key in out or key in missing:
+            continue
+        hit, chat_id = cache.get(key)
+        if hit:
+            out[key] = chat_id
+            continue
+        try:
+            missing[key] = uid if isinstance(uid, UUID) else UUID(key)
+        except ValueError:
+            out[key] = None
+    if not missing:
+        return out
+    generation = cache.generation
     q = (
-        select(TelegramLinks.chat_id)
-        .where(TelegramLinks.user_id == user_id, TelegramLinks.status == 'confirmed')
+        select(TelegramLinks.user_id, TelegramLinks.chat_id)
+        .where(TelegramLinks.user_id.in_(list(missing.values())), TelegramLinks.status == 'confirmed', TelegramLinks.chat_id.is_not(None))
         .order_by(TelegramLinks.confirmed_at.desc())
-        .limit(1)
     )
     res = await session.execute(q)
-    return res.scalar_one_or_none()
+    found: Dict[str, str] = {}
+    for user_id, chat_id in res.all():
+        # сортировка по confirmed_at desc: первая строка пользователя — самая свежая привязка
+        found.setdefault(str(user_id), chat_id)
+    for key in missing:
+        chat_id = found.get(key)
+        if cache.ttl_sec > 0:
+            cache.put(key, chat_id, generation=generation)
+        out[key] = chat_id
+    return out
+
+
+async def get_confirmed_chat_id(session: AsyncSession, user_id) -> Optional[str]:
+    return (await get_confirmed_chat_ids(session, [user_id])).get(str(user_id))
 
 
 async def revoke_user_links(session: AsyncSession, user_id) -> int:
@@ -96,5 +202,6 @@ async def revoke_user_links(session: AsyncSession, user_id) -> int:
         .values(status='revoked', chat_id=None)
     )
     res = await session.execute(stmt)
+    _invalidate_after_commit(session, user_id)
     # Возврат количества обновлённых строк (rowcount может быть None у некоторых драйверов)
     return res.rowcount or 0
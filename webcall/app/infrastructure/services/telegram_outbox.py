@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+"""Durable очередь исходящих сообщений Telegram (таблица telegram_outbox).
+
+Задачи переживают деплой, окно дедупликации хранится в БД, а несколько воркеров (процессов)
+разбирают очередь конкурентно: claim берёт пачку строк через SELECT ... FOR UPDATE SKIP LOCKED
+и в той же транзакции переводит их в sending с lease — каждую строку отправляет ровно один воркер.
+Ретраи планируются колонкой next_attempt_at (экспоненциальный backoff задаёт диспетчер).
+
+Дедупликация двух воркеров, одновременно ставящих одно и то же, держится на уникальном индексе
+(dedupe_key, dedupe_bucket): проигравшая вставка получает IntegrityError. Итог попытки пишется только
+при совпадении locked_until, выданного при claim: воркер, чей lease истёк и строку перезабрали,
+не перетирает состояние нового владельца.
+
+Завершённые строки (sent / failed) старше dedupe TTL удаляет purge(): окно дедупликации на них
+уже не опирается, а без очистки таблица растёт бесконечно.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional
+from uuid import UUID, uuid4
+import logging
+import time
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..db.models import TelegramOutbox
+from ..db.session import get_session
+from .telegram_dispatcher import PendingTask
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramOutboxStore:
+    def __init__(self, session_factory: Callable[[], Any] | None = None, *, lease_sec: int = 60, dedupe_ttl_sec: int = 3600) -> None:
+        self._session = session_factory or get_session
+        self.lease_sec = lease_sec
+        self.dedupe_ttl_sec = dedupe_ttl_sec
+
+    async def enqueue(self, user_id: UUID, text: str, reason: str, dedupe_key: str) -> bool:
+        """Добавить задачу. False — такой же текст этому пользователю с тем же reason уже ставился в пределах TTL."""
+        now = datetime.utcnow()
+        bucket = int(time.time() // max(1, self.dedupe_ttl_sec))
+        async with self._session() as session:
+            async with session.begin():
+                # Последовательные повторы в пределах TTL (в том числе через границу корзины)
+                dup = await session.execute(
+                    select(TelegramOutbox.id)
+                    .where(TelegramOutbox.dedupe_key == dedupe_key, TelegramOutbox.created_at > now - timedelta(seconds=self.dedupe_ttl_sec))
+                    .limit(1)
+                )
+                if dup.first() is not None:
+                    return False
+                # Одновременные — уникальный индекс (dedupe_key, dedupe_bucket)
+                try:
+                    async with session.begin_nested():
+                        session.add(TelegramOutbox(
+                            id=uuid4(), user_id=user_id, chat_id=None, text=text, reason=reason[:200], dedupe_key=dedupe_key,
+                            dedupe_bucket=bucket, status=PendingTask.PENDING, attempts=0, next_attempt_at=now,
+                            locked_until=None, last_error=None, created_at=now, updated_at=now,
+                        ))
+                except IntegrityError:
+                    return False
+        return True
+
+    async def claim(self, limit: int) -> List[PendingTask]:
+        """Забрать до limit готовых задач (pending с наступившим сроком или sending с истёкшим lease)."""
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.lease_sec)
+        async with self._session() as session:
+            async with session.begin():
+                q = (
+                    select(TelegramOutbox)
+                    .where(or_(
+                        and_(TelegramOutbox.status == PendingTask.PENDING, TelegramOutbox.next_attempt_at <= now),
+                        and_(TelegramOutbox.status == PendingTask.SENDING, TelegramOutbox.locked_until < now),
+                    ))
+                    .order_by(TelegramOutbox.next_attempt_at)
+                    .limit(max(1, int(limit)))
+                    .with_for_update(skip_locked=True)
+                )
+                rows = list((await session.execute(q)).scalars().all())
+                if not rows:
+                    return []
+                await session.execute(
+                    update(TelegramOutbox)
+                    .where(TelegramOutbox.id.in_([r.id for r in rows]))
+                    .values(status=PendingTask.SENDING, locked_until=lease_until, updated_at=now)
+                )
+        tasks: List[PendingTask] = []
+        for r in rows:
+            task = PendingTask(user_id=str(r.user_id), text=r.text, reason=r.reason, attempts=r.attempts,
+                               chat_id=r.chat_id, id=r.id, last_error=r.last_error, lease_until=lease_until)
+            task.transition(PendingTask.SENDING)
+            tasks.append(task)
+        return tasks
+
+    async def _finish(self, task: PendingTask, **values: Any) -> bool:
+        """Записать итог попытки. False — lease потерян (строку перезабрал другой воркер), запись не сделана."""
+        now = datetime.utcnow()
+        async with self._session() as session:
+            async with session.begin():
+                res = await session.execute(
+                    update(TelegramOutbox)
+                    .where(TelegramOutbox.id == task.id, TelegramOutbox.status == PendingTask.SENDING,
+                           TelegramOutbox.locked_until == task.lease_until)
+                    .values(status=task.status, attempts=task.attempts, chat_id=task.chat_id, last_error=task.last_error,
+                            locked_until=None, updated_at=now, **values)
+                )
+        if not res.rowcount:
+            logger.warning("telegram_outbox: lease lost id=%s status=%s, result not recorded", task.id, task.status)
+            return False
+        return True
+
+    async def mark_sent(self, task: PendingTask) -> bool:
+        task.transition(PendingTask.SENT)
+        return await self._finish(task)
+
+    async def mark_retry(self, task: PendingTask, delay_sec: float, error: Optional[str] = None) -> bool:
+        task.last_error = error
+        task.transition(PendingTask.PENDING)
+        return await self._finish(task, next_attempt_at=datetime.utcnow() + timedelta(seconds=delay_sec))
+
+    async def mark_failed(self, task: PendingTask, error: Optional[str] = None) -> bool:
+        task.last_error = error
+        task.transition(PendingTask.FAILED)
+        return await self._finish(task)
+
+    async def purge(self, limit: int = 1000) -> int:
+        """Удалить до limit строк sent / failed, не менявшихся дольше dedupe TTL. Возвращает число удалённых."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.dedupe_ttl_sec)
+        async with self._session() as session:
+            async with session.begin():
+                ids = select(TelegramOutbox.id).where(
+                    TelegramOutbox.status.in_((PendingTask.SENT, PendingTask.FAILED)),
+                    TelegramOutbox.updated_at < cutoff,
+                ).limit(max(1, int(limit)))
+                res = await session.execute(
+                    delete(TelegramOutbox).where(TelegramOutbox.id.in_(ids)).execution_options(synchronize_session=False)
+                )
+        return int(res.rowcount or 0)
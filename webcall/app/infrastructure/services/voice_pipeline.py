@@ -0,0 +1,238 @@
+"""Потоковая (pipelined) транскрипция голоса во время записи.
+
+Поток MediaRecorder (webm/opus) режется на независимо декодируемые сегменты: к каждому
+сегменту заново приписывается заголовок контейнера (EBML + Segment/Tracks до первого Cluster),
+граница режется по началу Cluster, найденному разбором EBML элементов. Сегменты распознаются
+параллельно по мере поступления (не более max_concurrency одновременно на пользователя),
+частичные тексты отдаются в порядке следования. На stop остаётся распознать только последний сегмент.
+"""
+
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Dict, List
+import asyncio
+import logging
+import time
+
+from .voice_transcript import VoiceChunk, transcribe_chunks
+
+logger = logging.getLogger(__name__)
+
+# ID элементов Matroska/WebM (с маркером длины, как в потоке)
+_EBML_ID = 0x1A45DFA3
+_SEGMENT_ID = 0x18538067
+_CLUSTER_ID = 0x1F43B675
+_TIMECODE_ID = 0xE7
+_PLACEHOLDER_PREFIXES = ('(no audio', '(asr ')
+
+
+def _read_vint(buf: bytearray, pos: int, *, is_id: bool = False) -> tuple[int, int, bool] | None:
+    """EBML vint с позиции pos: (значение, длина, unknown size). None — данных ещё не хватает.
+
+    is_id — ID элемента: значение с маркером длины, не длиннее 4 байт. ValueError — в позиции не vint.
+    """
+    if pos >= len(buf):
+        return None
+    first = buf[pos]
+    if first == 0:
+        raise ValueError("ebml: invalid vint")
+    length = 9 - first.bit_length()
+    if is_id and length > 4:
+        raise ValueError("ebml: invalid element id")
+    if pos + length > len(buf):
+        return None
+    if is_id:
+        return int.from_bytes(buf[pos:pos + length], 'big'), length, False
+    value = first & (0xFF >> length)
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+    return value, length, value == (1 << (7 * length)) - 1
+
+
+class WebmSegmenter:
+    """Режет поток webm на самостоятельные файлы: header + целые кластеры.
+
+    Границы ищутся обходом EBML элементов (ID + size), а не поиском байтов Cluster ID: те же
+    4 байта могут встретиться внутри SimpleBlock. Segment и Cluster (у MediaRecorder — unknown size)
+    разбираются вглубь, остальные элементы пропускаются по размеру; Cluster обязан начинаться с Timecode.
+    Если заголовок не найден (не webm) или структура не разбирается — поток дальше не режется,
+    остаток отдаётся одним куском во flush().
+    """
+
+    __slots__ = ('segment_ms', 'header', '_buf', '_started_ms', '_pending_header', '_scan', '_clusters',
+                 '_expect_timecode', '_broken')
+
+    def __init__(self, segment_ms: int = 5000) -> None:
+        self.segment_ms = max(1000, int(segment_ms or 5000))
+        self.header: bytes | None = None
+        self._buf = bytearray()
+        self._started_ms: int | None = None
+        self._pending_header = True
+        self._scan = 0  # позиция следующего неразобранного элемента в _buf
+        self._clusters: List[int] = []  # начала кластеров в _buf
+        self._expect_timecode: int | None = None  # начало кластера, ждущего Timecode
+        self._broken = False
+
+    def _parse(self) -> None:
+        buf = self._buf
+        while not self._broken:
+            pos = self._scan
+            try:
+                eid = _read_vint(buf, pos, is_id=True)
+                if eid is None:
+                    return
+                size = _read_vint(buf, pos + eid[1])
+                if size is None:
+                    return
+            except ValueError:
+                self._broken = True
+                return
+            elem_id, value, unknown = eid[0], size[0], size[2]
+            data = pos + eid[1] + size[1]
+            if self._pending_header and pos == 0 and elem_id != _EBML_ID:
+                self._broken = True  # не webm
+                return
+            if self._expect_timecode is not None:
+                if elem_id != _TIMECODE_ID:
+                    self._broken = True
+                    return
+                self._clusters.append(self._expect_timecode)  # граница подтверждена
+                self._expect_timecode = None
+            if elem_id == _CLUSTER_ID:
+                if self._pending_header:
+                    self.header = bytes(buf[:pos])
+                    del buf[:pos]
+                    data -= pos
+                    pos = 0
+                    self._pending_header = False
+                self._expect_timecode = pos
+                self._scan = data  # внутрь: дочерние элементы имеют известный размер
+                continue
+            if elem_id == _SEGMENT_ID:
+                self._scan = data
+                continue
+            if unknown:
+                self._broken = True  # unknown size допустим только у Segment / Cluster
+                return
+            self._scan = data + value
+
+    def feed(self, data: bytes, now_ms: int | None = None) -> bytes | None:
+        """Добавить чанк; вернуть готовый сегмент, если прошло segment_ms и есть граница кластера."""
+        now_ms = now_ms if now_ms is not None else int(time.time()*1000)
+        self._buf += data
+        if self._started_ms is None:
+            self._started_ms = now_ms
+        self._parse()
+        if self._pending_header:
+            return None
+        if now_ms - self._started_ms < self.segment_ms:
+            return None
+        # Последний кластер может ещё дописываться — режем перед ним
+        cut = self._clusters[-1] if self._clusters else 0
+        if cut <= 0:
+            return None
+        segment = (self.header or b'') + bytes(self._buf[:cut])
+        del self._buf[:cut]
+        self._scan -= cut
+        self._clusters = [c - cut for c in self._clusters if c >= cut]
+        if self._expect_timecode is not None:
+            self._expect_timecode -= cut
+        self._started_ms = now_ms
+        return segment
+
+    def flush(self) -> bytes | None:
+        if not self._buf:
+            return None
+        segment = bytes(self._buf) if self._pending_header else (self.header or b'') + bytes(self._buf)
+        self._buf.clear()
+        self._scan = 0
+        self._clusters = []
+        self._expect_timecode = None
+        self._started_ms = None
+        return segment
+
+
+TranscribeFn = Callable[[str, List[VoiceChunk]], Awaitable[str]]
+
+
+class StreamingTranscriber:
+    """Распознавание сегментов одного говорящего по мере записи.
+
+    on_partial(text) вызывается строго в порядке сегментов (сегмент N+1 ждёт N), только для
+    содержательных текстов. finish() дорезает хвост, дожидается всех задач и возвращает склеенный текст.
+    """
+
+    def __init__(self, key: str, *, on_partial: Callable[[str], None] | None = None, max_concurrency: int = 2,
+                 segment_ms: int = 5000, transcribe: TranscribeFn | None = None) -> None:
+        self.key = key
+        self._segmenter = WebmSegmenter(segment_ms)
+        self._on_partial = on_partial
+        self._transcribe: TranscribeFn = transcribe or transcribe_chunks
+        self._sem = asyncio.Semaphore(max(1, int(max_concurrency or 1)))
+        self._tasks: List[asyncio.Task] = []
+        self._results: Dict[int, str] = {}
+        self._next_seq = 0
+        self._emit_seq = 0
+        self._parts: List[str] = []
+        self._placeholder: str | None = None
+        self.bytes_in = 0
+        self.segments = 0
+
+    def feed(self, data: bytes, now_ms: int | None = None) -> None:
+        self.bytes_in += len(data)
+        segment = self._segmenter.feed(data, now_ms)
+        if segment:
+            self._submit(segment)
+
+    def _submit(self, segment: bytes) -> None:
+        seq = self._next_seq
+        self._next_seq += 1
+        self.segments += 1
+        self._tasks.append(asyncio.create_task(self._run(seq, segment)))
+
+    async def _run(self, seq: int, segment: bytes) -> None:
+        try:
+            async with self._sem:
+                text = await self._transcribe(self.key, [VoiceChunk(ts=int(time.time()*1000), data=segment)])
+        except Exception as e:  # pragma: no cover
+            text = f"(asr exception {e.__class__.__name__})"
+        self._results[seq] = (text or '').strip()
+        self._drain()
+
+    def _drain(self) -> None:
+        while self._emit_seq in self._results:
+            text = self._results.pop(self._emit_seq)
+            self._emit_seq += 1
+            if not text or text.startswith(_PLACEHOLDER_PREFIXES):
+                if text and self._placeholder is None:
+                    self._placeholder = text
+                continue
+            self._parts.append(text)
+            if self._on_partial is not None:
+                try:
+                    self._on_partial(text)
+                except Exception:
+                    logger.debug("voice_pipeline: on_partial failed key=%s seq=%s", self.key, self._emit_seq - 1, exc_info=True)
+
+    @property
+    def partials(self) -> int:
+        """Сколько содержательных частичных текстов уже отдано."""
+        return len(self._parts)
+
+    async def finish(self) -> str:
+        tail = self._segmenter.flush()
+        if tail:
+            self._submit(tail)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._parts:
+            return " ".join(self._parts)
+        return self._placeholder or ""
+
+    async def cancel(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
-"""In-memory хранилище голосовых чанков и транскриптов."""
+"""In-memory хранилище голосовых чанков и транскриптов.
 
-from dataclasses import dataclass
-from typing import List, Dict
-import io
-import httpx
-from .ai_provider import OpenAIAIProvider  # type: ignore
+Сырые чанки MediaRecorder по умолчанию не держатся в памяти: они дописываются в spool —
+анонимный временный файл на (room,user) — и при финализации файл целиком уходит в ASR
+как файловый объект (httpx читает его потоково), без склейки в bytes.
+"""
+
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterable, List, Dict
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import tempfile
+from .asr import get_asr_pool
+from .summary_v2.models import VoiceSegment
 from ..config import get_settings
-from asyncio import Lock
 import time
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class VoiceChunk:
@@ -21,66 +32,257 @@ class VoiceChunk:
 @dataclass
 class VoiceTranscript:
     room_id: str
-    text: str
+    text: str  # как пришло (с meta префиксом) — для совместимости
     generated_at: int
+    # Разобранный при сохранении сегмент: потребители не парсят meta / предложения повторно
+    segment: VoiceSegment | None = field(default=None, repr=False)
 
 
-class VoiceTranscriptCollector:
+class VoiceSpool:
+    """Аудио одного говорящего на диске: чанки дописываются в анонимный временный файл.
+
+    Файл создаётся через TemporaryFile (на POSIX сразу unlink) — после close или падения процесса
+    на диске ничего не остаётся. Память на говорящего не зависит от длины записи.
+    """
+
+    __slots__ = ('first_ts', 'size', 'chunks', '_fh')
+
+    def __init__(self, first_ts: int, spool_dir: str | None = None) -> None:
+        self.first_ts = first_ts
+        self.size = 0
+        self.chunks = 0
+        self._fh: BinaryIO | None = tempfile.TemporaryFile(prefix='webcall-voice-', suffix='.webm', dir=spool_dir or None)  # type: ignore[assignment]
+
+    def append(self, data: bytes) -> None:
+        if self._fh is None:
+            return
+        self._fh.write(data)
+        self.size += len(data)
+        self.chunks += 1
+
+    def open_for_upload(self) -> BinaryIO:
+        """Файловый объект с позицией в начале — отдаётся в multipart как есть."""
+        assert self._fh is not None, "spool closed"
+        self._fh.flush()
+        self._fh.seek(0)
+        return self._fh
+
+    def read_all(self) -> bytes:
+        """Содержимое целиком (для legacy get_and_clear_chunks)."""
+        return self.open_for_upload().read()
+
+    def close(self) -> None:
+        fh, self._fh = self._fh, None
+        if fh is not None:
+            try:
+                fh.close()
+            except Exception:
+                pass
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+
+class _KeyState:
+    """Состояние одного ключа (room или room:user): сырое аудио и готовый транскрипт."""
+
+    __slots__ = ('chunks', 'spool', 'transcript')
+
     def __init__(self) -> None:
+        self.chunks: list[VoiceChunk] | None = None
+        self.spool: VoiceSpool | None = None
+        self.transcript: VoiceTranscript | None = None
+
+    def empty(self) -> bool:
+        return not self.chunks and self.spool is None and self.transcript is None
+
+
+class VoiceTranscriptCollector:
+    """Хранилище чанков и транскриптов с состоянием на ключ.
+
+    Истечение TTL ведётся кучей (expire_at, seq, key): чтение и запись — O(1) по ключу (просроченное
+    на чтении отбрасывается точечной проверкой), очистка снимает с вершины кучи только наступившие
+    сроки — фоновая задача (start_purger) и попутно при записи. Устаревшие записи кучи (ключ
+    перезаписан) при снятии просто перепроверяются. Глобальной блокировки нет: операции
+    синхронны между await и атомарны для event loop.
+    """
+
+    def __init__(self, *, spool: bool | None = None, spool_dir: str | None = None) -> None:
         # Ключ: (room_id,user_id) если user_id известен; иначе room_id как fallback (legacy). Пользовательский скоп обязателен для корректной персональной сегрегации.
-        self._chunks: Dict[str, list[VoiceChunk]] = {}
-        self._transcripts: Dict[str, VoiceTranscript] = {}
-        self._lock = Lock()
+        self._keys: Dict[str, _KeyState] = {}
+        self._expiry: list[tuple[int, int, str]] = []
+        self._seq = itertools.count()
+        if spool is None:
+            try:
+                settings = get_settings()
+                spool = bool(getattr(settings, 'VOICE_SPOOL_ENABLED', True))
+                spool_dir = spool_dir or getattr(settings, 'VOICE_SPOOL_DIR', None)
+            except Exception:
+                spool = True
+        # Дисковые spool'ы (VOICE_SPOOL_ENABLED) — вместо списков чанков в памяти
+        self._spool_enabled = spool
+        self._spool_dir = spool_dir
         # TTL (мс) для готовых транскриптов и сырых чанков (если вдруг не финализировали) — предотвращает накопление старых данных.
         self._transcript_ttl_ms = 5 * 60 * 1000  # 5 минут
         self._chunk_ttl_ms = 5 * 60 * 1000
+        self._purger_task: asyncio.Task | None = None
+
+    # --- TTL ---
+    def _schedule(self, key: str, expire_at: int) -> None:
+        heapq.heappush(self._expiry, (expire_at, next(self._seq), key))
+
+    def _expire_key(self, key: str, now_ms: int) -> int:
+        """Снять с ключа просроченное; удалить ключ, если ничего не осталось. Возвращает число снятых объектов."""
+        st = self._keys.get(key)
+        if st is None:
+            return 0
+        removed = 0
+        if st.transcript is not None and (now_ms - st.transcript.generated_at) > self._transcript_ttl_ms:
+            st.transcript = None
+            removed += 1
+        if st.chunks and (now_ms - st.chunks[0].ts) > self._chunk_ttl_ms:
+            st.chunks = None
+            removed += 1
+        if st.spool is not None and (now_ms - st.spool.first_ts) > self._chunk_ttl_ms:
+            st.spool.close()
+            st.spool = None
+            removed += 1
+        if st.empty():
+            self._keys.pop(key, None)
+        return removed
 
-    def _purge_expired_unlocked(self, now_ms: int) -> None:
-        # Очистка транскриптов
-        to_del = [k for k, v in self._transcripts.items() if (now_ms - v.generated_at) > self._transcript_ttl_ms]
-        for k in to_del:
-            self._transcripts.pop(k, None)
-        # Очистка сырых чанков (по таймстемпу первого чанка)
-        stale_chunks = []
-        for k, lst in self._chunks.items():
-            if lst and (now_ms - lst[0].ts) > self._chunk_ttl_ms:
-                stale_chunks.append(k)
-        for k in stale_chunks:
-            self._chunks.pop(k, None)
+    def purge(self, now_ms: int | None = None) -> int:
+        """Снять все наступившие сроки (с вершины кучи). Возвращает число удалённых чанк-наборов/транскриптов."""
+        now_ms = now_ms if now_ms is not None else int(time.time()*1000)
+        removed = 0
+        heap = self._expiry
+        while heap and heap[0][0] < now_ms:
+            _exp, _seq, key = heapq.heappop(heap)
+            removed += self._expire_key(key, now_ms)
+        return removed
 
+    def start_purger(self, interval_sec: float = 30.0) -> None:
+        if self._purger_task is not None and not self._purger_task.done():
+            return
+        self._purger_task = asyncio.create_task(self._purger(interval_sec))
+
+    async def shutdown(self) -> None:
+        if self._purger_task:
+            self._purger_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._purger_task
+            self._purger_task = None
+
+    async def _purger(self, interval_sec: float) -> None:
+        while True:
+            await asyncio.sleep(interval_sec)
+            try:
+                self.purge()
+            except Exception:  # pragma: no cover
+                logger.warning("voice collector purge failed", exc_info=True)
+
+    def _live_transcript(self, key: str, now_ms: int) -> VoiceTranscript | None:
+        st = self._keys.get(key)
+        if st is None or st.transcript is None:
+            return None
+        if (now_ms - st.transcript.generated_at) > self._transcript_ttl_ms:
+            self._expire_key(key, now_ms)
+            return None
+        return st.transcript
+
+    # --- аудио ---
     async def add_chunk(self, room_key: str, data: bytes) -> None:
-        async with self._lock:
-            now_ms = int(time.time()*1000)
-            self._purge_expired_unlocked(now_ms)
-            self._chunks.setdefault(room_key, []).append(VoiceChunk(ts=now_ms, data=data))
+        now_ms = int(time.time()*1000)
+        self.purge(now_ms)
+        st = self._keys.get(room_key)
+        if st is None:
+            st = self._keys[room_key] = _KeyState()
+        if self._spool_enabled and not st.chunks:
+            if st.spool is None:
+                try:
+                    st.spool = VoiceSpool(now_ms, self._spool_dir)
+                    self._schedule(room_key, now_ms + self._chunk_ttl_ms)
+                except OSError:
+                    # Нет места / прав на временный каталог — деградируем в память
+                    st.spool = None
+            if st.spool is not None:
+                st.spool.append(data)
+                return
+        if not st.chunks:
+            st.chunks = []
+            self._schedule(room_key, now_ms + self._chunk_ttl_ms)
+        st.chunks.append(VoiceChunk(ts=now_ms, data=data))
+
+    async def take_audio(self, room_key: str) -> VoiceSpool | list[VoiceChunk] | None:
+        """Забрать накопленное аудио ключа: VoiceSpool (владелец закрывает его после загрузки) или список чанков."""
+        now_ms = int(time.time()*1000)
+        self._expire_key(room_key, now_ms)
+        st = self._keys.get(room_key)
+        if st is None:
+            return None
+        sp, chunks = st.spool, st.chunks or []
+        st.spool, st.chunks = None, None
+        if st.empty():
+            self._keys.pop(room_key, None)
+        if sp is not None and not sp:
+            sp.close()
+            sp = None
+        if sp is not None and not chunks:
+            return sp
+        if sp is not None:
+            # Смешанный случай (spool не открылся посреди записи): собираем в память по порядку
+            chunks = [VoiceChunk(ts=sp.first_ts, data=sp.read_all())] + chunks
+            sp.close()
+        return chunks or None
 
     async def get_and_clear_chunks(self, room_key: str) -> list[VoiceChunk]:
-        async with self._lock:
-            now_ms = int(time.time()*1000)
-            self._purge_expired_unlocked(now_ms)
-            chunks = self._chunks.pop(room_key, [])
-            return chunks
+        audio = await self.take_audio(room_key)
+        if isinstance(audio, VoiceSpool):
+            try:
+                return [VoiceChunk(ts=audio.first_ts, data=audio.read_all())] if audio else []
+            finally:
+                audio.close()
+        return audio or []
+
+    def spool_stats(self) -> Dict[str, int]:
+        """Активные spool'ы и их суммарный объём на диске (диагностика)."""
+        spools = [st.spool for st in self._keys.values() if st.spool is not None]
+        return {'spools': len(spools), 'spool_bytes': sum(sp.size for sp in spools),
+                'memory_chunk_bytes': sum(len(c.data) for st in self._keys.values() for c in (st.chunks or ()))}
 
+    # --- транскрипты ---
     async def store_transcript(self, room_key: str, text: str) -> VoiceTranscript:
-        vt = VoiceTranscript(room_id=room_key, text=text, generated_at=int(time.time()*1000))
-        async with self._lock:
-            now_ms = vt.generated_at
-            self._purge_expired_unlocked(now_ms)
-            self._transcripts[room_key] = vt
+        vt = VoiceTranscript(room_id=room_key, text=text, generated_at=int(time.time()*1000), segment=VoiceSegment.parse(text))
+        self.purge(vt.generated_at)
+        st = self._keys.get(room_key)
+        if st is None:
+            st = self._keys[room_key] = _KeyState()
+        st.transcript = vt
+        self._schedule(room_key, vt.generated_at + self._transcript_ttl_ms)
         return vt
 
     async def pop_transcript(self, room_key: str) -> VoiceTranscript | None:
-        async with self._lock:
-            now_ms = int(time.time()*1000)
-            self._purge_expired_unlocked(now_ms)
-            return self._transcripts.pop(room_key, None)
+        vt = self._live_transcript(room_key, int(time.time()*1000))
+        if vt is not None:
+            st = self._keys[room_key]
+            st.transcript = None
+            if st.empty():
+                self._keys.pop(room_key, None)
+        return vt
 
     async def get_transcript(self, room_key: str) -> VoiceTranscript | None:
         """Вернёт транскрипт без удаления (для повторной проверки готовности)."""
-        async with self._lock:
-            now_ms = int(time.time()*1000)
-            self._purge_expired_unlocked(now_ms)
-            return self._transcripts.get(room_key)
+        return self._live_transcript(room_key, int(time.time()*1000))
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, VoiceTranscript]:
+        """Пакетное чтение: {ключ: транскрипт} только для существующих и не просроченных ключей."""
+        now_ms = int(time.time()*1000)
+        out: Dict[str, VoiceTranscript] = {}
+        for k in keys:
+            vt = self._live_transcript(k, now_ms)
+            if vt is not None:
+                out[k] = vt
+        return out
 
 
 _voice_collector_singleton: VoiceTranscriptCollector | None = None
@@ -89,37 +291,34 @@ _voice_collector_singleton: VoiceTranscriptCollector | None = None
 def get_voice_collector() -> VoiceTranscriptCollector:
     global _voice_collector_singleton
     if _voice_collector_singleton is None:
-        _voice_collector_singleton = VoiceTranscriptCollector()
+        settings = get_settings()
+        if (getattr(settings, 'VOICE_TRANSCRIPTS_BACKEND', 'memory') or 'memory').lower() == 'redis':
+            try:
+                from redis.asyncio import from_url as redis_from_url
+                from .voice_transcripts_redis import RedisVoiceTranscriptCollector
+                _voice_collector_singleton = RedisVoiceTranscriptCollector(
+                    redis_from_url(settings.REDIS_URL, decode_responses=True),
+                    lru_size=getattr(settings, 'VOICE_TRANSCRIPTS_LRU_SIZE', 1024),
+                )
+            except Exception:  # pragma: no cover - fallback
+                _voice_collector_singleton = VoiceTranscriptCollector()
+        else:
+            _voice_collector_singleton = VoiceTranscriptCollector()
     return _voice_collector_singleton
 
 
-async def transcribe_chunks(room_id: str, chunks: list[VoiceChunk]) -> str:
-    """Отправить собранные webm opus чанки в OpenAI Whisper и вернуть текст.
+async def transcribe_chunks(room_id: str, chunks: list[VoiceChunk] | VoiceSpool) -> str:
+    """Распознать собранные webm opus чанки и вернуть текст.
 
-    MVP: склеиваем в один webm. Если нет ключа или выключено — возвращаем placeholder.
+    VoiceSpool уходит в движок как файловый объект (без копий в памяти) и переходит во владение пула:
+    он закрывается, когда пул его дочитал (вызывающему закрывать не нужно). Список чанков склеивается
+    одним join. Распознавание идёт через общий пул (get_asr_pool): очередь, лимит воркеров, кэш по хешу.
     """
-    settings = get_settings()
-    if not settings.OPENAI_API_KEY:
-        return "(asr disabled: no OPENAI_API_KEY)"
-    # Склейка
-    bio = io.BytesIO()
-    for ch in chunks:
-        bio.write(ch.data)
-    bio.seek(0)
-    files = {
-        'file': ('audio.webm', bio.read(), 'audio/webm'),
-    }
-    data = {
-        'model': settings.VOICE_ASR_MODEL or 'whisper-1',
-        'response_format': 'text'
-    }
-    headers = { 'Authorization': f'Bearer {settings.OPENAI_API_KEY}' }
-    url = 'https://api.openai.com/v1/audio/transcriptions'
-    try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            r = await client.post(url, data=data, files=files, headers=headers)
-            if r.status_code == 200:
-                return r.text.strip()
-            return f"(asr failed http {r.status_code})"
-    except Exception as e:  # pragma: no cover
-        return f"(asr exception {e.__class__.__name__})"
+    if isinstance(chunks, VoiceSpool):
+        try:
+            payload = chunks.open_for_upload()
+        except Exception:
+            chunks.close()
+            raise
+        return await get_asr_pool().transcribe(payload, release=chunks.close)
+    return await get_asr_pool().transcribe(b"".join(ch.data for ch in chunks))
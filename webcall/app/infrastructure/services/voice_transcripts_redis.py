@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+"""Redis хранилище голосовых транскриптов (общий для всех воркеров).
+
+/ws/voice_capture и /ws/rooms могут обслуживаться разными процессами: in-process коллектор
+summary воркера транскрипт не увидит. Здесь транскрипты лежат в Redis:
+  - String voice_transcript:{key} => JSON {text, generated_at}, EX = TTL транскрипта
+  - Pub/Sub канал voice_transcripts — уведомление о store/pop (другие узлы обновляют свой LRU)
+Перед Redis — локальный LRU узла, чтобы частый путь (тот же воркер / повторное чтение) не ходил в сеть.
+Сырые чанки остаются локальными (spool): их пишет и финализирует одно и то же WS соединение.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable
+import asyncio
+import contextlib
+import json
+import logging
+import time
+import uuid
+
+from redis.asyncio import Redis
+
+from .summary_v2.models import VoiceSegment
+from .voice_transcript import VoiceTranscript, VoiceTranscriptCollector
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = 'voice_transcripts'
+
+
+class RedisVoiceTranscriptCollector(VoiceTranscriptCollector):
+    def __init__(self, redis: Redis, *, lru_size: int = 1024, spool: bool | None = None, spool_dir: str | None = None) -> None:
+        super().__init__(spool=spool, spool_dir=spool_dir)
+        self.redis = redis
+        self._lru: OrderedDict[str, VoiceTranscript] = OrderedDict()
+        self._lru_size = max(16, int(lru_size or 1024))
+        self._node_id = uuid.uuid4().hex
+        self._listener_task: asyncio.Task | None = None
+
+    def _redis_key(self, room_key: str) -> str:
+        return f"voice_transcript:{room_key}"
+
+    # --- локальный LRU ---
+    def _lru_get(self, room_key: str, now_ms: int) -> VoiceTranscript | None:
+        vt = self._lru.get(room_key)
+        if vt is None:
+            return None
+        if (now_ms - vt.generated_at) > self._transcript_ttl_ms:
+            self._lru.pop(room_key, None)
+            return None
+        self._lru.move_to_end(room_key)
+        return vt
+
+    def _lru_put(self, room_key: str, vt: VoiceTranscript) -> None:
+        self._lru[room_key] = vt
+        self._lru.move_to_end(room_key)
+        while len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+
+    def _decode(self, room_key: str, raw: str | bytes | None) -> VoiceTranscript | None:
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw)
+            text = data['text']
+            return VoiceTranscript(room_id=room_key, text=text, generated_at=int(data['generated_at']), segment=VoiceSegment.parse(text))
+        except Exception:
+            return None
+
+    async def _publish(self, event: dict) -> None:
+        event['node'] = self._node_id
+        with contextlib.suppress(Exception):
+            await self.redis.publish(EVENTS_CHANNEL, json.dumps(event))
+
+    # --- транскрипты ---
+    async def store_transcript(self, room_key: str, text: str) -> VoiceTranscript:
+        vt = VoiceTranscript(room_id=room_key, text=text, generated_at=int(time.time()*1000), segment=VoiceSegment.parse(text))
+        self._lru_put(room_key, vt)
+        try:
+            ttl_sec = max(1, self._transcript_ttl_ms // 1000)
+            await self.redis.set(self._redis_key(room_key), json.dumps({'text': text, 'generated_at': vt.generated_at}), ex=ttl_sec)
+        except Exception:
+            # Redis недоступен — деградируем до локального хранения
+            logger.warning("voice transcripts: redis store failed key=%s, keeping local", room_key, exc_info=True)
+            return await super().store_transcript(room_key, text)
+        await self._publish({'op': 'store', 'key': room_key, 'text': text, 'generated_at': vt.generated_at})
+        return vt
+
+    async def get_transcript(self, room_key: str) -> VoiceTranscript | None:
+        return (await self.get_many([room_key])).get(room_key)
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, VoiceTranscript]:
+        now_ms = int(time.time()*1000)
+        out: Dict[str, VoiceTranscript] = {}
+        missing: list[str] = []
+        for k in dict.fromkeys(keys):
+            vt = self._lru_get(k, now_ms)
+            if vt is not None:
+                out[k] = vt
+            else:
+                missing.append(k)
+        if not missing:
+            return out
+        try:
+            raws = await self.redis.mget([self._redis_key(k) for k in missing])
+        except Exception:
+            logger.debug("voice transcripts: redis mget failed, using local", exc_info=True)
+            out.update(await super().get_many(missing))
+            return out
+        for k, raw in zip(missing, raws):
+            vt = self._decode(k, raw)
+            if vt is not None:
+                self._lru_put(k, vt)
+                out[k] = vt
+        local = await super().get_many([k for k in missing if k not in out])
+        out.update(local)
+        return out
+
+    async def pop_transcript(self, room_key: str) -> VoiceTranscript | None:
+        now_ms = int(time.time()*1000)
+        vt = self._lru_get(room_key, now_ms)
+        self._lru.pop(room_key, None)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.get(self._redis_key(room_key))
+            pipe.delete(self._redis_key(room_key))
+            raw, _deleted = await pipe.execute()
+        except Exception:
+            local = await super().pop_transcript(room_key)
+            return vt or local
+        remote = self._decode(room_key, raw)
+        local = await super().pop_transcript(room_key)
+        if remote is not None or vt is not None:
+            await self._publish({'op': 'pop', 'key': room_key})
+        return remote or vt or local
+
+    # --- уведомления других узлов ---
+    def _handle_event(self, payload: str | bytes) -> None:
+        try:
+            event = json.loads(payload)
+        except Exception:
+            return
+        if event.get('node') == self._node_id:
+            return
+        key = event.get('key')
+        if not key:
+            return
+        if event.get('op') == 'store' and isinstance(event.get('text'), str):
+            text = event['text']
+            self._lru_put(key, VoiceTranscript(room_id=key, text=text, generated_at=int(event.get('generated_at') or time.time()*1000), segment=VoiceSegment.parse(text)))
+        elif event.get('op') == 'pop':
+            self._lru.pop(key, None)
+
+    async def _listener(self) -> None:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(EVENTS_CHANNEL)
+        try:
+            async for msg in pubsub.listen():
+                if msg.get('type') != 'message':
+                    continue
+                self._handle_event(msg['data'])
+        finally:
+            with contextlib.suppress(Exception):
+                await pubsub.unsubscribe(EVENTS_CHANNEL)
+                await pubsub.close()
+
+    def start_purger(self, interval_sec: float = 30.0) -> None:
+        # Вместе с очисткой локального состояния поднимаем подписку на события других узлов
+        super().start_purger(interval_sec)
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listener())
+
+    async def shutdown(self) -> None:
+        if self._listener_task:
+            self._listener_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await self._listener_task
+            self._listener_task = None
+        await super().shutdown()
@@ -1,8 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from dataclasses import dataclass
-from typing import Iterable
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlparse
+from uuid import UUID
 
 import anyio
 try:
@@ -10,6 +17,18 @@ try:
 except Exception:  # pragma: no cover
     webpush = None  # type: ignore
     WebPushException = Exception  # type: ignore
+try:
+    from py_vapid import Vapid  # type: ignore
+except Exception:  # pragma: no cover
+    Vapid = None  # type: ignore
+try:
+    import requests  # type: ignore
+except Exception:  # pragma: no cover
+    requests = None  # type: ignore
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -49,3 +68,148 @@ class WebPushSender:
         def _do():
             return webpush(subscription_info=sub, data=payload, vapid_private_key=self.vapid_private, vapid_claims=claims)
         await anyio.to_thread.run_sync(_do)
+
+
+@dataclass
+class PushBatchResult:
+    sent: int = 0
+    failed: int = 0
+    gone: List[str] = field(default_factory=list)  # endpoint'ы с ответом 404/410 (подписка мертва)
+
+
+class PushDeliveryService:
+    """Доставка Web Push: общий пул потоков и HTTP сессия, VAPID заголовки кэшируются по origin.
+
+    pywebpush на каждый вызов заново разбирает ключ и подписывает VAPID JWT (ECDSA). Здесь ключ
+    разбирается один раз, а заголовок Authorization подписывается один раз на push-сервис (origin
+    endpoint'а) и переиспользуется до подхода к exp. Устройства пользователя обслуживаются
+    конкурентно; мёртвые подписки (404/410) возвращаются пачкой для одного DELETE.
+    """
+
+    HEADER_TTL_SEC = 12 * 3600  # exp JWT (максимум по RFC 8292 — 24ч)
+    REFRESH_MARGIN_SEC = 3600  # переподписываем заранее, чтобы заголовок не истёк в полёте
+    MAX_ATTEMPTS = 3
+    RETRY_STATUSES = (429, 500, 502, 503)
+
+    def __init__(self, vapid_private: str, subject: str, *, max_workers: int = 8, ttl: int = 0) -> None:
+        self.subject = subject
+        self.ttl = ttl
+        self._vapid_private = vapid_private
+        self._vapid = None
+        self._headers: Dict[str, Tuple[dict, float]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix='webpush')
+        self._session = None
+        if requests is not None:
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=max(1, int(max_workers)))
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+
+    @staticmethod
+    def _origin(endpoint: str) -> str:
+        u = urlparse(endpoint)
+        return f"{u.scheme}://{u.netloc}"
+
+    def _vapid_headers(self, endpoint: str) -> dict:
+        """Authorization для push-сервиса endpoint'а (из кэша, пока до exp больше REFRESH_MARGIN_SEC)."""
+        aud = self._origin(endpoint)
+        now = time.time()
+        with self._lock:
+            cached = self._headers.get(aud)
+            if cached is not None and cached[1] - now > self.REFRESH_MARGIN_SEC:
+                return cached[0]
+            if self._vapid is None:
+                self._vapid = Vapid.from_string(private_key=self._vapid_private)
+            exp = int(now) + self.HEADER_TTL_SEC
+            headers = self._vapid.sign({'sub': self.subject, 'aud': aud, 'exp': exp})
+            self._headers[aud] = (headers, exp)
+            return headers
+
+    def _send_sync(self, endpoint: str, p256dh: str, auth: str, payload: str) -> int:
+        """Отправка в потоке пула. Возвращает HTTP статус (201 — успех, 0 — сетевая ошибка)."""
+        sub = {"endpoint": endpoint, "keys": {"p256dh": p256dh, "auth": auth}}
+        try:
+            resp = webpush(subscription_info=sub, data=payload, headers=self._vapid_headers(endpoint),
+                           ttl=self.ttl, requests_session=self._session)
+            return int(getattr(resp, 'status_code', 201) or 201)
+        except WebPushException as e:
+            return int(getattr(getattr(e, 'response', None), 'status_code', 0) or 0)
+        except Exception as e:  # pragma: no cover - сеть
+            logger.debug("webpush: send error endpoint_hash=%s err=%s", hash(endpoint), e)
+            return 0
+
+    async def send(self, endpoint: str, p256dh: str, auth: str, message: WebPushMessage) -> str:
+        """'sent' | 'gone' | 'failed'; временные ошибки (429/5xx/сеть) ретраятся."""
+        loop = asyncio.get_running_loop()
+        payload = message.json()
+        status = 0
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            status = await loop.run_in_executor(self._executor, self._send_sync, endpoint, p256dh, auth, payload)
+            if status and status < 300:
+                return 'sent'
+            if status in (404, 410):
+                return 'gone'
+            if status and status not in self.RETRY_STATUSES:
+                break
+            if attempt < self.MAX_ATTEMPTS:
+                await asyncio.sleep(0.2 * attempt)
+        logger.info("webpush: failed status=%s endpoint_hash=%s", status, hash(endpoint))
+        return 'failed'
+
+    async def send_many(self, subs: Iterable, message: WebPushMessage) -> PushBatchResult:
+        subs = list(subs)
+        result = PushBatchResult()
+        if not subs:
+            return result
+        outcomes = await asyncio.gather(*(self.send(s.endpoint, s.p256dh, s.auth, message) for s in subs), return_exceptions=True)
+        for s, outcome in zip(subs, outcomes):
+            if outcome == 'sent':
+                result.sent += 1
+            elif outcome == 'gone':
+                result.gone.append(s.endpoint)
+            else:
+                result.failed += 1
+        return result
+
+    async def deliver(self, subs_repo, user_id: UUID, message: WebPushMessage, subs: Iterable | None = None) -> PushBatchResult:
+        """Отправить на все устройства пользователя и удалить мёртвые подписки одним запросом."""
+        if subs is None:
+            subs = await subs_repo.list_by_user(user_id)
+        result = await self.send_many(subs, message)
+        if result.gone:
+            try:
+                await subs_repo.remove_many(user_id, result.gone)
+            except Exception as e:  # pragma: no cover
+                logger.warning("webpush: prune failed user=%s endpoints=%s err=%s", user_id, len(result.gone), e)
+        return result
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._session is not None:
+            self._session.close()
+
+
+_delivery_singleton: PushDeliveryService | None = None
+
+
+def get_push_delivery() -> PushDeliveryService | None:
+    """Общий сервис доставки; None — VAPID не настроен или нет pywebpush."""
+    global _delivery_singleton
+    if _delivery_singleton is None:
+        settings = get_settings()
+        if not (webpush and Vapid and settings.VAPID_PUBLIC_KEY and settings.VAPID_PRIVATE_KEY and settings.VAPID_SUBJECT):
+            return None
+        _delivery_singleton = PushDeliveryService(
+            settings.VAPID_PRIVATE_KEY,
+            settings.VAPID_SUBJECT,
+            max_workers=int(getattr(settings, 'PUSH_SEND_WORKERS', 8) or 8),
+        )
+    return _delivery_singleton
+
+
+def shutdown_push_delivery() -> None:
+    global _delivery_singleton
+    if _delivery_singleton is not None:
+        _delivery_singleton.shutdown()
+        _delivery_singleton = None
@@ -3,7 +3,7 @@ from __future__ import annotations
 from typing import List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
 from pydantic import BaseModel
 
 from ....core.domain.models import DirectMessage, FriendStatus
@@ -11,19 +11,16 @@ from ....core.ports.repositories import FriendshipRepository, DirectMessageRepos
 from ..deps.auth import get_current_user
 from ..deps.containers import get_db_session
 from ....infrastructure.db.repositories.friends import PgFriendshipRepository
-from ....infrastructure.db.repositories.direct_messages import PgDirectMessageRepository
+from ....infrastructure.db.repositories.direct_messages import PgDirectMessageRepository, decode_cursor, encode_cursor
 from ....infrastructure.db.repositories.direct_reads import PgDirectReadStateRepository
 from ....infrastructure.db.repositories.push_subs import PgPushSubscriptionRepository
 from ....infrastructure.db.repositories.users import PgUserRepository
 from ..deps.containers import get_user_repo
 from ....infrastructure.db.session import get_session
-from ....infrastructure.services.webpush import WebPushSender, WebPushMessage
-from ....infrastructure.config import get_settings
-from ...ws.friends import publish_direct_message, publish_direct_cleared
-from ....infrastructure.db.repositories.users import PgUserRepository
-from ....infrastructure.services.direct_crypto import decrypt_direct, encrypt_direct
-from sqlalchemy import select, and_, func
-from ....infrastructure.db import models as m
+from ....infrastructure.services.webpush import WebPushMessage, get_push_delivery
+from ....infrastructure.services.direct_push_jobs import get_direct_push_scheduler
+from ...ws.friends import publish_direct_message, publish_direct_cleared, publish_unread_update
+from ....infrastructure.services.direct_crypto import decrypt_direct_batch, encrypt_direct
 
 router = APIRouter(prefix='/api/v1/direct', tags=['direct'])
 
@@ -38,6 +35,7 @@ class DirectMessageOut(BaseModel):
     to_user_id: UUID
     content: str
     sent_at: str
+    cursor: str | None = None  # позиция для ?before= (старше) / ?since= (новее)
 
 
 async def get_friend_repo(session=Depends(get_db_session)) -> FriendshipRepository:
@@ -71,29 +69,39 @@ async def get_friend_public_key(friend_id: UUID, users: PgUserRepository = Depen
 
 
 @router.get('/{friend_id}/messages', response_model=List[DirectMessageOut])
-async def list_direct_messages(friend_id: UUID, current=Depends(get_current_user), frepo: FriendshipRepository = Depends(get_friend_repo), dms: DirectMessageRepository = Depends(get_dm_repo)):
+async def list_direct_messages(
+    friend_id: UUID,
+    limit: int = Query(100, ge=1, le=200),
+    before: str | None = Query(None, description="Курсор: сообщения старше указанного"),
+    since: str | None = Query(None, description="Курсор: только сообщения новее указанного (delta после переподключения)"),
+    current=Depends(get_current_user),
+    frepo: FriendshipRepository = Depends(get_friend_repo),
+    dms: DirectMessageRepository = Depends(get_dm_repo),
+):
     f = await frepo.get_pair(current.id, friend_id)
     if not f or f.status != FriendStatus.accepted:
         raise HTTPException(status_code=404, detail='Not friends')
-    rows = await dms.list_pair(current.id, friend_id, limit=100)
-    # Возвращаем в прямом порядке по времени (старые -> новые)
-    rows = list(reversed(rows))
+    try:
+        before_key = decode_cursor(before) if before else None
+        since_key = decode_cursor(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if since_key is not None:
+        # Delta: уже в прямом порядке (старые -> новые); клиент продолжает с cursor последнего
+        rows = await dms.list_pair_keyset(current.id, friend_id, limit=limit, after=since_key)
+    else:
+        rows = await dms.list_pair_keyset(current.id, friend_id, limit=limit, before=before_key)
+        # Возвращаем в прямом порядке по времени (старые -> новые)
+        rows = list(reversed(rows))
+    # Возвращаем уже расшифрованный plaintext — клиенту не нужно E2EE для DM (упрощённый подход).
+    # Ключ выводится по паре id, поэтому обе стороны получают plaintext; нерасшифрованные сообщения
+    # (повреждённый ciphertext или ключи не совпадают) отдаются как есть — клиент попробует локально.
+    # Большие страницы расшифровываются в пуле потоков.
+    contents = await decrypt_direct_batch([(dm.user_a_id, dm.user_b_id, dm.ciphertext) for dm in rows])
     result: list[DirectMessageOut] = []
-    # Возвращаем уже расшифрованный plaintext — клиенту не нужно E2EE для DM (упрощённый подход)
-    for dm in rows:
+    for dm, content in zip(rows, contents):
         to_user = friend_id if dm.sender_id == current.id else current.id
-        # Попробуем расшифровать на сервере для участника переписки.
-        # Расшифровка выполняется только когда текущий пользователь является участником пары (т.е. он здесь),
-        # и ключ выводим по паре id — поэтому обе стороны смогут получить plaintext.
-        content = dm.ciphertext
-        try:
-            # decrypt_direct ожидает a, b как UUID (порядок внутри функции нормализуется)
-            content = decrypt_direct(dm.user_a_id, dm.user_b_id, dm.ciphertext)
-        except Exception:
-            # Если расшифровка не удалась (повреждённый ciphertext или ключи не совпадают),
-            # возвращаем оригинальный ciphertext — клиент попытается расшифровать локально.
-            content = dm.ciphertext
-        result.append(DirectMessageOut(id=dm.id, from_user_id=dm.sender_id, to_user_id=to_user, content=content, sent_at=dm.sent_at.isoformat()))
+        result.append(DirectMessageOut(id=dm.id, from_user_id=dm.sender_id, to_user_id=to_user, content=content, sent_at=dm.sent_at.isoformat(), cursor=encode_cursor(dm.sent_at, dm.id)))
     return result
 
 
@@ -115,7 +123,17 @@ async def mark_direct_read(friend_id: UUID, body: ReadAckIn | None = None, curre
         when = None
     if when is None:
         when = datetime.utcnow()
-    await reads.set_last_read(current.id, friend_id, when)
+    unread = await reads.set_last_read(current.id, friend_id, when)
+    # Остальные устройства пользователя обновят бейдж без опроса
+    try:
+        await publish_unread_update(current.id, friend_id, unread or 0)
+    except Exception:
+        pass
+    # Прочитано — отложенный push об этой переписке больше не нужен
+    try:
+        await get_direct_push_scheduler().cancel(current.id, friend_id)
+    except Exception:
+        pass
     return {"ok": True}
 
 
@@ -130,32 +148,25 @@ async def post_direct_message(friend_id: UUID, body: DirectMessageIn, background
     # Новый подход: клиент присылает plaintext, сервер шифрует и хранит ciphertext
     ciphertext = encrypt_direct(current.id, friend_id, content)
     dm = DirectMessage.create(current.id, friend_id, current.id, ciphertext)
-    await dms.add(dm)
+    # Порядковый номер сообщения в паре (счётчик direct_pair_stats, обновляется в той же транзакции)
+    msg_index: int | None = await dms.add(dm)
     # Публикация события обеим сторонам (ciphertext)
     try:
         # Рассылаем plaintext, чтобы клиент сразу показал читаемый текст
         await publish_direct_message(current.id, friend_id, dm.id, content, dm.sent_at)
     except Exception:
         pass
-    # Определяем порядковый номер сообщения в паре (после сохранения)
-    msg_index: int | None = None
+    # Счётчик непрочитанных получателя уже увеличен в транзакции dms.add — только событие unread_update
     try:
-        # Подсчёт количества сообщений в паре (включая текущее)
-        a_s, b_s = str(current.id), str(friend_id)
-        if a_s <= b_s:
-            ua, ub = current.id, friend_id
-        else:
-            ua, ub = friend_id, current.id
-        stmt_cnt = select(func.count()).select_from(m.DirectMessages).where(and_(m.DirectMessages.user_a_id == ua, m.DirectMessages.user_b_id == ub))
-        res_cnt = await dms.session.execute(stmt_cnt)  # type: ignore[attr-defined]
-        msg_index = int(res_cnt.scalar_one() or 0)
+        unread = await reads.get_unread(friend_id, current.id)
+        await publish_unread_update(friend_id, current.id, unread)
     except Exception:
-        msg_index = None
+        pass
 
     # Мгновенное пуш-уведомление получателю только на каждое 10-е сообщение
     async def _instant_push(sender_id: UUID, to_id: UUID, ciphertext: str, ordinal: int | None):
-        settings = get_settings()
-        if not (settings.VAPID_PUBLIC_KEY and settings.VAPID_PRIVATE_KEY and settings.VAPID_SUBJECT):
+        delivery = get_push_delivery()
+        if delivery is None:
             return
         if ordinal is not None and ordinal % 10 != 0:
             return
@@ -167,81 +178,25 @@ async def post_direct_message(friend_id: UUID, body: DirectMessageIn, background
                 return
             sender_user = await user_repo_local.get_by_id(sender_id)
             sender_name = sender_user.username if sender_user else "пользователь"
-            push_sender = WebPushSender(
-                vapid_public=settings.VAPID_PUBLIC_KEY,
-                vapid_private=settings.VAPID_PRIVATE_KEY,
-                subject=settings.VAPID_SUBJECT,
-            )
             title = "Новое сообщение"
             body_text = f"Вам новое сообщение"  # avoid including plaintext in push
-            for s in subs:
-                try:
-                    await push_sender.send(
-                        s.endpoint,
-                        s.p256dh,
-                        s.auth,
-                        WebPushMessage(title=title, body=body_text, data={"type": "direct", "from": str(sender_id)}),
-                    )
-                except Exception:
-                    pass
+            try:
+                await delivery.deliver(push_repo_local, to_id, WebPushMessage(title=title, body=body_text, data={"type": "direct", "from": str(sender_id)}), subs=subs)
+            except Exception:
+                pass
     background.add_task(_instant_push, current.id, friend_id, ciphertext, msg_index)
-    # Планируем отложенное пуш-уведомление через 10 минут, если получатель не прочитал.
-    # Тоже только для кратности 10.
-    async def _delayed_push_if_unread(sender_id: UUID, to_id: UUID, sent_at_iso: str, ordinal: int | None):
-        # Ждём 10 минут, затем проверяем, прочитано ли сообщение (по last_read)
-        import asyncio
-        from datetime import datetime
-        await asyncio.sleep(600)
-        # Настройки push
-        settings = get_settings()
-        if not (settings.VAPID_PUBLIC_KEY and settings.VAPID_PRIVATE_KEY and settings.VAPID_SUBJECT):
-            return
-        if ordinal is not None and ordinal % 10 != 0:
-            return
-        # Парсим время отправки сообщения
+    # Отложенное пуш-уведомление (через DIRECT_PUSH_DELAY_SEC, если получатель не прочитал) — задача в
+    # direct_push_jobs, её разбирает планировщик. Тоже только для кратности 10; ожидающий push отправителю
+    # об этой переписке (он ответил) уже снят в транзакции dms.add.
+    async def _schedule_delayed_push(sender_id: UUID, to_id: UUID, sent_at):
         try:
-            sent_at = datetime.fromisoformat(sent_at_iso)
+            await get_direct_push_scheduler().schedule(to_id, sender_id, sent_at)
         except Exception:
-            return
-        # Открываем новую БД-сессию и переиспользуем репозитории
-        async with get_session() as session:
-            reads_repo = PgDirectReadStateRepository(session)
-            push_repo_local = PgPushSubscriptionRepository(session)
-            user_repo_local = PgUserRepository(session)
-            try:
-                last_read = await reads_repo.get_last_read(to_id, sender_id)
-            except Exception:
-                last_read = None
-            # Если прочитано (last_read >= sent_at) — пуш не нужен
-            if last_read is not None and last_read >= sent_at:
-                return
-            # Готовим данные уведомления
-            sender_user = await user_repo_local.get_by_id(sender_id)
-            sender_name = sender_user.username if sender_user else "пользователь"
-            subs = await push_repo_local.list_by_user(to_id)
-            if not subs:
-                return
-            push_sender = WebPushSender(
-                vapid_public=settings.VAPID_PUBLIC_KEY,
-                vapid_private=settings.VAPID_PRIVATE_KEY,
-                subject=settings.VAPID_SUBJECT,
-            )
-            title = "Новое сообщение"
-            body_text = f"Вам новое сообщение"  # do not include message body
-            for s in subs:
-                try:
-                    await push_sender.send(
-                        s.endpoint,
-                        s.p256dh,
-                        s.auth,
-                        WebPushMessage(title=title, body=body_text, data={"type": "direct", "from": str(sender_id)}),
-                    )
-                except Exception:
-                    # игнорируем ошибки доставки
-                    pass
-
-    background.add_task(_delayed_push_if_unread, current.id, friend_id, dm.sent_at.isoformat(), msg_index)
-    return DirectMessageOut(id=dm.id, from_user_id=current.id, to_user_id=friend_id, content=content, sent_at=dm.sent_at.isoformat())
+            pass
+
+    if get_push_delivery() is not None and (msg_index is None or msg_index % 10 == 0):
+        background.add_task(_schedule_delayed_push, current.id, friend_id, dm.sent_at)
+    return DirectMessageOut(id=dm.id, from_user_id=current.id, to_user_id=friend_id, content=content, sent_at=dm.sent_at.isoformat(), cursor=encode_cursor(dm.sent_at, dm.id))
 
 
 class DirectDeleteResult(BaseModel):
@@ -5,13 +5,11 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from ....core.domain.models import Friendship, FriendStatus
+from ....core.domain.models import Friendship, FriendListItem, FriendStatus
 from ....core.errors import ConflictError
-from ....core.ports.repositories import FriendshipRepository, UserRepository, DirectMessageRepository, DirectReadStateRepository
+from ....core.ports.repositories import FriendshipRepository
 from ..deps.auth import get_current_user
-from ..deps.containers import get_user_repo, get_db_session
-from ....infrastructure.db.repositories.direct_messages import PgDirectMessageRepository
-from ....infrastructure.db.repositories.direct_reads import PgDirectReadStateRepository
+from ..deps.containers import get_db_session
 from ....infrastructure.db.repositories.friends import PgFriendshipRepository
 from pydantic import BaseModel
 from ...ws.friends import (
@@ -47,59 +45,36 @@ async def get_friend_repo(session=Depends(get_db_session)) -> FriendshipReposito
     return PgFriendshipRepository(session)
 
 
+def _item_out(item: FriendListItem) -> FriendshipOut:
+    f = item.friendship
+    return FriendshipOut(
+        id=f.id,
+        user_id=item.other_id,
+        status=f.status,
+        requested_by=f.requested_by,
+        username=item.username,
+        email=item.email,
+        unread=item.unread,
+    )
+
+
 @router.get("/", response_model=List[FriendshipOut])
 async def list_friends(
     current=Depends(get_current_user),
     repo: FriendshipRepository = Depends(get_friend_repo),
-    users: UserRepository = Depends(get_user_repo),
-    dms: DirectMessageRepository = Depends(lambda session=Depends(get_db_session): PgDirectMessageRepository(session)),
-    reads: DirectReadStateRepository = Depends(lambda session=Depends(get_db_session): PgDirectReadStateRepository(session)),
 ):
-    items = await repo.list_friends(current.id, status=FriendStatus.accepted)
-    result: list[FriendshipOut] = []
-    for f in items:
-        other_id = _other_side(f, current.id)
-        u = await users.get_by_id(other_id)
-        last_read = await reads.get_last_read(current.id, other_id)
-        unread = await dms.count_unread(current.id, other_id, last_read)
-        result.append(
-            FriendshipOut(
-                id=f.id,
-                user_id=other_id,
-                status=f.status,
-                requested_by=f.requested_by,
-                # u.username это value object Username -> явно приводим к str
-                username=(str(u.username) if u and u.username is not None else None),
-                email=(str(u.email) if u else None),
-                unread=unread,
-            )
-        )
-    return result
+    # Друзья, профили и непрочитанные — одним запросом
+    items = await repo.list_overview(current.id)
+    return [_item_out(i) for i in items]
 
 
 @router.get("/requests", response_model=List[FriendshipOut])
 async def list_requests(
     current=Depends(get_current_user),
     repo: FriendshipRepository = Depends(get_friend_repo),
-    users: UserRepository = Depends(get_user_repo),
 ):
-    items = await repo.list_requests(current.id)
-    result: list[FriendshipOut] = []
-    for f in items:
-        other_id = _other_side(f, current.id)
-        u = await users.get_by_id(other_id)
-        result.append(
-            FriendshipOut(
-                id=f.id,
-                user_id=other_id,
-                status=f.status,
-                requested_by=f.requested_by,
-                # Явное приведение value object Username к str
-                username=(str(u.username) if u and u.username is not None else None),
-                email=(str(u.email) if u else None),
-            )
-        )
-    return result
+    items = await repo.list_overview(current.id, requests=True, with_unread=False)
+    return [_item_out(i) for i in items]
 
 
 @router.post("/request", status_code=201)
@@ -8,7 +8,7 @@ import { els, appendLog, appendChat, setText, setEnabled, showToast } from './do
 import { appState } from './state.js';
 import { loadVisitedRooms } from '../visited_rooms.js';
 import { initFriendsModule, loadFriends, scheduleFriendsReload, initFriendsUI, markFriendSeen, refreshFriendStatuses, setOnlineSnapshot, addOnlineUser, removeOnlineUser } from '../friends_ui.js';
-import { initDirectChatModule, handleIncomingDirect, handleDirectCleared, bindSendDirect } from '../direct_chat.js';
+import { initDirectChatModule, handleIncomingDirect, handleDirectCleared, handleUnreadUpdate, bindSendDirect } from '../direct_chat.js';
 // Legacy calls.js оставляем временно для обратной совместимости (звук, часть тестов)
 import { startSpecialRingtone, stopSpecialRingtone, resetActiveCall, getActiveCall, initCallModule } from '../calls.js';
 // Новый signaling слой
@@ -843,6 +843,7 @@ function startFriendsWs(){
         case 'friend_removed': scheduleFriendsReload(); break;
   case 'direct_message': handleIncomingDirect(msg); try { const acc=getAccountId(); const other= msg.fromUserId === acc ? msg.toUserId : msg.fromUserId; markFriendSeen(other); const isActiveChat = appState.currentDirectFriend && other === appState.currentDirectFriend; const iAmRecipient = msg.toUserId === acc; if (iAmRecipient && !isActiveChat && 'Notification' in window && Notification.permission==='granted'){ const title = 'Новое сообщение'; const body = msg.fromUsername ? `От ${msg.fromUsername}` : 'Личное сообщение'; const reg = await navigator.serviceWorker.getRegistration('/static/sw.js'); if (reg && reg.showNotification){ reg.showNotification(title, { body, data:{ type:'direct', from: other } }); } else { new Notification(title, { body, data:{ type:'direct', from: other } }); } } } catch {} break;
         case 'direct_cleared': handleDirectCleared(msg); break;
+        case 'unread_update': try { handleUnreadUpdate(msg); } catch {} break;
         case 'call_invite':
         case 'call_accept':
         case 'call_decline':
@@ -135,6 +135,17 @@ export function handleIncomingDirect(msg){
   }
 }
 
+// unread_update: серверное значение счётчика непрочитанных от друга (новое сообщение, read-ack с другого устройства)
+export function handleUnreadUpdate(msg){
+  const friendId = msg.friendId;
+  if (!friendId) return;
+  const unread = Number(msg.unread) || 0;
+  // Открытый чат читается сейчас — бейдж не показываем, сервер обнулит счётчик по read-ack
+  if (unread > 0 && friendId !== appState.currentDirectFriend) appState.directUnread.set(friendId, unread);
+  else appState.directUnread.delete(friendId);
+  updateFriendUnreadBadge(friendId);
+}
+
 export function handleDirectCleared(msg){
   if (!appState.currentDirectFriend) return;
   const acc = hooks.getAccountId(); if (!acc) return;
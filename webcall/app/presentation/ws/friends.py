@@ -297,6 +297,16 @@ async def publish_direct_message(from_user: UUID, to_user: UUID, message_id: UUI
     await broadcast_users({from_user, to_user}, payload)
 
 
+async def publish_unread_update(user_id: UUID, friend_id: UUID, unread: int):
+    """Новое значение счётчика непрочитанных user_id от friend_id (клиенту не нужно опрашивать список друзей)."""
+    payload = {
+        'type': 'unread_update',
+        'friendId': str(friend_id),
+        'unread': int(unread),
+    }
+    await broadcast_user(user_id, payload)
+
+
 async def publish_direct_cleared(user_a: UUID, user_b: UUID):
     payload = {
         'type': 'direct_cleared',
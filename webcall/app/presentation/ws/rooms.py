@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-import os, asyncio, contextlib, time, re, json
+import os, asyncio, contextlib, dataclasses, time, re, json
 from typing import Any
 from collections import defaultdict
 from uuid import UUID, uuid5, NAMESPACE_URL
@@ -12,12 +12,13 @@ from ...infrastructure.services.summary import get_summary_collector, SummaryCol
 from ...infrastructure.services.voice_transcript import get_voice_collector
 from ...infrastructure.services.ai_provider import get_ai_provider, get_user_system_prompt
 from ...infrastructure.services.summary_v2.orchestrator import get_summary_orchestrator
+from ...infrastructure.services.summary_v2.models import VoiceSegment
 from ...infrastructure.services.telegram import send_message as tg_send_message
 from ...infrastructure.services.telegram_dispatcher import get_dispatcher
 from sqlalchemy.ext.asyncio import AsyncSession
 from ...infrastructure.db.session import get_db_session
 from prometheus_client import Counter
-from ...infrastructure.services.telegram_link import get_confirmed_chat_id
+from ...infrastructure.services.telegram_link import get_confirmed_chat_id, get_confirmed_chat_ids
 
 from ...core.domain.models import Signal
 from ...core.ports.services import SignalBus, TokenProvider
@@ -54,6 +55,11 @@ _room_messages_archive: dict[UUID, list] = {}
 _room_message_log: dict[UUID, list] = defaultdict(list)
 # Время старта персонального агента для пользователя в комнате (ms epoch)
 _room_agent_start: dict[tuple[UUID, UUID], int] = {}
+# Отложенная очистка персонального состояния опустевших комнат (room -> задача)
+_room_prune_tasks: dict[UUID, asyncio.Task] = {}
+# Сколько держать состояние после ухода последнего участника: авто-voice триггер
+# (распознавание stop) может прийти позже и должен видеть, кому summary уже доставлено
+_ROOM_STATE_PRUNE_DELAY_SEC = 120.0
 # Rate limiting + buffering state for proxy voice
 _voice_proxy_last_ts: dict[tuple[UUID, UUID], list[int]] = {}  # (room, targetUser) -> list of recent event ms (sliding window 1s)
 _voice_proxy_buffer: dict[tuple[UUID, UUID], list[str]] = {}   # короткие сегменты для объединения
@@ -66,32 +72,127 @@ summary_voice_proxy_segments_total = Counter(
 )
 
 
-async def _collect_all_voice_transcripts(voice_coll, room_uuid: UUID, original_room_id: str) -> list[tuple[UUID | None, str, str]]:  # type: ignore[no-untyped-def]
+async def _collect_all_voice_transcripts(voice_coll, room_uuid: UUID, original_room_id: str) -> list[tuple[UUID | None, VoiceSegment, str]]:  # type: ignore[no-untyped-def]
     """Возвращает список всех доступных voice транскриптов для комнаты.
 
-    Каждый элемент: (user_id|None, text, key) где key нужен для последующего pop.
+    Каждый элемент: (user_id|None, segment, key) где segment — разобранный при сохранении VoiceSegment
+    (meta снята, предложения готовы), key нужен для последующего pop.
     Собираем:
       1. Общий транскрипт по ключу room_uuid / original_room_id (совместимость со старым форматом)
       2. Персональные транскрипты по ключам f"{room_uuid}:{user_id}" для известных участников.
     Дубликаты (если общий == конкатенация персональных) сейчас НЕ фильтруем, но помечаем разными ключами.
     """
-    results: list[tuple[UUID | None, str, str]] = []
+    results: list[tuple[UUID | None, VoiceSegment, str]] = []
+    participants = list(_room_participant_users.get(room_uuid, set()))
+    personal_keys = [f"{room_uuid}:{uid}" for uid in participants]
+    # Одно пакетное чтение: общий ключ (старый формат) + персональные ключи участников
+    try:
+        found = await voice_coll.get_many([str(room_uuid), original_room_id, *personal_keys])
+    except Exception:
+        return results
     # 1. Общий ключ (старый формат)
-    with contextlib.suppress(Exception):
-        v_global = await voice_coll.get_transcript(str(room_uuid)) or await voice_coll.get_transcript(original_room_id)
-        if v_global and getattr(v_global, 'text', None) and v_global.text.strip() and not v_global.text.startswith('(no audio'):
-            results.append((None, v_global.text.strip(), str(room_uuid)))
+    seg = _voice_segment_of(found.get(str(room_uuid)) or found.get(original_room_id))
+    if seg is not None:
+        results.append((None, seg, str(room_uuid)))
     # 2. Персональные ключи
-    participants = _room_participant_users.get(room_uuid, set())
-    for uid in list(participants):
-        key = f"{room_uuid}:{uid}"
-        with contextlib.suppress(Exception):
-            v_user = await voice_coll.get_transcript(key)
-            if v_user and getattr(v_user, 'text', None) and v_user.text.strip() and not v_user.text.startswith('(no audio'):
-                results.append((uid, v_user.text.strip(), key))
+    for uid, key in zip(participants, personal_keys):
+        seg = _voice_segment_of(found.get(key))
+        if seg is not None:
+            results.append((uid, seg, key))
     return results
 
 
+def _voice_segment_of(vt) -> VoiceSegment | None:  # type: ignore[no-untyped-def]
+    """Сегмент транскрипта коллектора (None для пустых и '(no audio ...)')."""
+    if vt is None or not getattr(vt, 'text', None):
+        return None
+    seg = getattr(vt, 'segment', None) or VoiceSegment.parse(vt.text)
+    if not seg.text or seg.text.startswith('(no audio'):
+        return None
+    return seg
+
+
+def _with_capture_ts(seg: VoiceSegment) -> VoiceSegment:
+    """Сегмент без captureTs считаем записанным сейчас (иначе оркестратор применит строгий no-meta фильтр)."""
+    if seg.capture_ts is not None:
+        return seg
+    return dataclasses.replace(seg, capture_ts=int(time.time()*1000), has_meta=True)
+
+
+def _format_personal_summary_text(personal, reason: str) -> str:  # type: ignore[no-untyped-def]
+    """Текст персонального summary для Telegram (тело + разбивка по участникам, не длиннее 4000 символов)."""
+    if personal.message_count == 0:
+        body = (
+            "Персональное резюме пока пусто: сообщений ещё нет или продолжается обработка голоса. "
+            "Попробуйте запросить ещё раз через несколько секунд."
+        )
+    else:
+        body = personal.summary_text
+    # Participant breakdown форматирование (если присутствует)
+    participants_block = ""
+    try:
+        parts = getattr(personal, 'participants', None)
+        if parts:
+            lines = []
+            for p in parts[:5]:  # ограничим до 5 участников
+                sample_tail = p.sample_messages[-2:] if p.sample_messages else []
+                sample_txt = "; ".join(sample_tail)
+                who = p.participant_name or p.participant_id or "anon"
+                line = f"- {who}: {p.message_count} msg. {sample_txt}".strip()
+                # Усечение строки если длинная
+                if len(line) > 180:
+                    line = line[:177] + "…"
+                lines.append(line)
+            participants_block = "\n\nУчастники:\n" + "\n".join(lines)
+    except Exception as e:
+        print(f"[summary] Participants format error room={personal.room_id} err={e}")
+        participants_block = ""
+    text = (
+        f"Room {personal.room_id} персональное summary (trigger={reason}). Сообщений: {personal.message_count}.\n--- Summary ---\n{body}{participants_block}"
+    )
+    # Telegram API всё равно обрежет до ~4096; подрежем чуть раньше (4000) чтобы не потерять окончание
+    if len(text) > 4000:
+        text = text[:3990] + "…(truncated)"
+    return text
+
+
+async def _generate_and_send_batch_summaries(room_uuid: UUID, original_room_id: str, reason: str, *,
+                                             ai_provider, voice_coll, session: AsyncSession | None = None) -> int:  # type: ignore[no-untyped-def]
+    """Конец комнаты: персональные summary всех ещё не обслуженных владельцев агентов одним AI запросом.
+
+    Возвращает число поставленных в очередь диспетчера сообщений.
+    """
+    orchestrator = get_summary_orchestrator()
+    pending = [
+        str(uid) for (r, uid) in list(_room_agent_start.keys())
+        if r == room_uuid and (room_uuid, uid) not in _user_manual_summary_served
+    ]
+    if len(pending) < 2:
+        return 0
+    # Как и в персональном режиме — сначала прикрепляем готовые транскрипты участников
+    with contextlib.suppress(Exception):
+        for v_user_id, vseg, _key in await _collect_all_voice_transcripts(voice_coll, room_uuid, original_room_id):
+            if v_user_id is not None and str(v_user_id) in pending:
+                orchestrator.add_voice_transcript(str(room_uuid), _with_capture_ts(vseg), user_id=str(v_user_id))
+    results = await orchestrator.build_room_summaries(room_id=str(room_uuid), ai_provider=ai_provider, db_session=session, user_ids=pending)
+    queued_total = 0
+    dispatcher = get_dispatcher()
+    for uid, personal in results.items():
+        if personal.message_count == 0:
+            continue
+        try:
+            queued = await dispatcher.queue_summary(uid, _format_personal_summary_text(personal, reason), reason=f"{reason}:room:{room_uuid}")
+        except Exception as e:
+            print(f"[summary] Batch dispatcher queue exception room={original_room_id} user={uid} err={e}")
+            continue
+        if queued:
+            queued_total += 1
+            with contextlib.suppress(Exception):
+                _user_manual_summary_served.add((room_uuid, UUID(uid)))
+    print(f"[summary] Batch room summaries room={original_room_id} pending={len(pending)} built={len(results)} queued={queued_total} reason={reason}")
+    return queued_total
+
+
 async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, reason: str, *,
                                      ai_provider, collector, voice_coll, session: AsyncSession | None = None,
                                      initiator_user_id: UUID | None = None) -> None:  # type: ignore[no-untyped-def]
@@ -106,6 +207,11 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
     settings = get_settings()
     # Персональный режим: если инициатор указан — генерируем snapshot-based summary индивидуально
     if initiator_user_id: 
+        # Авто-триггер после распознавания голоса не дублирует batch room-end (отметку ставит только он;
+        # персональные summary её не ставят — повторная запись в той же сессии снова получает summary)
+        if reason == 'auto-voice' and (room_uuid, initiator_user_id) in _user_manual_summary_served:
+            print(f"[summary] Skip auto-voice room={original_room_id} user={initiator_user_id}: already served")
+            return
         # Feature flag: отключить новую архитектуру, установить USE_SUMMARY_V2=0
         use_v2 = os.getenv("USE_SUMMARY_V2", "1").lower() not in {"0", "false", "no"}
         if use_v2:
@@ -118,22 +224,12 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
             # Оппортунистическое прикрепление ВСЕХ доступных транскриптов участников комнаты
             with contextlib.suppress(Exception):
                 all_voice = await _collect_all_voice_transcripts(voice_coll, room_uuid, original_room_id)
-                for v_user_id, raw_txt, _key in all_voice:
-                    if not raw_txt:
-                        continue
-                    capture_ts = None
-                    if raw_txt.startswith('[meta ') and 'captureTs=' in raw_txt:
-                        m = re.search(r'captureTs=(\d+)', raw_txt)
-                        if m:
-                            with contextlib.suppress(Exception):
-                                capture_ts = int(m.group(1))
-                    if capture_ts is None:
-                        capture_ts = int(time.time()*1000)
-                        raw_txt = f"[meta captureTs={capture_ts}] " + raw_txt
+                for v_user_id, vseg, _key in all_voice:
+                    vseg = _with_capture_ts(vseg)
                     # Если транскрипт персональный – пробуем прикрепить в окно пользователя; если глобальный (v_user_id=None) – отправляем как broadcast
                     try:
-                        orchestrator.add_voice_transcript(str(room_uuid), raw_txt, user_id=str(v_user_id) if v_user_id else None)
-                        print(f"[summary] opportunistic_attach accepted room={original_room_id} user={v_user_id} captureTs={capture_ts} broadcast={v_user_id is None}")
+                        orchestrator.add_voice_transcript(str(room_uuid), vseg, user_id=str(v_user_id) if v_user_id else None)
+                        print(f"[summary] opportunistic_attach accepted room={original_room_id} user={v_user_id} captureTs={vseg.capture_ts} broadcast={v_user_id is None}")
                     except Exception as e:
                         print(f"[summary] opportunistic_attach error room={original_room_id} user={v_user_id} err={e}")
             # Первая попытка построить персональное summary
@@ -173,8 +269,9 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
                             v_cur2 = None
                             with contextlib.suppress(Exception):
                                 v_cur2 = await voice_coll.get_transcript(f"{room_uuid}:{initiator_user_id}")
-                            if v_cur2 and getattr(v_cur2, 'text', None) and len(v_cur2.text.strip()) > 10 and not v_cur2.text.startswith('(no audio'):
-                                orchestrator.add_voice_transcript(str(room_uuid), v_cur2.text.strip(), user_id=str(initiator_user_id))
+                            seg_cur2 = _voice_segment_of(v_cur2)
+                            if seg_cur2 is not None and len(seg_cur2.text) > 10:
+                                orchestrator.add_voice_transcript(str(room_uuid), seg_cur2, user_id=str(initiator_user_id))
                                 personal3 = await orchestrator.build_personal_summary(room_id=str(room_uuid), user_id=str(initiator_user_id), ai_provider=ai_provider, db_session=session, cutoff_ms=cutoff_ms)
                                 if personal3.message_count > 0:
                                     personal = personal3
@@ -221,42 +318,9 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
                         print(f"[summary] Telegram skip: no confirmed chat_id room={original_room_id} user={initiator_user_id}")
                         chat_id = None
                 else:
-                    if personal.message_count == 0:
-                        body = (
-                            "Персональное резюме пока пусто: сообщений ещё нет или продолжается обработка голоса. "
-                            "Попробуйте запросить ещё раз через несколько секунд."
-                        )
-                    else:
-                        body = personal.summary_text
-                    print(f"[summary] Telegram preparing body_len={len(body)} room={original_room_id} user={initiator_user_id}")
-                    # Participant breakdown форматирование (если присутствует)
-                    participants_block = ""
-                    try:
-                        parts = getattr(personal, 'participants', None)
-                        print(f"[summary] Telegram participants_count={len(parts) if parts else 0} room={original_room_id} user={initiator_user_id}")
-                        if parts:
-                            lines = []
-                            for p in parts[:5]:  # ограничим до 5 участников
-                                sample_tail = p.sample_messages[-2:] if p.sample_messages else []
-                                sample_txt = "; ".join(sample_tail)
-                                who = p.participant_name or p.participant_id or "anon"
-                                line = f"- {who}: {p.message_count} msg. {sample_txt}".strip()
-                                # Усечение строки если длинная
-                                if len(line) > 180:
-                                    line = line[:177] + "…"
-                                lines.append(line)
-                            participants_block = "\n\nУчастники:\n" + "\n".join(lines)
-                    except Exception as e:
-                        print(f"[summary] Participants format error room={original_room_id} user={initiator_user_id} err={e}")
-                        participants_block = ""
-                    text = (
-                        f"Room {personal.room_id} персональное summary (trigger={reason}). Сообщений: {personal.message_count}.\n--- Summary ---\n{body}{participants_block}"
-                    )
-                    # Telegram API всё равно обрежет до ~4096; подрежем чуть раньше (4000) чтобы не потерять окончание
-                    if len(text) > 4000:
-                        text = text[:3990] + "…(truncated)"
-                    # Отправку делегируем диспетчеру (асинхронная очередь + ретраи)
-                    dispatch_text = text  # уже ограничен по длине
+                    print(f"[summary] Telegram participants_count={len(personal.participants) if getattr(personal, 'participants', None) else 0} room={original_room_id} user={initiator_user_id}")
+                    # Отправку делегируем диспетчеру (асинхронная очередь + ретраи); текст уже ограничен по длине
+                    dispatch_text = _format_personal_summary_text(personal, reason)
                     try:
                         dispatcher = get_dispatcher()
                         reason_with_room = f"{reason}:room:{room_uuid}" if room_uuid else reason
@@ -328,11 +392,16 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
                 print(f"[summary] Cached summary already served to all group targets room={original_room_id}")
                 return
             if settings.TELEGRAM_BOT_TOKEN:
+                # chat_id всех получателей — одним запросом (и из кэша в установившемся режиме)
+                chat_ids: dict[str, str | None] = {}
+                if session is not None:
+                    try:
+                        chat_ids = await get_confirmed_chat_ids(session, pending)
+                    except Exception as e:
+                        print(f"[summary] get_confirmed_chat_ids failed room={original_room_id} err={e}")
                 for uid in pending:
                     try:
-                        chat_id = None
-                        if session is not None:
-                            chat_id = await get_confirmed_chat_id(session, uid)
+                        chat_id = chat_ids.get(str(uid))
                         if not chat_id:
                             print(f"[summary] Skip send user={uid} room={original_room_id}: no chat_id")
                             continue
@@ -347,7 +416,7 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
             return
     # settings уже инициализирован выше
     # Собираем все доступные транскрипты (ждём появления хотя бы одного до 6с)
-    collected_voice: list[tuple[UUID | None, str, str]] = []
+    collected_voice: list[tuple[UUID | None, VoiceSegment, str]] = []
     for attempt in range(20):
         with contextlib.suppress(Exception):
             collected_voice = await _collect_all_voice_transcripts(voice_coll, room_uuid, original_room_id)
@@ -376,22 +445,13 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
     if collected_voice:
         # Формируем ChatMessage по каждому транскрипту, разбивая на предложения
         print(f"[summary] Using multi-voice transcripts for room {original_room_id} count={len(collected_voice)} reason={reason}")
-        import re, time as _t
         voice_msgs = []
         try:
             from ...infrastructure.services.summary import ChatMessage as _CM
-            now_ms = int(_t.time()*1000)
-            for user_id, text_v, _key in collected_voice:
-                if not text_v:
-                    continue
-                sentences: list[str] = []
-                norm_src = text_v.strip()
-                if norm_src:
-                    norm = re.sub(r"\s+", " ", norm_src)
-                    parts = re.split(r'(?<=[.!?])\s+', norm)
-                    sentences = [p.strip() for p in parts if p.strip()]
-                if not sentences and norm_src:
-                    sentences = [norm_src]
+            now_ms = int(time.time()*1000)
+            for user_id, vseg, _key in collected_voice:
+                # Предложения разбиты один раз при сохранении транскрипта
+                sentences = list(vseg.sentences) or [vseg.text]
                 author_name = _display_names.get(user_id) if user_id else 'voice'
                 for s in sentences:
                     voice_msgs.append(_CM(room_id=str(room_uuid), author_id=str(user_id) if user_id else None, author_name=author_name, content=s, ts=now_ms))
@@ -425,10 +485,8 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
                 from ...infrastructure.services.summary import ChatMessage as _CM
                 import time as _t
                 merged2 = list(base_snap2)
-                for uid_voice, txt_voice, _key in collected_voice:
-                    if not txt_voice:
-                        continue
-                    merged2.append(_CM(room_id=str(room_uuid), author_id=str(uid_voice) if uid_voice else None, author_name=_display_names.get(uid_voice) if uid_voice else 'voice', content=txt_voice.strip(), ts=int(_t.time()*1000)))
+                for uid_voice, seg_voice, _key in collected_voice:
+                    merged2.append(_CM(room_id=str(room_uuid), author_id=str(uid_voice) if uid_voice else None, author_name=_display_names.get(uid_voice) if uid_voice else 'voice', content=seg_voice.text, ts=int(_t.time()*1000)))
             if merged2:
                 summary = await _sm(merged2, ai_provider, system_prompt=custom_prompt)
                 print(f"[summary] Second-chance merge snapshot used room={original_room_id} count={len(merged2)}")
@@ -496,6 +554,34 @@ async def _generate_and_send_summary(room_uuid: UUID, original_room_id: str, rea
         _room_summary_finalized.add(room_uuid)
 
 
+def _prune_room_summary_state(room_uuid: UUID) -> None:
+    """Удалить персональное состояние summary опустевшей комнаты (старты агентов, обслуженные, кэш)."""
+    for key in [k for k in _room_agent_start if k[0] == room_uuid]:
+        _room_agent_start.pop(key, None)
+    for key in [k for k in _user_manual_summary_served if k[0] == room_uuid]:
+        _user_manual_summary_served.discard(key)
+    for key in [k for k in _user_manual_summary_cache if k[0] == room_uuid]:
+        _user_manual_summary_cache.pop(key, None)
+
+
+def _schedule_room_state_prune(room_uuid: UUID, delay_sec: float | None = None) -> None:
+    """Очистить состояние комнаты через delay_sec, если к тому времени в неё никто не вернулся."""
+    prev = _room_prune_tasks.get(room_uuid)
+    if prev is not None and not prev.done():
+        return
+
+    async def _run() -> None:
+        try:
+            await asyncio.sleep(_ROOM_STATE_PRUNE_DELAY_SEC if delay_sec is None else delay_sec)
+            if not _room_members.get(room_uuid):
+                _prune_room_summary_state(room_uuid)
+        finally:
+            _room_prune_tasks.pop(room_uuid, None)
+
+    with contextlib.suppress(RuntimeError):
+        _room_prune_tasks[room_uuid] = asyncio.create_task(_run())
+
+
 @router.websocket("/ws/rooms/{room_id}")
 async def ws_room(
     websocket: WebSocket,
@@ -892,13 +978,14 @@ async def ws_room(
                 if len(clean_text) > 800:
                     clean_text = clean_text[:800]
                     trimmed_flag = 'yes'
-                # Формируем meta префикс если нет
-                if not clean_text.startswith('[meta '):
-                    import time as _t
-                    ts_meta = int(capture_ts) if isinstance(capture_ts, int) else int(_t.time()*1000)
-                    clean_text = f"[meta captureTs={ts_meta}] " + clean_text
                 # Определяем отображаемое имя: уже может быть в _display_names
                 target_name = _display_names.get(target_uuid)
+                # Разбираем сегмент один раз здесь (meta от клиента или captureTs из сообщения / текущее время)
+                proxy_seg = VoiceSegment.parse(clean_text, speaker=target_name)
+                if proxy_seg.capture_ts is None:
+                    import time as _t
+                    proxy_seg.capture_ts = int(capture_ts) if isinstance(capture_ts, int) else int(_t.time()*1000)
+                    proxy_seg.has_meta = True
                 # Регистрируем окно с именем (если агент для владельца ещё не стартовал, это создаст / перезапустит)
                 try:
                     orchestrator = get_summary_orchestrator()
@@ -913,7 +1000,7 @@ async def ws_room(
                 attached = False
                 try:
                     orchestrator = get_summary_orchestrator()
-                    orchestrator.add_voice_transcript(str(room_uuid), clean_text, user_id=str(target_uuid))
+                    orchestrator.add_voice_transcript(str(room_uuid), proxy_seg, user_id=str(target_uuid))
                     attached = True
                 except Exception:
                     attached = False
@@ -1010,6 +1097,19 @@ async def ws_room(
                     except Exception:
                         pass
 
+        # Конец комнаты: несколько активных персональных агентов — один batch запрос вместо N персональных.
+        # Под локом комнаты: одновременно вышедшие последние участники не генерируют и не ставят batch дважды.
+        try:
+            use_v2 = os.getenv("USE_SUMMARY_V2", "1").lower() not in {"0", "false", "no"}
+            if use_v2 and settings.AI_SUMMARY_BATCH_ROOM_END and not _room_members.get(room_uuid):
+                async with _room_summary_locks[room_uuid]:
+                    if not _room_members.get(room_uuid) and room_uuid not in _room_summary_finalized:
+                        queued = await _generate_and_send_batch_summaries(room_uuid, room_id, 'room-end', ai_provider=ai_provider, voice_coll=voice_coll, session=session)
+                        if queued:
+                            # auto-orphan ниже уже не нужен
+                            _room_summary_finalized.add(room_uuid)
+        except Exception:
+            pass
         # Fallback: если все участники вышли и остался неотправленный транскрипт — попробуем авто summary (auto-orphan)
         try:
             remaining = len(_room_members.get(room_uuid, set()))
@@ -1024,3 +1124,5 @@ async def ws_room(
                     await _generate_and_send_summary(room_uuid, room_id, 'auto-orphan', ai_provider=ai_provider, collector=collector, voice_coll=voice_coll)
         except Exception:
             pass
+        if not _room_members.get(room_uuid):
+            _schedule_room_state_prune(room_uuid)
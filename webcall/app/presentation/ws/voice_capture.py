@@ -5,8 +5,10 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from ..api.deps.containers import get_token_provider
 from ...core.ports.services import TokenProvider
 from ...infrastructure.config import get_settings
-from ...infrastructure.services.voice_transcript import get_voice_collector, transcribe_chunks
+from ...infrastructure.services.voice_transcript import VoiceSpool, get_voice_collector, transcribe_chunks
 from ...infrastructure.services.summary_v2.orchestrator import get_summary_orchestrator
+from ...infrastructure.services.summary_v2.models import VoiceSegment
+from ...infrastructure.services.voice_pipeline import StreamingTranscriber
 from uuid import UUID, uuid5, NAMESPACE_URL
 import logging
 
@@ -70,6 +72,20 @@ async def ws_voice_capture(ws: WebSocket, room_id: str, tokens: TokenProvider =
     last_warn_sent = False
     stop_requested_ts: int | None = None
     import asyncio
+    # Pipelined режим: сегменты распознаются во время записи, частичные тексты сразу уходят в orchestrator
+    pipeline: StreamingTranscriber | None = None
+    if getattr(settings, 'VOICE_PIPELINE_ENABLED', False):
+        def _attach_partial(part: str) -> None:
+            if not user_id:
+                return
+            seg = VoiceSegment.from_text(part, capture_ts=int(_t.time()*1000), session=str(session_id) if session_id is not None else None)
+            get_summary_orchestrator().add_voice_transcript(base_room_key, seg, user_id=user_id)
+        pipeline = StreamingTranscriber(
+            canonical_key,
+            on_partial=_attach_partial,
+            max_concurrency=getattr(settings, 'VOICE_PIPELINE_MAX_CONCURRENCY', 2),
+            segment_ms=settings.VOICE_CHUNK_MAX_MS,
+        )
     try:
         while True:
             # Если был stop и ещё нет чанков — ждём ограниченный grace
@@ -146,114 +162,135 @@ async def ws_voice_capture(ws: WebSocket, room_id: str, tokens: TokenProvider =
                 if total_bytes > settings.VOICE_MAX_TOTAL_MB * 1024 * 1024:
                     # превышение лимита
                     break
-                await coll.add_chunk(canonical_key, chunk)
+                if pipeline is not None:
+                    pipeline.feed(chunk, last_chunk_ts)
+                else:
+                    await coll.add_chunk(canonical_key, chunk)
     except WebSocketDisconnect:
         logger.debug("VOICE_CAPTURE disconnect room=%s started=%s bytes=%s", room_id, started, total_bytes)
     finally:
-        # Финализируем: транскрипция и сохранение. Если нет чанков — пропускаем.
-        with contextlib.suppress(Exception):
-            chunks = await coll.get_and_clear_chunks(canonical_key)
-            finalize_ts = int(__import__('time').time()*1000)
-            text: str
-            had_chunks = bool(chunks)
-            if had_chunks:
-                logger.info("VOICE_CAPTURE finalize room=%s chunks=%s bytes=%s", room_id, len(chunks), sum(len(c.data) for c in chunks))
-                raw_text = await transcribe_chunks(canonical_key, chunks)
-                cleaned = (raw_text or '').strip()
-                try:
-                    preview = cleaned[:120].replace('\n',' ')
-                    logger.info("VOICE_CAPTURE transcript room=%s preview=%r", room_id, preview)
-                except Exception:
-                    pass
-                # Авто-триггер персонального summary (v2) если есть user_id и включён флаг USE_SUMMARY_V2
-                try:
-                    import os, asyncio as _aio
-                    use_v2 = os.getenv("USE_SUMMARY_V2", "1").lower() not in {"0","false","no"}
-                    if user_id and use_v2 and cleaned and not cleaned.startswith('(no audio') and not cleaned.startswith('(asr '):
-                        # Отложим чуть, чтобы orchestrator успел прикрепить сегмент
-                        async def _delayed_trigger():
-                            try:
-                                from .rooms import _generate_and_send_summary  # type: ignore
-                                from ...infrastructure.services.summary import get_summary_collector
-                                from ...infrastructure.services.voice_transcript import get_voice_collector as _gvc
-                                from ...infrastructure.services.ai_provider import get_ai_provider as _gap
-                                from sqlalchemy.ext.asyncio import AsyncSession
-                                # Попытка получить активный db session невозможна отсюда напрямую — авто-режим без session
-                                await _aio.sleep(0.4)
-                                try:
-                                    coll2 = get_summary_collector()
-                                except Exception:
-                                    coll2 = None
-                                try:
-                                    vc2 = _gvc()
-                                except Exception:
-                                    vc2 = None
-                                ai_p = _gap()
-                                # Определяем канонический UUID как в rooms.py
-                                try:
-                                    canonical_uuid2 = UUID(room_id)
-                                except Exception:
-                                    canonical_uuid2 = uuid5(NAMESPACE_URL, f"webcall:{room_id}")
-                                # initiator_user_id как UUID
-                                u_uuid = None
+        try:
+            # Финализируем: транскрипция и сохранение. Если нет чанков — пропускаем.
+            with contextlib.suppress(Exception):
+                audio = await coll.take_audio(canonical_key) if pipeline is None else None
+                finalize_ts = int(__import__('time').time()*1000)
+                text: str
+                had_chunks = bool(audio) or bool(pipeline and pipeline.bytes_in)
+                if had_chunks:
+                    if pipeline is not None:
+                        # Остался только хвостовой сегмент — остальные распознаны во время записи
+                        raw_text = await pipeline.finish()
+                        logger.info("VOICE_CAPTURE finalize room=%s bytes=%s segments=%s partials=%s pipeline=1", room_id, pipeline.bytes_in, pipeline.segments, pipeline.partials)
+                    elif isinstance(audio, VoiceSpool):
+                        logger.info("VOICE_CAPTURE finalize room=%s chunks=%s bytes=%s spool=1", room_id, audio.chunks, audio.size)
+                        # Spool закрывает пул ASR, когда дочитает файл (даже если этот вызов отменят)
+                        raw_text = await transcribe_chunks(canonical_key, audio)
+                    else:
+                        logger.info("VOICE_CAPTURE finalize room=%s chunks=%s bytes=%s", room_id, len(audio), sum(len(c.data) for c in audio))
+                        raw_text = await transcribe_chunks(canonical_key, audio)
+                    cleaned = (raw_text or '').strip()
+                    try:
+                        preview = cleaned[:120].replace('\n',' ')
+                        logger.info("VOICE_CAPTURE transcript room=%s preview=%r", room_id, preview)
+                    except Exception:
+                        pass
+                    # Авто-триггер персонального summary (v2) если есть user_id и включён флаг USE_SUMMARY_V2
+                    try:
+                        import os, asyncio as _aio
+                        use_v2 = os.getenv("USE_SUMMARY_V2", "1").lower() not in {"0","false","no"}
+                        if user_id and use_v2 and cleaned and not cleaned.startswith('(no audio') and not cleaned.startswith('(asr '):
+                            # Отложим чуть, чтобы orchestrator успел прикрепить сегмент
+                            async def _delayed_trigger():
                                 try:
-                                    u_uuid = UUID(user_id)
-                                except Exception:
-                                    pass
-                                if u_uuid:
-                                    # Попытка открыть краткий DB session чтобы разрешить chat_id при авто-отправке
+                                    from .rooms import _generate_and_send_summary  # type: ignore
+                                    from ...infrastructure.services.summary import get_summary_collector
+                                    from ...infrastructure.services.voice_transcript import get_voice_collector as _gvc
+                                    from ...infrastructure.services.ai_provider import get_ai_provider as _gap
+                                    from sqlalchemy.ext.asyncio import AsyncSession
+                                    # Попытка получить активный db session невозможна отсюда напрямую — авто-режим без session
+                                    await _aio.sleep(0.4)
                                     try:
-                                        from ...infrastructure.db.session import AsyncSessionLocal
-                                        async with AsyncSessionLocal() as auto_session:  # type: ignore
-                                            await _generate_and_send_summary(canonical_uuid2, room_id, "auto-voice", ai_provider=_gap(), collector=coll2, voice_coll=vc2, session=auto_session, initiator_user_id=u_uuid)
+                                        coll2 = get_summary_collector()
                                     except Exception:
-                                        # fallback без сессии (только глобальный TELEGRAM_CHAT_ID сработает)
-                                        await _generate_and_send_summary(canonical_uuid2, room_id, "auto-voice", ai_provider=_gap(), collector=coll2, voice_coll=vc2, session=None, initiator_user_id=u_uuid)
-                            except Exception:
-                                logger.debug("VOICE_CAPTURE auto-summary trigger failed room=%s", room_id, exc_info=True)
-                        _ = _aio.create_task(_delayed_trigger())
-                except Exception:
-                    logger.debug("VOICE_CAPTURE auto-summary scheduling failed room=%s", room_id, exc_info=True)
-            else:
-                cleaned = "(no audio chunks)"
+                                        coll2 = None
+                                    try:
+                                        vc2 = _gvc()
+                                    except Exception:
+                                        vc2 = None
+                                    ai_p = _gap()
+                                    # Определяем канонический UUID как в rooms.py
+                                    try:
+                                        canonical_uuid2 = UUID(room_id)
+                                    except Exception:
+                                        canonical_uuid2 = uuid5(NAMESPACE_URL, f"webcall:{room_id}")
+                                    # initiator_user_id как UUID
+                                    u_uuid = None
+                                    try:
+                                        u_uuid = UUID(user_id)
+                                    except Exception:
+                                        pass
+                                    if u_uuid:
+                                        # Попытка открыть краткий DB session чтобы разрешить chat_id при авто-отправке
+                                        try:
+                                            from ...infrastructure.db.session import AsyncSessionLocal
+                                            async with AsyncSessionLocal() as auto_session:  # type: ignore
+                                                await _generate_and_send_summary(canonical_uuid2, room_id, "auto-voice", ai_provider=_gap(), collector=coll2, voice_coll=vc2, session=auto_session, initiator_user_id=u_uuid)
+                                        except Exception:
+                                            # fallback без сессии (только глобальный TELEGRAM_CHAT_ID сработает)
+                                            await _generate_and_send_summary(canonical_uuid2, room_id, "auto-voice", ai_provider=_gap(), collector=coll2, voice_coll=vc2, session=None, initiator_user_id=u_uuid)
+                                except Exception:
+                                    logger.debug("VOICE_CAPTURE auto-summary trigger failed room=%s", room_id, exc_info=True)
+                            _ = _aio.create_task(_delayed_trigger())
+                    except Exception:
+                        logger.debug("VOICE_CAPTURE auto-summary scheduling failed room=%s", room_id, exc_info=True)
+                else:
+                    cleaned = "(no audio chunks)"
+                    try:
+                        now_ms = finalize_ts
+                        delta_start = (now_ms - start_control_ts) if start_control_ts else None
+                        logger.info(
+                            "VOICE_CAPTURE finalize empty room=%s reason=no_chunks delta_start=%s started=%s ctrl_start=%s ctrl_stop=%s bin_frames=%s ignored_stops=%s loops=%s lifetime_ms=%s grace_after_stop_ms=%s warn_sent=%s",
+                            room_id,
+                            delta_start,
+                            started,
+                            control_start_count,
+                            control_stop_count,
+                            binary_frames,
+                            ignored_early_stops,
+                            loop_iterations,
+                            now_ms - accept_ts,
+                            (now_ms - stop_requested_ts) if stop_requested_ts else None,
+                            last_warn_sent,
+                        )
+                    except Exception:
+                        logger.info("VOICE_CAPTURE finalize empty room=%s reason=no_chunks", room_id)
+                # Формируем мету (всегда)
+                meta_parts = [f"captureTs={finalize_ts}"]
+                if session_id is not None:
+                    meta_parts.append(f"session={session_id}")
+                if client_start_ts is not None:
+                    meta_parts.append(f"clientTs={client_start_ts}")
+                if start_control_ts is not None:
+                    meta_parts.append(f"startCtrlTs={start_control_ts}")
+                meta_prefix = "[meta " + " ".join(meta_parts) + "] "
+                text = meta_prefix + cleaned
+                # Сохраняем ТОЛЬКО персонально если есть user_id, иначе под room (групповая логика) — мета уже есть
+                store_key = canonical_key
+                stored = await coll.store_transcript(store_key, text)
+                # Немедленно прикрепляем в orchestrator если есть содержательный текст
                 try:
-                    now_ms = finalize_ts
-                    delta_start = (now_ms - start_control_ts) if start_control_ts else None
-                    logger.info(
-                        "VOICE_CAPTURE finalize empty room=%s reason=no_chunks delta_start=%s started=%s ctrl_start=%s ctrl_stop=%s bin_frames=%s ignored_stops=%s loops=%s lifetime_ms=%s grace_after_stop_ms=%s warn_sent=%s",
-                        room_id,
-                        delta_start,
-                        started,
-                        control_start_count,
-                        control_stop_count,
-                        binary_frames,
-                        ignored_early_stops,
-                        loop_iterations,
-                        now_ms - accept_ts,
-                        (now_ms - stop_requested_ts) if stop_requested_ts else None,
-                        last_warn_sent,
-                    )
+                    # В pipelined режиме части уже прикреплены по мере распознавания
+                    already_attached = bool(pipeline and pipeline.partials)
+                    if user_id and not already_attached and cleaned and not cleaned.startswith('(no audio') and not cleaned.startswith('(asr '):
+                        orch = get_summary_orchestrator()
+                        # Сегмент уже разобран при сохранении — оркестратор не парсит meta повторно
+                        orch.add_voice_transcript(base_room_key, stored.segment or text, user_id=user_id)
                 except Exception:
-                    logger.info("VOICE_CAPTURE finalize empty room=%s reason=no_chunks", room_id)
-            # Формируем мету (всегда)
-            meta_parts = [f"captureTs={finalize_ts}"]
-            if session_id is not None:
-                meta_parts.append(f"session={session_id}")
-            if client_start_ts is not None:
-                meta_parts.append(f"clientTs={client_start_ts}")
-            if start_control_ts is not None:
-                meta_parts.append(f"startCtrlTs={start_control_ts}")
-            meta_prefix = "[meta " + " ".join(meta_parts) + "] "
-            text = meta_prefix + cleaned
-            # Сохраняем ТОЛЬКО персонально если есть user_id, иначе под room (групповая логика) — мета уже есть
-            store_key = canonical_key
-            await coll.store_transcript(store_key, text)
-            # Немедленно прикрепляем в orchestrator если есть содержательный текст
-            try:
-                if user_id and cleaned and not cleaned.startswith('(no audio') and not cleaned.startswith('(asr '):
-                    orch = get_summary_orchestrator()
-                    orch.add_voice_transcript(base_room_key, text, user_id=user_id)
-            except Exception:
-                logger.debug("VOICE_CAPTURE orchestrator attach failed room=%s", room_id, exc_info=True)
+                    logger.debug("VOICE_CAPTURE orchestrator attach failed room=%s", room_id, exc_info=True)
+        finally:
+            if pipeline is not None:
+                # Финализация упала или прервана — ASR задачи сегментов не должны продолжать ходить в API
+                with contextlib.suppress(Exception):
+                    await pipeline.cancel()
         with contextlib.suppress(Exception):
             await ws.close(code=1000)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Micro-benchmark расшифровки личных сообщений.
+
+Сравнивает прежний путь (вывод ключа + новый Fernet на каждое сообщение) с кэшированным
+Fernet по паре и пакетной расшифровкой в пуле потоков. Печатает сообщений в секунду.
+
+Usage (из каталога webcall/):
+  python scripts/bench_direct_crypto.py
+  python scripts/bench_direct_crypto.py --messages 20000 --page 100 --pairs 50
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('JWT_SECRET', 'bench-jwt-secret')
+os.environ.setdefault('REGISTRATION_SECRET', 'bench')
+os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+from app.infrastructure.services import direct_crypto as dc  # noqa: E402
+
+
+def _report(name: str, n: int, elapsed: float) -> None:
+    print(f"{name:<28} {n:>8} msgs  {elapsed:8.3f}s  {n / elapsed if elapsed else 0:>12,.0f} msg/s")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--messages', type=int, default=10000)
+    ap.add_argument('--page', type=int, default=100)
+    ap.add_argument('--pairs', type=int, default=20)
+    ap.add_argument('--text', default='Привет! Как дела? ' * 4)
+    args = ap.parse_args()
+
+    pairs = [(uuid4(), uuid4()) for _ in range(max(1, args.pairs))]
+    items = []
+    for i in range(args.messages):
+        a, b = pairs[i % len(pairs)]
+        items.append((a, b, dc.encrypt_direct(a, b, args.text)))
+    pages = [items[i:i + args.page] for i in range(0, len(items), args.page)]
+
+    t0 = time.perf_counter()
+    for a, b, ct in items:
+        Fernet(dc._derive_key(a, b)).decrypt(ct.encode('utf-8')).decode('utf-8')
+    _report('uncached (per-message key)', len(items), time.perf_counter() - t0)
+
+    dc._cached_fernet.cache_clear()
+    t0 = time.perf_counter()
+    for page in pages:
+        dc.decrypt_direct_many(page)
+    _report('cached fernet, inline', len(items), time.perf_counter() - t0)
+
+    async def _offloaded() -> None:
+        await asyncio.gather(*(dc.decrypt_direct_batch(page, offload_min=1) for page in pages))
+
+    t0 = time.perf_counter()
+    asyncio.run(_offloaded())
+    _report('cached fernet, thread pool', len(items), time.perf_counter() - t0)
+    print(f"fernet cache: {dc._cached_fernet.cache_info()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
 import os, sys
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if ROOT not in sys.path:
@@ -9,3 +14,63 @@ os.environ.setdefault('JWT_SECRET', 'test-jwt-secret')
 os.environ.setdefault('REGISTRATION_SECRET', 'test-registration')
 os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
 os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.infrastructure.db.base import Base  # noqa: E402
+from app.infrastructure.db.models import Users  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def db_engine():
+    """Чистая in-memory SQLite со схемой из ORM моделей; engine закрывается после теста."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture
+def db_sessionmaker(db_engine):
+    """Фабрика сессий; подходит как session_factory для TelegramOutboxStore / DirectPushScheduler."""
+    return sessionmaker(bind=db_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest_asyncio.fixture
+async def db_session(db_sessionmaker):
+    session = db_sessionmaker()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+@pytest.fixture
+def sql_statements(db_engine):
+    """SQL, выполненный через engine, — для проверок числа запросов."""
+    statements: list[str] = []
+
+    def _log(conn, cursor, statement, params, context, executemany):  # noqa: ANN001
+        statements.append(statement)
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _log)
+    yield statements
+    event.remove(db_engine.sync_engine, "before_cursor_execute", _log)
+
+
+@pytest.fixture
+def make_user(db_sessionmaker):
+    """await make_user(username=None) -> id: пользователь, закоммиченный в отдельной сессии."""
+    async def _make(username: str | None = None):
+        uid = uuid4()
+        name = username or uid.hex[:12]
+        async with db_sessionmaker() as s:
+            async with s.begin():
+                s.add(Users(id=uid, email=f"{name}@ex.com", username=name, password_hash="x", created_at=datetime.utcnow()))
+        return uid
+    return _make
@@ -0,0 +1,137 @@
+import asyncio
+import io
+
+import pytest
+
+from app.core.ports.services import AsrEngine
+from app.infrastructure.services.asr import AsrWorkerPool, StubAsrEngine
+
+
+class _CountingEngine(AsrEngine):
+    name = "counting"
+
+    def __init__(self, fail_first: bool = False):
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self.fail_first = fail_first
+
+    async def transcribe(self, audio, *, filename="audio.webm", content_type="audio/webm"):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if self.fail_first and self.calls == 1:
+            return "(asr failed http 500)"
+        return f"text {bytes(audio)[:8]!r}"
+
+
+@pytest.mark.asyncio
+async def test_stub_engine_is_deterministic():
+    engine = StubAsrEngine()
+    a = await engine.transcribe(b"voice-bytes")
+    assert a == await engine.transcribe(io.BytesIO(b"voice-bytes"))
+    assert a != await engine.transcribe(b"other-bytes")
+    assert await engine.transcribe(b"") == "(no audio)"
+
+
+@pytest.mark.asyncio
+async def test_pool_bounds_concurrency_and_dedupes_by_content():
+    engine = _CountingEngine()
+    pool = AsrWorkerPool(engine, workers=2, queue_size=4)
+    try:
+        payloads = [f"clip-{i}".encode() for i in range(6)]
+        results = await asyncio.gather(*(pool.transcribe(p) for p in payloads + payloads[:2]))
+        assert results[:2] == results[6:]
+        assert engine.peak <= 2
+        # одновременные одинаковые клипы склеены, повтор после готовности — из кэша
+        assert engine.calls == 6
+        assert await pool.transcribe(payloads[0]) == results[0]
+        assert engine.calls == 6
+        st = pool.stats()
+        assert st['jobs'] == 6 and st['cache_hits'] + st['coalesced'] == 3
+        assert st['audio_per_wall_sec'] > 0
+    finally:
+        await pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_cached():
+    engine = _CountingEngine(fail_first=True)
+    pool = AsrWorkerPool(engine, workers=1)
+    try:
+        assert (await pool.transcribe(b"clip")).startswith("(asr failed")
+        assert (await pool.transcribe(b"clip")).startswith("text")
+        assert engine.calls == 2 and pool.stats()['failures'] == 1
+    finally:
+        await pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_owns_audio_until_engine_done_even_if_caller_cancelled():
+    events = []
+
+    class _SlowEngine(AsrEngine):
+        name = "slow"
+
+        async def transcribe(self, audio, *, filename="audio.webm", content_type="audio/webm"):
+            await asyncio.sleep(0.05)
+            events.append(('read', audio.read()))
+            return "ok"
+
+    pool = AsrWorkerPool(_SlowEngine(), workers=1)
+    fh = io.BytesIO(b"spool-bytes")
+    try:
+        call = asyncio.create_task(pool.transcribe(fh, release=lambda: events.append(('release', fh.close()))))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert events == []  # файл ещё у движка — не закрыт
+        await asyncio.sleep(0.1)
+        assert events == [('read', b"spool-bytes"), ('release', None)]
+        # повтор того же содержимого — кэш; release вызывается сразу
+        released = []
+        assert await pool.transcribe(io.BytesIO(b"spool-bytes"), release=lambda: released.append(1)) == "ok"
+        assert released == [1]
+    finally:
+        await pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_file_digest_runs_off_loop(monkeypatch):
+    from app.infrastructure.services import asr as asr_mod
+
+    offloaded = []
+    real_to_thread = asr_mod.asyncio.to_thread
+
+    async def _spy(fn, *args):
+        offloaded.append(fn.__name__)
+        return await real_to_thread(fn, *args)
+
+    monkeypatch.setattr(asr_mod.asyncio, 'to_thread', _spy)
+    assert await asr_mod.audio_digest_async(b"small") == asr_mod.audio_digest(b"small")
+    assert offloaded == []
+    assert await asr_mod.audio_digest_async(io.BytesIO(b"small")) == asr_mod.audio_digest(b"small")
+    assert offloaded == ['audio_digest']
+
+
+@pytest.mark.asyncio
+async def test_no_digest_without_real_engine(monkeypatch):
+    from app.infrastructure.services import asr as asr_mod
+
+    async def _no_hash(audio):
+        raise AssertionError("digest must not be computed")
+
+    monkeypatch.setattr(asr_mod, 'audio_digest_async', _no_hash)
+    monkeypatch.setattr(asr_mod.get_settings(), 'OPENAI_API_KEY', None)
+    pool = AsrWorkerPool(asr_mod.OpenAIAsrEngine(), workers=1)
+    stub_pool = AsrWorkerPool(StubAsrEngine(), workers=1)
+    try:
+        assert (await pool.transcribe(b"clip")).startswith("(asr disabled")
+        assert (await stub_pool.transcribe(b"clip")).startswith("stub transcript")
+        assert stub_pool.stats()['jobs'] == 1 and stub_pool.stats()['cache_hits'] == 0
+    finally:
+        await pool.shutdown()
+        await stub_pool.shutdown()
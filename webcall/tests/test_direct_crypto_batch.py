@@ -0,0 +1,40 @@
+from uuid import uuid4
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.infrastructure.services import direct_crypto as dc
+
+
+def test_fernet_cached_per_ordered_pair():
+    dc._cached_fernet.cache_clear()
+    a, b = uuid4(), uuid4()
+    ct = dc.encrypt_direct(a, b, "hi")
+    assert dc.decrypt_direct(b, a, ct) == "hi"
+    for _ in range(5):
+        dc.decrypt_direct(a, b, ct)
+    info = dc._cached_fernet.cache_info()
+    assert info.misses == 1 and info.hits == 6
+    # кэшированный ключ совпадает с прежним выводом — старые сообщения читаются
+    assert Fernet(dc._derive_key(b, a)).decrypt(ct.encode()) == b"hi"
+
+
+@pytest.mark.asyncio
+async def test_batch_decrypt_inline_and_offloaded(monkeypatch):
+    a, b, c = uuid4(), uuid4(), uuid4()
+    items = [(a, b, dc.encrypt_direct(a, b, f"m{i}")) for i in range(5)]
+    items.append((a, c, items[0][2]))  # чужой ключ — отдаём ciphertext как есть
+    expected = [f"m{i}" for i in range(5)] + [items[0][2]]
+
+    offloaded = []
+    real_to_thread = dc.asyncio.to_thread
+
+    async def _spy(fn, *args):
+        offloaded.append(len(args[0]))
+        return await real_to_thread(fn, *args)
+
+    monkeypatch.setattr(dc.asyncio, 'to_thread', _spy)
+    assert await dc.decrypt_direct_batch(items, offload_min=10) == expected
+    assert offloaded == []
+    assert await dc.decrypt_direct_batch(items, offload_min=3) == expected
+    assert offloaded == [6]
@@ -0,0 +1,31 @@
+import pytest
+
+from app.core.domain.models import DirectMessage
+from app.infrastructure.db.repositories.direct_messages import PgDirectMessageRepository
+
+
+@pytest.fixture
+def repo(db_session):
+    return PgDirectMessageRepository(db_session)
+
+
+@pytest.mark.asyncio
+async def test_add_returns_pair_ordinal_without_count(repo, make_user, sql_statements):
+    a, b, c = [await make_user() for _ in range(3)]
+    sql_statements.clear()
+    ordinals = [await repo.add(DirectMessage.create(a, b, a if i % 2 else b, f"m{i}")) for i in range(3)]
+    assert ordinals == [1, 2, 3]
+    assert await repo.add(DirectMessage.create(c, a, c, "x")) == 1
+    assert not any("count(" in s.lower() for s in sql_statements)
+    count, last_at = await repo.get_pair_stats(b, a)
+    assert count == 3 and last_at is not None
+
+
+@pytest.mark.asyncio
+async def test_delete_pair_resets_counter(repo, make_user):
+    a, b = await make_user(), await make_user()
+    for i in range(2):
+        await repo.add(DirectMessage.create(a, b, a, f"m{i}"))
+    assert await repo.delete_pair(a, b) == 2
+    assert await repo.get_pair_stats(a, b) == (0, None)
+    assert await repo.add(DirectMessage.create(a, b, a, "again")) == 1
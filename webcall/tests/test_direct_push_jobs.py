@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from app.infrastructure.db.models import DirectPushJobs, DirectReadStates, PushSubscriptions
+from app.infrastructure.services import direct_push_jobs as dpj
+from app.infrastructure.services.direct_push_jobs import DirectPushScheduler
+from app.infrastructure.services.webpush import PushBatchResult
+
+
+async def _users(make_user, n):
+    return [await make_user() for _ in range(n)]
+
+
+async def _jobs(db_sessionmaker):
+    async with db_sessionmaker() as s:
+        return list((await s.execute(select(DirectPushJobs))).scalars().all())
+
+
+@pytest.mark.asyncio
+async def test_newer_message_supersedes_and_read_ack_cancels(db_sessionmaker, make_user):
+    sch = DirectPushScheduler(db_sessionmaker, delay_sec=600)
+    a, b = await _users(make_user, 2)
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    await sch.schedule(b, a, t0)
+    await sch.schedule(b, a, t0 + timedelta(minutes=3))
+    jobs = await _jobs(db_sessionmaker)
+    assert len(jobs) == 1
+    assert jobs[0].message_sent_at == t0 + timedelta(minutes=3)
+    assert jobs[0].due_at == t0 + timedelta(minutes=13)
+    assert await sch.cancel(b, a) == 1
+    assert await _jobs(db_sessionmaker) == []
+
+
+@pytest.mark.asyncio
+async def test_due_batch_filters_read_and_sends_unread(monkeypatch, db_sessionmaker, make_user):
+    sch = DirectPushScheduler(db_sessionmaker, delay_sec=600, batch=10)
+    a, b, c, d = await _users(make_user, 4)
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    await sch.schedule(b, a, t0)  # не прочитано
+    await sch.schedule(c, a, t0)  # прочитано позже отправки
+    await sch.schedule(d, a, t0 + timedelta(hours=1))  # ещё не наступило
+    async with db_sessionmaker() as s:
+        async with s.begin():
+            s.add(DirectReadStates(owner_id=c, other_id=a, last_read_at=t0 + timedelta(minutes=1)))
+            s.add(PushSubscriptions(id=uuid4(), user_id=b, endpoint="https://p.example.com/b1", p256dh="p", auth="x", created_at=t0))
+            s.add(PushSubscriptions(id=uuid4(), user_id=b, endpoint="https://p.example.com/b2", p256dh="p", auth="x", created_at=t0))
+
+    sent = []
+
+    class FakeDelivery:
+        async def send_many(self, subs, message):
+            sent.append(([s.endpoint for s in subs], message.data))
+            return PushBatchResult(sent=1, gone=["https://p.example.com/b2"])
+
+    monkeypatch.setattr(dpj, 'get_push_delivery', lambda: FakeDelivery())
+    claimed = await sch.run_due(now=t0 + timedelta(minutes=11))
+    assert claimed == 2
+    assert len(sent) == 1
+    assert sorted(sent[0][0]) == ["https://p.example.com/b1", "https://p.example.com/b2"]
+    assert sent[0][1] == {"type": "direct", "from": str(a)}
+    remaining = await _jobs(db_sessionmaker)
+    assert [j.recipient_id for j in remaining] == [d]
+    async with db_sessionmaker() as s:
+        endpoints = (await s.execute(select(PushSubscriptions.endpoint))).scalars().all()
+    assert endpoints == ["https://p.example.com/b1"]
+    # повторный проход ничего не забирает
+    assert await sch.run_due(now=t0 + timedelta(minutes=11)) == 0
+
+
+@pytest.mark.asyncio
+async def test_claimed_job_kept_until_sent_and_reclaimed_after_lease(db_sessionmaker, make_user):
+    sch = DirectPushScheduler(db_sessionmaker, delay_sec=600, lease_sec=60)
+    a, b = await _users(make_user, 2)
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    await sch.schedule(b, a, t0)
+    now = t0 + timedelta(minutes=11)
+    claimed, jobs = await sch.claim_due(now)
+    assert claimed == 1 and len(jobs) == 1
+    # процесс "упал" до отправки: задача на месте и снова наступит после lease
+    assert (await sch.claim_due(now))[0] == 0
+    claimed, jobs = await sch.claim_due(now + timedelta(seconds=61))
+    assert claimed == 1
+    # пока шла отправка, пришло новое сообщение — его задача не удаляется вместе с отправленной
+    await sch.schedule(b, a, now + timedelta(seconds=62))
+    await sch.complete(jobs)
+    remaining = await _jobs(db_sessionmaker)
+    assert [j.message_sent_at for j in remaining] == [now + timedelta(seconds=62)]
+
+
+@pytest.mark.asyncio
+async def test_reply_cancels_pending_push_in_message_transaction(db_session, db_sessionmaker, make_user):
+    from app.core.domain.models import DirectMessage
+    from app.infrastructure.db.repositories.direct_messages import PgDirectMessageRepository
+
+    sch = DirectPushScheduler(db_sessionmaker, delay_sec=600)
+    a, b = await _users(make_user, 2)
+    await sch.schedule(b, a, datetime.utcnow())  # b ещё не прочитал сообщение a
+    repo = PgDirectMessageRepository(db_session)
+    await repo.add(DirectMessage.create(a, b, a, "ещё одно"))
+    assert len(await _jobs(db_sessionmaker)) == 1  # сообщение от a push не снимает
+    await repo.add(DirectMessage.create(a, b, b, "ответ"))
+    assert await _jobs(db_sessionmaker) == []
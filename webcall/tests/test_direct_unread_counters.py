@@ -0,0 +1,69 @@
+from dataclasses import replace
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.core.domain.models import DirectMessage
+from app.infrastructure.db.repositories.direct_messages import PgDirectMessageRepository
+from app.infrastructure.db.repositories.direct_reads import PgDirectReadStateRepository
+from app.presentation.ws import friends as ws_friends
+
+
+async def _setup(db_session, make_user):
+    a, b = await make_user(), await make_user()
+    return PgDirectMessageRepository(db_session), PgDirectReadStateRepository(db_session), a, b
+
+
+async def _post(dms, reads, sender, to, sent_at):
+    dm = DirectMessage.create(sender, to, sender, "c")
+    dm.sent_at = sent_at
+    await dms.add(dm)  # счётчик получателя растёт в той же транзакции
+    return await reads.get_unread(to, sender)
+
+
+@pytest.mark.asyncio
+async def test_counter_increments_and_read_ack_resets(db_session, make_user):
+    dms, reads, a, b = await _setup(db_session, make_user)
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    assert [await _post(dms, reads, b, a, t0 + timedelta(minutes=i)) for i in range(3)] == [1, 2, 3]
+    assert await _post(dms, reads, a, b, t0 + timedelta(minutes=5)) == 1
+    # read-ack на момент второго сообщения — пересчёт хвоста
+    assert await reads.set_last_read(a, b, t0 + timedelta(minutes=1)) == 1
+    assert await reads.get_unread(a, b) == 1
+    # read-ack "сейчас" — обнуление без подсчёта
+    assert await reads.set_last_read(a, b, t0 + timedelta(hours=1)) == 0
+    assert await reads.get_unread(a, b) == 0
+    assert await reads.get_unread(b, a) == 1
+    await dms.delete_pair(a, b)
+    assert await reads.get_unread(b, a) == 0
+
+
+@pytest.mark.asyncio
+async def test_counter_rolls_back_with_failed_insert(db_session, make_user):
+    dms, reads, a, b = await _setup(db_session, make_user)
+    dm = DirectMessage.create(b, a, b, "c")
+    await dms.add(dm)
+    with pytest.raises(IntegrityError):
+        await dms.add(replace(dm))  # повтор id — вставка падает, счётчик не должен вырасти
+    await db_session.rollback()
+    assert await reads.get_unread(a, b) == 1
+
+
+class _FakeWS:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, payload):
+        self.sent.append(payload)
+
+
+@pytest.mark.asyncio
+async def test_publish_unread_update_goes_to_owner_only(monkeypatch):
+    a, b = uuid4(), uuid4()
+    ws_a, ws_b = _FakeWS(), _FakeWS()
+    monkeypatch.setattr(ws_friends, '_friend_clients', {a: {ws_a}, b: {ws_b}})
+    await ws_friends.publish_unread_update(a, b, 4)
+    assert ws_a.sent == [{'type': 'unread_update', 'friendId': str(b), 'unread': 4}]
+    assert ws_b.sent == []
@@ -0,0 +1,30 @@
+import pytest
+
+from app.core.domain.models import Friendship, FriendStatus
+from app.infrastructure.db.models import DirectUnreadCounters
+from app.infrastructure.db.repositories.friends import PgFriendshipRepository
+
+
+@pytest.mark.asyncio
+async def test_overview_returns_profiles_and_unread_in_one_query(db_session, make_user, sql_statements):
+    repo = PgFriendshipRepository(db_session)
+    me, bob, carol, dave, erin = [await make_user(n) for n in ("me", "bob", "carol", "dave", "erin")]
+    await repo.add(Friendship.pair(me, bob, requested_by=me, status=FriendStatus.accepted))
+    await repo.add(Friendship.pair(me, carol, requested_by=carol, status=FriendStatus.accepted))
+    await repo.add(Friendship.pair(dave, me, requested_by=dave))  # входящая заявка
+    await repo.add(Friendship.pair(me, erin, requested_by=me))  # исходящая — не в requests
+    s = repo.session
+    s.add(DirectUnreadCounters(owner_id=me, other_id=bob, unread=2))
+    s.add(DirectUnreadCounters(owner_id=me, other_id=carol, unread=1))
+    s.add(DirectUnreadCounters(owner_id=bob, other_id=me, unread=5))  # счётчик другой стороны не смешивается
+    await s.commit()
+
+    sql_statements.clear()
+    items = {i.username: i for i in await repo.list_overview(me)}
+    assert len(sql_statements) == 1  # один SELECT
+    assert set(items) == {"bob", "carol"}
+    assert items["bob"].unread == 2 and items["bob"].other_id == bob and items["bob"].email == "bob@ex.com"
+    assert items["carol"].unread == 1
+
+    reqs = await repo.list_overview(me, requests=True, with_unread=False)
+    assert [(r.username, r.other_id, r.friendship.status) for r in reqs] == [("dave", dave, FriendStatus.pending)]
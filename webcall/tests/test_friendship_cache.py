@@ -0,0 +1,124 @@
+from uuid import uuid4
+
+import pytest
+
+from app.core.domain.models import Friendship, FriendStatus
+from app.infrastructure.db.repositories.friends import PgFriendshipRepository
+from app.infrastructure.services import friendship_cache as fc
+from app.infrastructure.services.friendship_cache import EVENTS_CHANNEL, FriendshipCache
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.published = []
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+        return int(self.data[key])
+
+    async def expire(self, key, sec):
+        return True
+
+    async def eval(self, script, numkeys, edge_key, version_key, value, version, ttl):
+        # _PUT_IF_VERSION
+        if str(self.data.get(version_key) or '0') != version:
+            return 0
+        self.data[edge_key] = value
+        return 1
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+def _friendship_selects(statements):
+    return [st for st in statements if st.lstrip().upper().startswith("SELECT") and "friendships" in st]
+
+
+@pytest.mark.asyncio
+async def test_steady_state_does_not_query_and_writes_invalidate(db_session, make_user, sql_statements):
+    a, b = await make_user(), await make_user()
+    repo = PgFriendshipRepository(db_session, cache=FriendshipCache(ttl_sec=60))
+    assert await repo.get_pair(a, b) is None
+    assert await repo.get_pair(b, a) is None  # отсутствие дружбы тоже кэшируется
+    assert len(_friendship_selects(sql_statements)) == 1
+
+    await repo.add(Friendship.pair(a, b, requested_by=a))  # send_request
+    f = await repo.get_pair(b, a)
+    assert f.status == FriendStatus.pending and len(_friendship_selects(sql_statements)) == 2
+
+    f.status = FriendStatus.accepted  # accept_friend: мутация копии не портит кэш до update
+    assert (await repo.get_pair(a, b)).status == FriendStatus.pending
+    await repo.update(f)
+    for _ in range(5):
+        assert (await repo.get_pair(a, b)).status == FriendStatus.accepted
+    assert len(_friendship_selects(sql_statements)) == 3
+
+    await repo.remove(b, a)  # delete_friend
+    assert await repo.get_pair(a, b) is None
+    assert len(_friendship_selects(sql_statements)) == 4
+
+
+@pytest.mark.asyncio
+async def test_stale_read_not_cached_after_concurrent_invalidation():
+    cache = FriendshipCache(ttl_sec=60)
+    a, b = uuid4(), uuid4()
+    token = await cache.read_token(a, b)
+    await cache.invalidate(a, b)  # запись произошла, пока читали БД
+    await cache.put(a, b, None, token=token)
+    assert await cache.get(a, b) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_redis_shares_edges_and_broadcasts_invalidation():
+    redis = _FakeRedis()
+    node1, node2 = FriendshipCache(ttl_sec=60, redis=redis), FriendshipCache(ttl_sec=60, redis=redis)
+    f = Friendship.pair(uuid4(), uuid4(), requested_by=uuid4(), status=FriendStatus.accepted)
+    await node1.put(f.user_b_id, f.user_a_id, f)
+    hit, got = await node2.get(f.user_a_id, f.user_b_id)
+    assert hit and got == f
+    gets = redis.gets
+    await node2.get(f.user_a_id, f.user_b_id)  # второй раз — из локального LRU
+    assert redis.gets == gets
+
+    await node1.invalidate(f.user_a_id, f.user_b_id)
+    channel, payload = redis.published[-1]
+    assert channel == EVENTS_CHANNEL
+    node2._handle_event(payload)
+    assert await node2.get(f.user_a_id, f.user_b_id) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_stale_read_on_other_node_not_written_to_redis():
+    redis = _FakeRedis()
+    reader, writer = FriendshipCache(ttl_sec=60, redis=redis), FriendshipCache(ttl_sec=60, redis=redis)
+    f = Friendship.pair(uuid4(), uuid4(), requested_by=uuid4(), status=FriendStatus.accepted)
+    token = await reader.read_token(f.user_a_id, f.user_b_id)
+    # другой воркер удалил дружбу, пока reader читал БД; pub/sub до reader ещё не дошёл
+    await writer.invalidate(f.user_a_id, f.user_b_id)
+    await reader.put(f.user_a_id, f.user_b_id, f, token=token)
+    assert not any(k.startswith("friend_edge:") for k in redis.data)
+    assert await writer.get(f.user_a_id, f.user_b_id) == (False, None)
+    # чтение после записи кэшируется как обычно
+    token = await reader.read_token(f.user_a_id, f.user_b_id)
+    await reader.put(f.user_a_id, f.user_b_id, None, token=token)
+    assert await writer.get(f.user_a_id, f.user_b_id) == (True, None)
+
+
+def test_memory_backend_ttl_is_capped(monkeypatch):
+    settings = fc.get_settings()
+    monkeypatch.setattr(settings, 'FRIENDSHIP_CACHE_BACKEND', 'memory')
+    monkeypatch.setattr(settings, 'FRIENDSHIP_CACHE_TTL_SEC', 300)
+    monkeypatch.setattr(fc, '_friendship_cache', None)
+    assert fc.get_friendship_cache().ttl_sec == fc.MEMORY_TTL_MAX_SEC
@@ -0,0 +1,110 @@
+import threading
+import time
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from py_vapid import Vapid, b64urlencode
+
+from app.infrastructure.services import webpush as wp
+from app.infrastructure.services.webpush import PushDeliveryService, WebPushMessage
+
+
+def _private_key() -> str:
+    v = Vapid()
+    v.generate_keys()
+    return b64urlencode(v.private_key.private_numbers().private_value.to_bytes(32, 'big'))
+
+
+def _sub(endpoint):
+    return SimpleNamespace(endpoint=endpoint, p256dh="p", auth="a")
+
+
+class _Repo:
+    def __init__(self, subs):
+        self.subs = subs
+        self.removed = []
+
+    async def list_by_user(self, user_id):
+        return list(self.subs)
+
+    async def remove_many(self, user_id, endpoints):
+        self.removed.append(list(endpoints))
+        return len(endpoints)
+
+
+def _fake_webpush(statuses, calls, delay=0.0):
+    lock = threading.Lock()
+    active = [0]
+
+    def fake(subscription_info, data, headers, ttl, requests_session):
+        with lock:
+            active[0] += 1
+            calls.append((subscription_info["endpoint"], dict(headers), active[0]))
+        time.sleep(delay)
+        with lock:
+            active[0] -= 1
+        status = statuses.get(subscription_info["endpoint"], 201)
+        if status >= 300:
+            raise wp.WebPushException("push failed", response=SimpleNamespace(status_code=status))
+        return SimpleNamespace(status_code=status)
+
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_vapid_header_signed_once_per_origin(monkeypatch):
+    calls = []
+    monkeypatch.setattr(wp, 'webpush', _fake_webpush({}, calls))
+    key = _private_key()
+    svc = PushDeliveryService(key, "mailto:a@example.com", max_workers=4)
+    signs = []
+    try:
+        svc._vapid = Vapid.from_string(private_key=key)
+        orig_sign = svc._vapid.sign
+
+        def counting_sign(claims):
+            signs.append(claims["aud"])
+            return orig_sign(claims)
+
+        svc._vapid.sign = counting_sign
+        subs = [_sub(f"https://fcm.example.com/send/{i}") for i in range(3)] + [_sub("https://updates.push.example.org/x")]
+        res = await svc.send_many(subs, WebPushMessage(title="t", body="b"))
+        res2 = await svc.send_many(subs, WebPushMessage(title="t", body="b"))
+        assert res.sent == 4 and res2.sent == 4
+        assert sorted(signs) == ["https://fcm.example.com", "https://updates.push.example.org"]  # по одной подписи на origin
+        assert all(h["Authorization"].startswith("vapid t=") for _e, h, _a in calls)
+    finally:
+        svc.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_devices_sent_concurrently_and_gone_pruned_in_batch(monkeypatch):
+    calls = []
+    statuses = {"https://p.example.com/gone1": 410, "https://p.example.com/gone2": 404, "https://p.example.com/bad": 400}
+    monkeypatch.setattr(wp, 'webpush', _fake_webpush(statuses, calls, delay=0.05))
+    svc = PushDeliveryService(_private_key(), "mailto:a@example.com", max_workers=8)
+    try:
+        repo = _Repo([_sub(f"https://p.example.com/{n}") for n in ("ok1", "ok2", "gone1", "gone2", "bad")])
+        started = time.monotonic()
+        res = await svc.deliver(repo, uuid4(), WebPushMessage(title="t", body="b"))
+        assert time.monotonic() - started < 0.2
+        assert max(a for _e, _h, a in calls) > 1
+        assert res.sent == 2 and res.failed == 1
+        assert repo.removed == [res.gone]  # одно удаление на пачку
+        assert set(res.gone) == {"https://p.example.com/gone1", "https://p.example.com/gone2"}
+    finally:
+        svc.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_retried(monkeypatch):
+    calls = []
+    statuses = {"https://p.example.com/x": 503}
+    monkeypatch.setattr(wp, 'webpush', _fake_webpush(statuses, calls))
+    svc = PushDeliveryService(_private_key(), "mailto:a@example.com")
+    try:
+        assert await svc.send("https://p.example.com/x", "p", "a", WebPushMessage(title="t", body="b")) == 'failed'
+        assert len(calls) == PushDeliveryService.MAX_ATTEMPTS
+    finally:
+        svc.shutdown()
@@ -0,0 +1,106 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from app.presentation.ws import rooms
+
+
+class _NoAI:
+    async def generate_summary(self, messages, system_prompt=None):  # type: ignore
+        raise AssertionError("auto-voice для обслуженного пользователя не должен строить summary")
+
+
+@pytest.mark.asyncio
+async def test_auto_voice_skipped_for_served_user():
+    room, user = uuid4(), uuid4()
+    rooms._user_manual_summary_served.add((room, user))
+    try:
+        await rooms._generate_and_send_summary(room, str(room), 'auto-voice', ai_provider=_NoAI(), collector=None, voice_coll=None, initiator_user_id=user)
+    finally:
+        rooms._user_manual_summary_served.discard((room, user))
+
+
+@pytest.mark.asyncio
+async def test_room_state_pruned_after_room_ends():
+    room, other, user = uuid4(), uuid4(), uuid4()
+    rooms._room_agent_start[(room, user)] = 1
+    rooms._room_agent_start[(other, user)] = 1
+    rooms._user_manual_summary_served.add((room, user))
+    try:
+        rooms._schedule_room_state_prune(room, delay_sec=0)
+        await asyncio.sleep(0.01)
+        assert (room, user) not in rooms._room_agent_start
+        assert (room, user) not in rooms._user_manual_summary_served
+        assert (other, user) in rooms._room_agent_start
+        assert room not in rooms._room_prune_tasks
+    finally:
+        rooms._room_agent_start.pop((other, user), None)
+
+
+@pytest.mark.asyncio
+async def test_room_state_kept_if_someone_rejoined():
+    room, user = uuid4(), uuid4()
+    rooms._room_agent_start[(room, user)] = 1
+    rooms._room_members[room].add(user)
+    try:
+        rooms._schedule_room_state_prune(room, delay_sec=0)
+        await asyncio.sleep(0.01)
+        assert (room, user) in rooms._room_agent_start
+    finally:
+        rooms._room_members.pop(room, None)
+        rooms._room_agent_start.pop((room, user), None)
+
+
+class _Personal:
+    room_id = 'r'
+    message_count = 1
+    used_voice = True
+    summary_text = 'summary'
+    participants = []
+
+
+class _Orchestrator:
+    def __init__(self):
+        self.builds = 0
+
+    def get_counters(self):
+        return {}
+
+    def add_voice_transcript(self, *args, **kwargs):  # type: ignore
+        pass
+
+    async def build_personal_summary(self, **kwargs):  # type: ignore
+        self.builds += 1
+        return _Personal()
+
+
+class _Dispatcher:
+    def __init__(self):
+        self.queued = []
+
+    async def queue_summary(self, user_id, text, *, reason):
+        self.queued.append((user_id, reason))
+        return True
+
+
+@pytest.mark.asyncio
+async def test_two_auto_voice_captures_both_summarized(monkeypatch):
+    room, user = uuid4(), uuid4()
+    orch, disp = _Orchestrator(), _Dispatcher()
+
+    async def chat_id(session, user_id):
+        return "100"
+
+    monkeypatch.setattr(rooms, 'get_summary_orchestrator', lambda: orch)
+    monkeypatch.setattr(rooms, 'get_dispatcher', lambda: disp)
+    monkeypatch.setattr(rooms, 'get_confirmed_chat_id', chat_id)
+    monkeypatch.setattr(rooms.get_settings(), 'TELEGRAM_BOT_TOKEN', 'test-token', raising=False)
+    try:
+        for _ in range(2):  # запись остановлена и начата снова в той же сессии
+            await rooms._generate_and_send_summary(room, str(room), 'auto-voice', ai_provider=None, collector=None, voice_coll=None, session=object(), initiator_user_id=user)
+        assert orch.builds == 2
+        assert [u for u, _ in disp.queued] == [str(user), str(user)]
+        assert (room, user) not in rooms._user_manual_summary_served
+    finally:
+        rooms._user_manual_summary_served.discard((room, user))
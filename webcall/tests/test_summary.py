@@ -24,3 +24,17 @@ async def test_summary_collector_basic(monkeypatch):
     # повторная суммаризация той же комнаты должна вернуть None (очищено)
     res2 = await collector.summarize('room-x', HeuristicAIProvider())
     assert res2 is None
+
+
+def test_compaction_stats_exposed_in_memory_stats():
+    from app.infrastructure.services.summary_v2 import prompt_codec
+    from app.infrastructure.services.summary_v2.models import ChatMessage
+    from app.infrastructure.services.summary_v2.orchestrator import SummaryOrchestrator
+
+    assert prompt_codec.__doc__ and prompt_codec.__doc__.startswith("Компактное")
+    before = SummaryOrchestrator().memory_stats()
+    msgs = [ChatMessage('r', 'u1', 'Very Long Display Name', f'text {i}', 1758649999999 + i * 1000) for i in range(5)]
+    prompt_codec.record(prompt_codec.encode_compact(msgs))
+    after = SummaryOrchestrator().memory_stats()
+    assert after['prompts_compacted'] == before['prompts_compacted'] + 1
+    assert after['prompt_saved_tokens'] > before['prompt_saved_tokens']
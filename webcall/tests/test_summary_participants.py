@@ -38,3 +38,21 @@ async def test_summary_participant_breakdown(monkeypatch):
     res2 = await orch.build_personal_summary(room_id=room_id, user_id='u1', ai_provider=provider, db_session=None)
     # breakdown отключён
     assert res2.participants is None or res2.participants == []
+
+
+@pytest.mark.asyncio
+async def test_shared_voice_segment_not_mutated_per_user():
+    import time
+    from app.infrastructure.services.summary_v2.models import VoiceSegment
+    from app.infrastructure.services.summary_v2.orchestrator import SummaryOrchestrator
+
+    orch = SummaryOrchestrator()
+    await orch.start_user_window('r-shared', 'u1', 'Alice')
+    await orch.start_user_window('r-shared', 'u2', 'Bob')
+    seg = VoiceSegment.from_text("Обсуждаем релиз на следующей неделе.", capture_ts=int(time.time() * 1000), has_meta=True)
+    orch.add_voice_transcript('r-shared', seg, user_id='u1')
+    orch.add_voice_transcript('r-shared', seg, user_id='u2')
+    # один и тот же сегмент (opportunistic attach всем участникам) — атрибуция у каждого своя
+    assert seg.speaker is None
+    assert orch._sessions[('r-shared', 'u1')]._voice_segments[0].speaker == 'Alice'
+    assert orch._sessions[('r-shared', 'u2')]._voice_segments[0].speaker == 'Bob'
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+
+from app.infrastructure.db.models import TelegramLinks
+from app.infrastructure.services import telegram_link as tl
+
+
+async def _user(make_user, session, chat_id=None) -> object:
+    uid = await make_user()
+    if chat_id:
+        now = datetime.utcnow()
+        session.add(TelegramLinks(user_id=uid, token=uid.hex, chat_id=chat_id, status='confirmed', created_at=now, confirmed_at=now))
+        await session.commit()
+    return uid
+
+
+def _selects(statements):
+    return [st for st in statements if st.lstrip().upper().startswith("SELECT")]
+
+
+@pytest.mark.asyncio
+async def test_group_lookup_single_query_then_cached(monkeypatch, db_session, make_user, sql_statements):
+    monkeypatch.setattr(tl, '_chat_id_cache', tl.ChatIdCache(ttl_sec=60))
+    s = db_session
+    a = await _user(make_user, s, "100")
+    b = await _user(make_user, s, "200")
+    c = await _user(make_user, s)  # без привязки
+    sql_statements.clear()
+    res = await tl.get_confirmed_chat_ids(s, [a, b, c, a])
+    assert res == {str(a): "100", str(b): "200", str(c): None}
+    assert len(_selects(sql_statements)) == 1
+    # установившийся режим: ни одного запроса, включая негативный результат
+    assert await tl.get_confirmed_chat_id(s, c) is None
+    assert await tl.get_confirmed_chat_id(s, str(b)) == "200"
+    assert len(_selects(sql_statements)) == 1
+
+
+@pytest.mark.asyncio
+async def test_revoke_and_confirm_invalidate(monkeypatch, db_session, make_user):
+    monkeypatch.setattr(tl, '_chat_id_cache', tl.ChatIdCache(ttl_sec=60))
+    s = db_session
+    uid = await _user(make_user, s, "100")
+    assert await tl.get_confirmed_chat_id(s, uid) == "100"
+    await tl.revoke_user_links(s, uid)
+    await s.commit()
+    assert await tl.get_confirmed_chat_id(s, uid) is None
+
+    link = await tl.create_or_refresh_link(s, uid)
+    await s.commit()
+    assert await tl.confirm_link(s, link.token, "300")
+    await s.commit()
+    assert await tl.get_confirmed_chat_id(s, uid) == "300"
+
+
+def test_cache_ttl_expiry(monkeypatch):
+    cache = tl.ChatIdCache(ttl_sec=10)
+    now = [1000.0]
+    monkeypatch.setattr(tl.time, 'monotonic', lambda: now[0])
+    cache.put("u", "1")
+    assert cache.get("u") == (True, "1")
+    now[0] += 11
+    assert cache.get("u") == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_read_before_commit_does_not_leave_stale_entry(monkeypatch, db_session, make_user):
+    monkeypatch.setattr(tl, '_chat_id_cache', tl.ChatIdCache(ttl_sec=60))
+    s = db_session
+    uid = await _user(make_user, s, "100")
+    await tl.revoke_user_links(s, uid)
+    # параллельный запрос другой сессии до commit видит и кэширует старую привязку
+    tl.get_chat_id_cache().put(uid, "100")
+    await s.commit()
+    assert await tl.get_confirmed_chat_id(s, uid) is None
+
+
+def test_put_skipped_after_concurrent_invalidation():
+    cache = tl.ChatIdCache(ttl_sec=60)
+    generation = cache.generation
+    cache.invalidate("u")  # commit случился, пока шло чтение
+    cache.put("u", "old", generation=generation)
+    assert cache.get("u") == (False, None)
@@ -0,0 +1,281 @@
+import asyncio
+
+import pytest
+
+from app.infrastructure.services import telegram as tg
+from app.infrastructure.services import telegram_dispatcher as td
+from app.infrastructure.services.telegram import MAX_TEXT_LEN, TokenBucket, split_text
+from app.infrastructure.services.telegram_dispatcher import TelegramDispatcher
+
+
+def test_token_bucket_rate():
+    b = TokenBucket(1.0, 1.0)
+    now = b.updated
+    assert b.take(now) == 0.0
+    assert b.take(now) == pytest.approx(1.0)
+    assert b.take(now + 0.5) == pytest.approx(0.5)
+    assert b.take(now + 1.0) == 0.0
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setattr(td.get_settings(), 'TELEGRAM_BOT_TOKEN', 'test-token', raising=False)
+    d = TelegramDispatcher(workers=2, limiter=tg._FanoutLimiter(8, 50.0, 1000.0))
+    d.BACKOFF_BASE = 0.05
+
+    async def resolve(user_id):
+        return f"chat-{user_id}"
+
+    monkeypatch.setattr(d, '_resolve_chat_id', resolve)
+    return d
+
+
+async def _wait_for(cond, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline, "timeout"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_failing_chat_does_not_block_others(dispatcher, monkeypatch):
+    sent = []
+    attempts = {}
+
+    async def fake_send(text, chat_id):
+        cid = chat_id
+        attempts[cid] = attempts.get(cid, 0) + 1
+        if cid == 'chat-bad':
+            return False
+        sent.append(cid)
+        return True
+
+    monkeypatch.setattr(td, 'low_level_send', fake_send)
+    try:
+        assert await dispatcher.queue_summary('bad', 'summary bad', reason='r')
+        for i in range(3):
+            assert await dispatcher.queue_summary(f'u{i}', f'summary {i}', reason='r')
+        # хорошие чаты отправлены, пока плохой ждёт ретрая в куче
+        await _wait_for(lambda: len(sent) == 3)
+        assert attempts['chat-bad'] < TelegramDispatcher.MAX_ATTEMPTS
+        await _wait_for(lambda: attempts.get('chat-bad') == TelegramDispatcher.MAX_ATTEMPTS and dispatcher.pending() == {'ready': 0, 'delayed': 0})
+        # дубликат подавлен
+        assert not await dispatcher.queue_summary('u0', 'summary 0', reason='r')
+    finally:
+        await dispatcher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_per_chat_rate_defers_instead_of_blocking(dispatcher, monkeypatch):
+    dispatcher._limiter.rate_per_chat = 5.0  # 1 сообщение / 200 мс на чат
+    times = {}
+
+    async def fake_send(text, chat_id):
+        times.setdefault(chat_id, []).append(asyncio.get_running_loop().time())
+        return True
+
+    monkeypatch.setattr(td, 'low_level_send', fake_send)
+    try:
+        for i in range(3):
+            await dispatcher.queue_summary('same', f'part {i}', reason='r')
+        await dispatcher.queue_summary('other', 'other text', reason='r')
+        await _wait_for(lambda: len(times.get('chat-same', [])) == 3 and 'chat-other' in times)
+        same = times['chat-same']
+        assert same[1] - same[0] >= 0.15 and same[2] - same[1] >= 0.15
+        # другой чат ушёл сразу, не дожидаясь лимита первого
+        assert times['chat-other'][0] < same[1]
+    finally:
+        await dispatcher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_shares_fanout_limiter(monkeypatch):
+    monkeypatch.setattr(td.get_settings(), 'TELEGRAM_BOT_TOKEN', 'test-token', raising=False)
+    limiter = tg._FanoutLimiter(8, 1.0, 1000.0)
+    monkeypatch.setattr(tg, '_limiter', limiter)
+    posted = []
+
+    async def fake_post(token, chat_id, text):
+        posted.append(chat_id)
+        return True
+
+    async def resolve(user_id):
+        return f"chat-{user_id}"
+
+    monkeypatch.setattr(tg, '_post_message', fake_post)
+    d = TelegramDispatcher(workers=1)
+    monkeypatch.setattr(d, '_resolve_chat_id', resolve)
+    try:
+        assert await d.queue_summary('u1', 'summary', reason='r')
+        await _wait_for(lambda: posted == ['chat-u1'])
+        # токены списаны один раз и из общих корзин: рассылка в тот же чат теперь ждёт лимит
+        assert d._limiter is limiter
+        assert limiter.global_bucket.tokens == pytest.approx(999.0, abs=0.5)
+        assert limiter.take_chat('chat-u1') > 0
+    finally:
+        await d.shutdown()
+
+
+class _FakeOutbox:
+    def __init__(self):
+        self.rows = []
+        self.done = {}
+        self.purges = 0
+
+    async def enqueue(self, user_id, text, reason, dedupe_key):
+        if any(r[3] == dedupe_key for r in self.rows):
+            return False
+        self.rows.append((user_id, text, reason, dedupe_key))
+        return True
+
+    async def claim(self, limit):
+        from app.infrastructure.services.telegram_dispatcher import PendingTask
+        out = []
+        while self.rows and len(out) < limit:
+            user_id, text, reason, key = self.rows.pop(0)
+            t = PendingTask(user_id=str(user_id), text=text, reason=reason, id=key)
+            t.transition(PendingTask.SENDING)
+            out.append(t)
+        return out
+
+    async def purge(self):
+        self.purges += 1
+        return 0
+
+    async def mark_sent(self, task):
+        task.transition(task.SENT)
+        self.done[task.id] = task.status
+
+    async def mark_retry(self, task, delay, error=None):
+        task.transition(task.PENDING)
+        self.done[task.id] = task.status
+
+    async def mark_failed(self, task, error=None):
+        task.transition(task.FAILED)
+        self.done[task.id] = task.status
+
+
+@pytest.mark.asyncio
+async def test_outbox_mode_marks_rows(monkeypatch):
+    monkeypatch.setattr(td.get_settings(), 'TELEGRAM_BOT_TOKEN', 'test-token', raising=False)
+    outbox = _FakeOutbox()
+    d = TelegramDispatcher(workers=2, limiter=tg._FanoutLimiter(8, 50.0, 1000.0), outbox=outbox)
+
+    async def resolve(user_id):
+        return None if user_id.endswith('0000') else f"chat-{user_id}"
+
+    async def fake_send(text, chat_id):
+        return True
+
+    monkeypatch.setattr(d, '_resolve_chat_id', resolve)
+    monkeypatch.setattr(td, 'low_level_send', fake_send)
+    ok_user = '11111111-1111-1111-1111-111111111111'
+    no_chat = '22222222-2222-2222-2222-000000000000'
+    try:
+        assert await d.queue_summary(ok_user, 'text', reason='r')
+        assert not await d.queue_summary(ok_user, 'text', reason='r')
+        assert await d.queue_summary(no_chat, 'text', reason='r')
+        await _wait_for(lambda: len(outbox.done) == 2)
+        assert sorted(outbox.done.values()) == ['failed', 'sent']
+        assert outbox.purges == 1  # очистка троттлится, а не на каждый цикл pump
+    finally:
+        await d.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_outbox_digest_merges_claimed_rows_per_user(monkeypatch):
+    monkeypatch.setattr(td.get_settings(), 'TELEGRAM_BOT_TOKEN', 'test-token', raising=False)
+    outbox = _FakeOutbox()
+    d = TelegramDispatcher(workers=1, limiter=tg._FanoutLimiter(8, 50.0, 1000.0), outbox=outbox, digest_window_sec=5)
+    sent = []
+
+    async def resolve(user_id):
+        return f"chat-{user_id[:4]}"
+
+    async def fake_send(text, chat_id):
+        sent.append((chat_id, text))
+        return True
+
+    monkeypatch.setattr(d, '_resolve_chat_id', resolve)
+    monkeypatch.setattr(td, 'low_level_send', fake_send)
+    u1 = '11111111-1111-1111-1111-111111111111'
+    u2 = '22222222-2222-2222-2222-222222222222'
+    try:
+        for text in ('a' * 3000, 'b' * 500, 'c' * 1000):
+            assert await d.queue_summary(u1, text, reason='r')
+        assert await d.queue_summary(u2, 'other user', reason='r')
+        await _wait_for(lambda: len(outbox.done) == 4)
+        # каждая строка outbox попала ровно в одно сообщение и помечена по его итогу
+        assert sorted(sent) == [('chat-1111', 'a' * 3000 + '\n\n' + 'b' * 500), ('chat-1111', 'c' * 1000), ('chat-2222', 'other user')]
+        assert set(outbox.done.values()) == {'sent'}
+    finally:
+        await d.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_digest_merges_same_user_within_window(dispatcher, monkeypatch):
+    dispatcher._digest_window = 0.1
+    sent = []
+
+    async def fake_send(text, chat_id):
+        sent.append((chat_id, text))
+        return True
+
+    monkeypatch.setattr(td, 'low_level_send', fake_send)
+    try:
+        assert await dispatcher.queue_summary('u1', 'first summary', reason='manual')
+        assert await dispatcher.queue_summary('u1', 'second summary', reason='auto')
+        assert await dispatcher.queue_summary('u2', 'other user', reason='manual')
+        await _wait_for(lambda: len(sent) == 2)
+        merged = dict(sent)
+        assert merged['chat-u1'] == 'first summary\n\nsecond summary'
+        assert merged['chat-u2'] == 'other user'
+        # окно закрыто: следующая выжимка открывает новый digest
+        assert await dispatcher.queue_summary('u1', 'third summary', reason='manual')
+        await _wait_for(lambda: len(sent) == 3)
+        assert sent[-1] == ('chat-u1', 'third summary')
+    finally:
+        await dispatcher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_digest_splits_at_length_limit(dispatcher, monkeypatch):
+    dispatcher._digest_window = 0.05
+    sent = []
+
+    async def fake_send(text, chat_id):
+        sent.append(text)
+        return True
+
+    monkeypatch.setattr(td, 'low_level_send', fake_send)
+    try:
+        for ch in 'abc':
+            await dispatcher.queue_summary('u1', ch * 1800, reason='r')
+        await _wait_for(lambda: len(sent) == 2)
+        assert all(len(t) <= MAX_TEXT_LEN for t in sent)
+        assert ''.join(sent).replace('\n', '') == 'a' * 1800 + 'b' * 1800 + 'c' * 1800
+    finally:
+        await dispatcher.shutdown()
+
+
+def test_split_text_long_part_breaks_on_newline():
+    part = "\n".join(["x" * 30] * 10)
+    chunks = split_text([part], limit=100)
+    assert all(len(c) <= 100 for c in chunks)
+    assert "".join(c.replace("\n", "") for c in chunks) == "x" * 300
+
+
+def test_seen_keys_evicted_from_head(monkeypatch):
+    d = TelegramDispatcher(workers=1)
+    d._seen_ttl = 10
+    d._seen_max = 3
+    for i in range(3):
+        d._remember(f"k{i}", 100.0 + i)
+    d._prune_seen(105.0)
+    assert list(d._seen) == ["k0", "k1", "k2"]
+    d._prune_seen(111.5)  # k0, k1 старше TTL
+    assert list(d._seen) == ["k2"]
+    for i in range(3, 7):
+        d._remember(f"k{i}", 112.0)
+    d._prune_seen(112.0)  # превышен размер — выбрасываются самые старые
+    assert list(d._seen) == ["k4", "k5", "k6"]
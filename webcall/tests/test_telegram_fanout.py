@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+
+from app.infrastructure.services import telegram as tg
+
+
+class _S:
+    TELEGRAM_BOT_TOKEN = "t"
+    TELEGRAM_CHAT_ID = None
+
+
+def _setup(monkeypatch, *, concurrency=8, rate_per_chat=1.0, rate_global=1000.0, delay=0.05, fail=()):
+    monkeypatch.setattr(tg, 'get_settings', lambda: _S())
+    monkeypatch.setattr(tg, '_limiter', tg._FanoutLimiter(concurrency, rate_per_chat, rate_global))
+    stats = {'active': 0, 'peak': 0, 'calls': []}
+
+    async def fake_post(token, chat_id, text):
+        stats['active'] += 1
+        stats['peak'] = max(stats['peak'], stats['active'])
+        stats['calls'].append((chat_id, time.monotonic()))
+        await asyncio.sleep(delay)
+        stats['active'] -= 1
+        return chat_id not in fail
+
+    monkeypatch.setattr(tg, '_post_message', fake_post)
+    return stats
+
+
+@pytest.mark.asyncio
+async def test_fanout_is_concurrent_and_bounded(monkeypatch):
+    stats = _setup(monkeypatch, concurrency=4, delay=0.05, fail={'c3'})
+    started = time.monotonic()
+    res = await tg.send_message_results("hi", chat_ids=[f"c{i}" for i in range(8)] + ["c0"])
+    elapsed = time.monotonic() - started
+    assert len(res) == 8
+    assert res['c3'] is False and all(v for k, v in res.items() if k != 'c3')
+    assert stats['peak'] == 4
+    # 8 чатов по 50мс при конкурентности 4 ≈ 2 волны, а не 8 последовательных запросов
+    assert elapsed < 0.3
+    assert await tg.send_message("hi", chat_ids=["c3"]) is False
+
+
+@pytest.mark.asyncio
+async def test_per_chat_rate_limit_spaces_same_chat(monkeypatch):
+    stats = _setup(monkeypatch, rate_per_chat=20.0, delay=0.0)
+    await asyncio.gather(tg.send_message("a", chat_ids=["x"]), tg.send_message("b", chat_ids=["x"]), tg.send_message("c", chat_ids=["y"]))
+    times = sorted(t for cid, t in stats['calls'] if cid == 'x')
+    assert len(times) == 2 and times[1] - times[0] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_no_token_returns_empty(monkeypatch):
+    _setup(monkeypatch)
+    monkeypatch.setattr(_S, 'TELEGRAM_BOT_TOKEN', None)
+    assert await tg.send_message_results("hi", chat_ids=["c"]) == {}
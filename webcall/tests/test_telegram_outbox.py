@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.infrastructure.db.models import TelegramOutbox
+from app.infrastructure.services.telegram_dispatcher import PendingTask
+from app.infrastructure.services.telegram_outbox import TelegramOutboxStore
+
+
+@pytest.fixture
+def store(db_sessionmaker):
+    return TelegramOutboxStore(db_sessionmaker, lease_sec=30)
+
+
+async def _row(db_sessionmaker, task_id):
+    async with db_sessionmaker() as s:
+        return (await s.execute(select(TelegramOutbox).where(TelegramOutbox.id == task_id))).scalar_one()
+
+
+def test_pending_task_state_machine():
+    t = PendingTask(user_id="u", text="t", reason="r")
+    t.transition(PendingTask.SENDING)
+    t.transition(PendingTask.PENDING)
+    t.transition(PendingTask.SENDING)
+    t.transition(PendingTask.SENT)
+    with pytest.raises(ValueError):
+        t.transition(PendingTask.SENDING)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_dedupes_and_claim_is_exclusive(store, make_user):
+    uid = await make_user()
+    assert await store.enqueue(uid, "hello", "manual", "k1")
+    assert not await store.enqueue(uid, "hello", "manual", "k1")
+    assert await store.enqueue(uid, "other", "manual", "k2")
+    first = await store.claim(10)
+    assert {t.text for t in first} == {"hello", "other"}
+    assert all(t.status == PendingTask.SENDING and t.id is not None for t in first)
+    # пока lease не истёк, повторный claim ничего не получает
+    assert await store.claim(10) == []
+
+
+@pytest.mark.asyncio
+async def test_retry_schedules_backoff_and_lease_reclaims(store, make_user, db_sessionmaker):
+    uid = await make_user()
+    await store.enqueue(uid, "a", "r", "ka")
+    await store.enqueue(uid, "b", "r", "kb")
+    a, b = sorted(await store.claim(10), key=lambda t: t.text)
+    a.attempts = 1
+    await store.mark_retry(a, 60, "http 500")
+    row = await _row(db_sessionmaker, a.id)
+    assert row.status == "pending" and row.attempts == 1 and row.last_error == "http 500"
+    assert row.next_attempt_at > datetime.utcnow() + timedelta(seconds=50)
+    assert await store.claim(10) == []  # ретрай ещё не наступил, b под lease
+    # воркер с b "упал": lease истёк — строку забирает другой
+    async with db_sessionmaker() as s:
+        async with s.begin():
+            await s.execute(update(TelegramOutbox).where(TelegramOutbox.id == b.id).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+    again = await store.claim(10)
+    assert [t.id for t in again] == [b.id]
+    await store.mark_sent(again[0])
+    assert (await _row(db_sessionmaker, b.id)).status == "sent"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_hits_unique_index(store, make_user, db_sessionmaker):
+    uid = await make_user()
+    assert await store.enqueue(uid, "hello", "manual", "k1")
+    # другой воркер уже прошёл проверку и вставил ту же задачу: SELECT её не видит (created_at вне TTL),
+    # но вставка упирается в уникальный (dedupe_key, dedupe_bucket)
+    async with db_sessionmaker() as s:
+        async with s.begin():
+            await s.execute(update(TelegramOutbox).values(created_at=datetime.utcnow() - timedelta(hours=2)))
+    assert not await store.enqueue(uid, "hello", "manual", "k1")
+    assert len(await store.claim(10)) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_worker_cannot_overwrite_reclaimed_row(store, make_user, db_sessionmaker):
+    uid = await make_user()
+    await store.enqueue(uid, "a", "r", "ka")
+    (stale,) = await store.claim(10)
+    async with db_sessionmaker() as s:
+        async with s.begin():
+            await s.execute(update(TelegramOutbox).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+    (owner,) = await store.claim(10)
+    assert owner.id == stale.id and owner.lease_until != stale.lease_until
+    assert not await store.mark_sent(stale)  # lease потерян — итог не пишется
+    row = await _row(db_sessionmaker, owner.id)
+    assert row.status == "sending" and row.locked_until == owner.lease_until
+    assert await store.mark_retry(owner, 5, "http 429")
+    assert (await _row(db_sessionmaker, owner.id)).status == "pending"
+
+
+@pytest.mark.asyncio
+async def test_purge_removes_finished_rows_older_than_ttl(store, make_user, db_sessionmaker):
+    uid = await make_user()
+    for key in ("sent-old", "failed-old", "sent-new", "pending-old"):
+        await store.enqueue(uid, key, "r", key)
+    tasks = {t.text: t for t in await store.claim(10)}
+    await store.mark_sent(tasks["sent-old"])
+    await store.mark_failed(tasks["failed-old"], "no chat")
+    await store.mark_sent(tasks["sent-new"])
+    await store.mark_retry(tasks["pending-old"], 0)
+    old = datetime.utcnow() - timedelta(seconds=store.dedupe_ttl_sec + 60)
+    async with db_sessionmaker() as s:
+        async with s.begin():
+            await s.execute(update(TelegramOutbox).where(TelegramOutbox.text != "sent-new").values(updated_at=old))
+    assert await store.purge() == 2
+    async with db_sessionmaker() as s:
+        left = set((await s.execute(select(TelegramOutbox.text))).scalars().all())
+    assert left == {"sent-new", "pending-old"}
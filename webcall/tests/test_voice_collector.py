@@ -0,0 +1,58 @@
+import pytest
+
+from app.infrastructure.services import voice_transcript as vt_mod
+from app.infrastructure.services.voice_transcript import VoiceTranscriptCollector
+
+
+class _Clock:
+    def __init__(self, ms: int) -> None:
+        self.ms = ms
+
+    def time(self) -> float:
+        return self.ms / 1000
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock(1_000_000)
+    monkeypatch.setattr(vt_mod.time, 'time', c.time)
+    return c
+
+
+@pytest.mark.asyncio
+async def test_get_many_returns_only_live_keys(clock):
+    coll = VoiceTranscriptCollector(spool=False)
+    await coll.store_transcript("r:a", "hello from a")
+    await coll.store_transcript("r:b", "hello from b")
+    found = await coll.get_many(["r:a", "r:b", "r:missing"])
+    assert set(found) == {"r:a", "r:b"}
+    assert found["r:a"].segment.text == "hello from a"
+    clock.ms += coll._transcript_ttl_ms + 1
+    assert await coll.get_many(["r:a", "r:b"]) == {}
+    assert await coll.get_transcript("r:a") is None
+
+
+@pytest.mark.asyncio
+async def test_purge_pops_only_due_entries(clock):
+    coll = VoiceTranscriptCollector(spool=False)
+    await coll.add_chunk("r:a", b"x")
+    await coll.store_transcript("r:b", "old")
+    clock.ms += 1000
+    await coll.store_transcript("r:b", "new")  # перезапись: старая запись кучи устаревает
+    clock.ms += coll._transcript_ttl_ms - 500
+    # чанки r:a и первая запись r:b просрочены, но сам r:b ещё жив
+    assert coll.purge() == 1
+    assert (await coll.get_transcript("r:b")).text == "new"
+    assert await coll.get_and_clear_chunks("r:a") == []
+    clock.ms += 1000
+    assert coll.purge() == 1
+    assert coll._keys == {} and coll._expiry == []
+
+
+@pytest.mark.asyncio
+async def test_pop_removes_key_state(clock):
+    coll = VoiceTranscriptCollector(spool=False)
+    await coll.store_transcript("r:a", "text")
+    assert (await coll.pop_transcript("r:a")).text == "text"
+    assert await coll.pop_transcript("r:a") is None
+    assert "r:a" not in coll._keys
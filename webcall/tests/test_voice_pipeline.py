@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.infrastructure.services.voice_pipeline import StreamingTranscriber, WebmSegmenter
+
+CLUSTER = b'\x1f\x43\xb6\x75'
+
+
+def _el(eid: bytes, payload: bytes) -> bytes:
+    return eid + bytes([0x80 | len(payload)]) + payload
+
+
+# EBML header + Segment (unknown size, как у MediaRecorder) + Tracks
+HEADER = _el(b'\x1a\x45\xdf\xa3', b'\x42\x82\x84webm') + b'\x18\x53\x80\x67\xff' + _el(b'\x16\x54\xae\x6b', b'trk')
+
+
+def _cluster(n: int, payload: bytes = b'') -> bytes:
+    # Cluster unknown size: Timecode + SimpleBlock, полезная нагрузка оканчивается меткой cN
+    return CLUSTER + b'\xff' + _el(b'\xe7', bytes([n])) + _el(b'\xa3', payload + f"c{n}".encode())
+
+
+def test_segmenter_reprefixes_header_and_cuts_on_cluster():
+    seg = WebmSegmenter(segment_ms=1000)
+    assert seg.feed(HEADER + _cluster(0), now_ms=0) is None
+    assert seg.feed(_cluster(1), now_ms=500) is None
+    out = seg.feed(_cluster(2), now_ms=1200)
+    # кластер 2 может дописываться — уходит в следующий сегмент
+    assert out == HEADER + _cluster(0) + _cluster(1)
+    assert seg.flush() == HEADER + _cluster(2)
+    assert seg.flush() is None
+
+
+def test_segmenter_ignores_cluster_id_inside_block_payload():
+    seg = WebmSegmenter(segment_ms=1000)
+    assert seg.feed(HEADER + _cluster(0), now_ms=0) is None
+    # байты Cluster ID внутри SimpleBlock — не граница
+    tricky = _cluster(1, payload=CLUSTER + b'\x81\xe7\x81\x00')
+    out = seg.feed(tricky, now_ms=1200)
+    assert out == HEADER + _cluster(0)
+    assert seg.flush() == HEADER + tricky
+
+
+def test_segmenter_requires_timecode_after_cluster():
+    seg = WebmSegmenter(segment_ms=1000)
+    assert seg.feed(HEADER + _cluster(0), now_ms=0) is None
+    # Cluster без Timecode — структура не разбирается, дальше не режем
+    assert seg.feed(CLUSTER + b'\xff' + _el(b'\xa3', b'x'), now_ms=1200) is None
+    assert seg.feed(_cluster(2), now_ms=2500) is None
+
+
+def test_segmenter_without_header_does_not_cut():
+    seg = WebmSegmenter(segment_ms=1000)
+    assert seg.feed(b'raw-1', now_ms=0) is None
+    assert seg.feed(b'raw-2', now_ms=5000) is None
+    assert seg.flush() == b'raw-1raw-2'
+
+
+@pytest.mark.asyncio
+async def test_partials_in_order_under_concurrency_cap():
+    active = 0
+    peak = 0
+    delays = {b'c0': 0.05, b'c1': 0.0, b'c2': 0.01}
+
+    async def fake_transcribe(key, chunks):
+        nonlocal active, peak
+        data = chunks[0].data
+        assert data.startswith(HEADER)
+        body = data[-2:]
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(delays[body[:2]])
+        active -= 1
+        return f"part {body.decode()}"
+
+    got = []
+    st = StreamingTranscriber('room:u1', on_partial=got.append, max_concurrency=2, segment_ms=1000, transcribe=fake_transcribe)
+    st.feed(HEADER + _cluster(0), now_ms=0)
+    st.feed(_cluster(1), now_ms=1500)   # сегмент c0
+    st.feed(_cluster(2), now_ms=3000)   # сегмент c1
+    await asyncio.sleep(0.02)
+    assert got == []  # c1 готов раньше, но ждёт c0
+    text = await st.finish()            # хвост c2
+    assert got == ['part c0', 'part c1', 'part c2']
+    assert text == 'part c0 part c1 part c2'
+    assert peak <= 2 and st.segments == 3 and st.partials == 3
+
+
+@pytest.mark.asyncio
+async def test_placeholder_returned_when_nothing_recognised():
+    async def failing(key, chunks):
+        return "(asr failed http 400)"
+
+    got = []
+    st = StreamingTranscriber('k', on_partial=got.append, transcribe=failing)
+    st.feed(HEADER + _cluster(0), now_ms=0)
+    assert await st.finish() == "(asr failed http 400)"
+    assert got == []
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_inflight_and_queued_segments():
+    started = []
+    finished = []
+
+    async def slow_transcribe(key, chunks):
+        started.append(key)
+        await asyncio.sleep(10)
+        finished.append(key)
+        return "never"
+
+    st = StreamingTranscriber('room:u1', max_concurrency=1, segment_ms=1000, transcribe=slow_transcribe)
+    st.feed(HEADER + _cluster(0), now_ms=0)
+    st.feed(_cluster(1), now_ms=1500)
+    st.feed(_cluster(2), now_ms=3000)
+    await asyncio.sleep(0.01)
+    assert len(started) == 1  # второй сегмент ждёт семафор
+    await st.cancel()
+    await asyncio.sleep(0.01)
+    assert len(started) == 1 and finished == [] and st.partials == 0
@@ -0,0 +1,70 @@
+import pytest
+
+from app.infrastructure.services import asr as asr_mod
+from app.infrastructure.services import voice_transcript as vt_mod
+from app.infrastructure.services.voice_transcript import VoiceSpool, VoiceTranscriptCollector
+
+
+@pytest.mark.asyncio
+async def test_chunks_go_to_spool_not_memory(tmp_path):
+    coll = VoiceTranscriptCollector(spool=True, spool_dir=str(tmp_path))
+    for i in range(20):
+        await coll.add_chunk("room:u1", bytes([i]) * 1000)
+    stats = coll.spool_stats()
+    assert stats == {'spools': 1, 'spool_bytes': 20000, 'memory_chunk_bytes': 0}
+    audio = await coll.take_audio("room:u1")
+    assert isinstance(audio, VoiceSpool)
+    assert audio.chunks == 20 and audio.size == 20000
+    fh = audio.open_for_upload()
+    head = fh.read(1000)
+    assert head == b"\x00" * 1000
+    audio.close()
+    assert await coll.take_audio("room:u1") is None
+
+
+@pytest.mark.asyncio
+async def test_legacy_get_and_clear_chunks_reads_spool(tmp_path):
+    coll = VoiceTranscriptCollector(spool=True, spool_dir=str(tmp_path))
+    await coll.add_chunk("k", b"abc")
+    await coll.add_chunk("k", b"def")
+    chunks = await coll.get_and_clear_chunks("k")
+    assert [c.data for c in chunks] == [b"abcdef"]
+    mem = VoiceTranscriptCollector(spool=False)
+    await mem.add_chunk("k", b"abc")
+    assert [c.data for c in await mem.get_and_clear_chunks("k")] == [b"abc"]
+
+
+@pytest.mark.asyncio
+async def test_transcribe_uploads_spool_as_file(tmp_path, monkeypatch):
+    settings = vt_mod.get_settings()
+    monkeypatch.setattr(settings, 'OPENAI_API_KEY', 'test-key', raising=False)
+    seen = {}
+
+    class _Resp:
+        status_code = 200
+        text = " hello "
+
+    class _Client:
+        def __init__(self, *a, **kw):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def post(self, url, data=None, files=None, headers=None):
+            _name, payload, _ctype = files['file']
+            seen['is_file'] = hasattr(payload, 'read')
+            seen['body'] = payload.read()
+            return _Resp()
+
+    monkeypatch.setattr(asr_mod.httpx, 'AsyncClient', _Client)
+    monkeypatch.setattr(vt_mod, 'get_asr_pool', lambda: asr_mod.AsrWorkerPool(asr_mod.OpenAIAsrEngine()))
+    spool = VoiceSpool(0, str(tmp_path))
+    spool.append(b"webm-1")
+    spool.append(b"webm-2")
+    assert await vt_mod.transcribe_chunks("k", spool) == "hello"
+    assert seen == {'is_file': True, 'body': b"webm-1webm-2"}
+    assert spool._fh is None  # пул закрыл spool после загрузки
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from app.infrastructure.services.voice_transcripts_redis import EVENTS_CHANNEL, RedisVoiceTranscriptCollector
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def get(self, key):
+        self.ops.append(('get', key))
+
+    def delete(self, key):
+        self.ops.append(('delete', key))
+
+    async def execute(self):
+        out = []
+        for op, key in self.ops:
+            if op == 'get':
+                out.append(self.redis.data.get(key))
+            else:
+                out.append(1 if self.redis.data.pop(key, None) is not None else 0)
+        return out
+
+
+class _FakeRedis:
+    """Общее "хранилище" для двух узлов + журнал publish."""
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+        self.mget_calls = 0
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def mget(self, keys):
+        self.mget_calls += 1
+        return [self.data.get(k) for k in keys]
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+
+@pytest.mark.asyncio
+async def test_transcript_visible_across_nodes():
+    redis = _FakeRedis()
+    capture_node = RedisVoiceTranscriptCollector(redis, spool=False)
+    summary_node = RedisVoiceTranscriptCollector(redis, spool=False)
+    await capture_node.store_transcript("room:u1", "[meta captureTs=5] hello world")
+    found = await summary_node.get_many(["room:u1", "room:u2"])
+    assert list(found) == ["room:u1"]
+    assert found["room:u1"].segment.text == "hello world"
+    # повторное чтение — из локального LRU, без похода в Redis
+    calls = redis.mget_calls
+    assert (await summary_node.get_transcript("room:u1")).text.endswith("hello world")
+    assert redis.mget_calls == calls
+    channel, payload = redis.published[-1]
+    assert channel == EVENTS_CHANNEL and json.loads(payload)["op"] == "store"
+
+
+@pytest.mark.asyncio
+async def test_pop_event_invalidates_other_node_lru():
+    redis = _FakeRedis()
+    a = RedisVoiceTranscriptCollector(redis, spool=False)
+    b = RedisVoiceTranscriptCollector(redis, spool=False)
+    await a.store_transcript("room:u1", "text")
+    b._handle_event(redis.published[-1][1])  # b получил уведомление и прогрел LRU
+    assert "room:u1" in b._lru
+    popped = await a.pop_transcript("room:u1")
+    assert popped is not None and popped.text == "text"
+    b._handle_event(redis.published[-1][1])
+    assert "room:u1" not in b._lru
+    assert await b.get_transcript("room:u1") is None
+    # собственные события узел игнорирует
+    a._handle_event(json.dumps({"op": "store", "key": "x", "text": "t", "node": a._node_id}))
+    assert "x" not in a._lru